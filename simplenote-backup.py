@@ -1,7 +1,20 @@
 #!/usr/bin/env python3
-import os, sys, json, re
+import os, sys, json, re, shutil, io, time, tarfile, zipfile
 from simperium.core import Api as SimperiumApi
-from simplenote_metadata import build_content_with_id
+from simplenote_metadata import build_file_content
+from simplenote_remote import iter_index_pages, with_retry, api_options
+from simplenote_state import get_state_path
+from simplenote_names import NameAllocator, unique_path, release_path, reset_names
+from simplenote_manifest import NoteManifest, build_entry
+
+# 中断されたバックアップの進捗（1行1レコードのJSON: {"id": ...} / {"mark": ...}）
+PROGRESS_STATE = 'backup-progress.jsonl'
+
+# 出力先がこの拡張子ならディレクトリではなく1つのアーカイブに書き込む
+ARCHIVE_MODES = (('.tar.gz', 'w|gz'), ('.tgz', 'w|gz'), ('.tar.xz', 'w|xz'), ('.txz', 'w|xz'), ('.zip', None))
+
+# zipに記録できる最も古い日時
+ZIP_MIN_DATE = (1980, 1, 1, 0, 0, 0)
 
 
 def load_env(env_path=None):
@@ -37,16 +50,199 @@ def extract_filename(content, note_id):
 
 
 def get_unique_filepath(dir_path, base_name, ext):
-    """重複時に連番を付与してユニークなパスを返す"""
-    path = os.path.join(dir_path, base_name + ext)
-    if not os.path.exists(path):
-        return path
-    counter = 1
-    while True:
-        path = os.path.join(dir_path, f"{base_name}_{counter}{ext}")
-        if not os.path.exists(path):
+    """重複時に連番を付与してユニークなパスを返す（ディレクトリ一覧をキャッシュ）"""
+    return unique_path(dir_path, base_name, ext)
+
+def load_progress(progress_path):
+    """中断時の進捗を読み込む -> (次ページのmark, 書き込み済みIDのセット)"""
+    mark = None
+    written = set()
+    if not os.path.exists(progress_path):
+        return mark, written
+    with open(progress_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 書き込み途中で中断された行
+            if 'id' in record:
+                written.add(record['id'])
+            elif 'mark' in record:
+                mark = record['mark']
+    return mark, written
+
+def note_dir(backup_dir, note):
+    """ノートの保存先ディレクトリ（_trash / 単一タグのサブディレクトリ）"""
+    dir_path = backup_dir
+    #if the note was trashed, put it into a '_trash' subdirectory
+    if note['d']['deleted']== True:
+        dir_path = os.path.join(dir_path, '_trash')
+
+    #if the note has a single tag, put it into a subdirectory named as the tag
+    if len(note['d']['tags'])==1:
+        dir_path = os.path.join(dir_path, note['d']['tags'][0])
+    return dir_path
+
+
+def serialize_note(note):
+    """ノートをファイル内容（IDコメント + 本文 + Tags/System tags行）に変換"""
+    # Prepend ID comment for reliable sync; record pinned notes and whatever else
+    return build_file_content(note['id'], note['d']['content'],
+                              note['d']['tags'], note['d']['systemTags'])
+
+
+def write_note(path, note, text):
+    with open(path, "w", encoding='utf-8') as f:
+        f.write(text)
+    os.utime(path,(note['d']['modificationDate'],note['d']['modificationDate']))
+
+
+class IncrementalBackup:
+    """既存のバックアップと比較し、変更されたノートだけを書き換える
+
+    ローカルファイルはマニフェストでIDごとに索引化し、解析結果（ID・タグ・
+    コンテンツハッシュ）が一致するノートは書き込まない。タグ変更・削除で
+    ディレクトリだけが変わったノートは移動する。リモートに存在しないIDの
+    ファイルと同じIDの重複ファイルは最後にまとめて削除する。
+    IDのないファイル（ローカルで作成された未プッシュのノート）には触れない。
+    """
+
+    def __init__(self, backup_dir):
+        self.backup_dir = backup_dir
+        self.manifest = NoteManifest(backup_dir)
+        self.by_id = {}
+        for path in self.manifest.scan():
+            note_id = self.manifest.lookup(path)['note_id']
+            if note_id:
+                self.by_id.setdefault(note_id, []).append(path)
+        self.stale = []
+        self.stats = {'created': 0, 'updated': 0, 'moved': 0, 'unchanged': 0, 'removed': 0}
+
+    def place(self, note, dir_path, text):
+        paths = self.by_id.pop(note['id'], [])
+        target = os.path.normpath(dir_path)
+        keep = next((p for p in paths if os.path.dirname(p) == target), paths[0] if paths else None)
+        self.stale.extend(p for p in paths if p != keep)
+
+        if keep is None:
+            filename = extract_filename(note['d']['content'], note['id'])
+            path = get_unique_filepath(dir_path, filename, '.md')
+            write_note(path, note, text)
+            self.manifest.record(path, text)
+            self.stats['created'] += 1
             return path
-        counter += 1
+
+        moved = False
+        if os.path.dirname(keep) != target:
+            base_name = os.path.splitext(os.path.basename(keep))[0]
+            new_path = get_unique_filepath(dir_path, base_name, '.md')
+            shutil.move(keep, new_path)
+            release_path(keep)
+            self.manifest.move(keep, new_path)
+            keep = new_path
+            moved = True
+
+        current = self.manifest.lookup(keep)
+        fresh = build_entry(text)
+        if any(current[k] != fresh[k] for k in ('note_id', 'tags', 'system_tags', 'content_hash')):
+            write_note(keep, note, text)
+            self.manifest.record(keep, text)
+            self.stats['updated'] += 1
+        elif moved:
+            self.stats['moved'] += 1
+        else:
+            self.stats['unchanged'] += 1
+        return keep
+
+    def finish(self, seen_ids):
+        """リモートにないIDのファイルと重複ファイルを一括削除"""
+        for note_id, paths in self.by_id.items():
+            if note_id not in seen_ids:
+                self.stale.extend(paths)
+        dirs = set()
+        for path in self.stale:
+            os.remove(path)
+            release_path(path)
+            self.manifest.forget(path)
+            dirs.add(os.path.dirname(path))
+            self.stats['removed'] += 1
+        # 空になったタグディレクトリを削除
+        for dir_path in sorted(dirs, reverse=True):
+            if os.path.normpath(dir_path) in (os.path.normpath(self.backup_dir),
+                                              os.path.join(os.path.normpath(self.backup_dir), '_trash')):
+                continue
+            if not os.listdir(dir_path):
+                os.rmdir(dir_path)
+        self.manifest.save()
+
+
+def archive_mode(path):
+    """アーカイブ出力先なら (True, tarfileのモード or None=zip)、それ以外は (False, None)"""
+    for ext, mode in ARCHIVE_MODES:
+        if path.lower().endswith(ext):
+            return True, mode
+    return False, None
+
+
+class ArchiveBackup:
+    """ノートを1つのアーカイブ（.tar.gz / .tar.xz / .zip）にストリーム書き込みする
+
+    ページが届くたびにエントリを追記する。ディレクトリ構成（タグ / _trash）と
+    ファイル名は通常のバックアップと同じ。書き込み中は `<archive>.part` に出力し、
+    完了時にリネームするので、中断しても前回のアーカイブは壊れない。
+    """
+
+    def __init__(self, archive_path, tar_mode):
+        self.archive_path = archive_path
+        self.part_path = archive_path + '.part'
+        self.names = NameAllocator(scan=False)
+        self.dirs = set()
+        if tar_mode is None:
+            self.zip = zipfile.ZipFile(self.part_path, 'w', zipfile.ZIP_DEFLATED)
+            self.tar = None
+        else:
+            self.zip = None
+            self.tar = tarfile.open(self.part_path, tar_mode)
+
+    def _add_dirs(self, dir_path, mtime):
+        parts = []
+        for part in dir_path.split(os.sep) if dir_path else []:
+            parts.append(part)
+            name = '/'.join(parts)
+            if name not in self.dirs:
+                self.dirs.add(name)
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                info.mtime = mtime
+                self.tar.addfile(info)
+
+    def add(self, note, dir_path, text):
+        filename = extract_filename(note['d']['content'], note['id'])
+        path = self.names.allocate(dir_path, filename, '.md')
+        name = path.replace(os.sep, '/')
+        data = text.encode('utf-8')
+        mtime = int(note['d']['modificationDate'])
+        if self.zip is not None:
+            # zipのタイムスタンプは1980年以降のみ（ローカル時刻で比べる: UTCより西では
+            # 1980-01-01 00:00 UTC もまだ1979年になる）
+            info = zipfile.ZipInfo(name, date_time=max(time.localtime(mtime)[:6], ZIP_MIN_DATE))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            self.zip.writestr(info, data)
+        else:
+            self._add_dirs(dir_path, mtime)
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = 0o644
+            info.mtime = mtime
+            self.tar.addfile(info, io.BytesIO(data))
+        return path
+
+    def close(self):
+        (self.zip or self.tar).close()
+        os.replace(self.part_path, self.archive_path)
+
 
 load_env()
 
@@ -55,53 +251,97 @@ token = os.environ.get('TOKEN')
 if not token:
     print("Error: TOKEN not found. Set TOKEN in .env file or environment variable.")
     sys.exit(1)
-backup_dir = sys.argv[1] if len(sys.argv) > 1 else (os.path.join(os.environ['HOME'], "Dropbox/SimplenoteBackups"))
+restart = '--restart' in sys.argv  # discard an interrupted backup's progress
+incremental = '--incremental' in sys.argv  # only rewrite notes that changed
+args = [a for a in sys.argv[1:] if a not in ('--restart', '--incremental')]
+backup_dir = args[0] if args else (os.path.join(os.environ['HOME'], "Dropbox/SimplenoteBackups"))
+to_archive, tar_mode = archive_mode(backup_dir)
+if to_archive and incremental:
+    print("Error: --incremental cannot be used with an archive target.")
+    sys.exit(1)
 print("Starting backup your simplenote to: %s" % backup_dir)
-if not os.path.exists(backup_dir):
+if to_archive:
+    archive_parent = os.path.dirname(os.path.abspath(backup_dir))
+    if not os.path.exists(archive_parent):
+        os.makedirs(archive_parent)
+elif not os.path.exists(backup_dir):
     print("Creating directory: %s" % backup_dir)
     os.makedirs(backup_dir)
 
-api = SimperiumApi(appname, token)
+api = with_retry(SimperiumApi(appname, token, **api_options()))
 #print token
 
-dump = api.note.index(data=True)
-index = dump['index']
-# the dump might be paged; go through all the pages
-while 'mark' in dump:
-    dump = api.note.index(data=True, mark=dump['mark'])
-    index = index + dump['index']
+if to_archive:
+    # an archive is rewritten from scratch on every run (no resume)
+    archive_backup = ArchiveBackup(backup_dir, tar_mode)
+    mark, written = None, set()
+    progress = None
+else:
+    archive_backup = None
+    # resume an interrupted backup from the last completed page
+    progress_path = get_state_path(backup_dir, PROGRESS_STATE)
+    if restart and os.path.exists(progress_path):
+        os.remove(progress_path)
+    mark, written = load_progress(progress_path)
+    if mark or written:
+        print("Resuming interrupted backup: %d notes already written" % len(written))
+    progress = open(progress_path, 'a', encoding='utf-8')
+
+reset_names()
+incremental_backup = IncrementalBackup(backup_dir) if incremental else None
 
+# the index is paged; write each page while the next one is downloading
+count = 0
 trashed = 0
-for note in index:
-    dir_path = backup_dir
-    #if the note was trashed, put it into a '_trash' subdirectory
-    if note['d']['deleted']== True:
-        dir_path = os.path.join(dir_path, '_trash')
-        trashed = trashed + 1
+for dump in iter_index_pages(api, mark=mark, data=True):
+    for note in dump['index']:
+        if note['id'] in written:
+            continue
+        if note['d']['deleted']== True:
+            trashed = trashed + 1
 
-    #if the note has a single tag, put it into a subdirectory named as the tag
-    if len(note['d']['tags'])==1:
-        dir_path = os.path.join(dir_path, note['d']['tags'][0])
+        text = serialize_note(note)
+        if archive_backup:
+            # paths inside the archive are relative to its root
+            archive_backup.add(note, note_dir('', note), text)
+            count = count + 1
+            continue
 
-    try:
-        os.makedirs(dir_path)
-    except OSError as e:
-        if e.errno == 17:
-            # the subdir already exists
-            pass
+        dir_path = note_dir(backup_dir, note)
+        try:
+            os.makedirs(dir_path)
+        except OSError as e:
+            if e.errno == 17:
+                # the subdir already exists
+                pass
 
-    filename = extract_filename(note['d']['content'], note['id'])
-    path = get_unique_filepath(dir_path, filename, '.md')
-    #print path
-    with open(path, "w", encoding='utf-8') as f:
-        # Prepend ID comment for reliable sync
-        content_with_id = build_content_with_id(note['id'], note['d']['content'])
-        f.write(content_with_id)
-        f.write("\n")
-        f.write("Tags: %s\n" % ", ".join(note['d']['tags']))
-        # record pinned notes and whatever else
-        if len(note['d']['systemTags'])>0:
-            f.write("System tags: %s\n" % ", ".join(note['d']['systemTags']))
-    os.utime(path,(note['d']['modificationDate'],note['d']['modificationDate']))
+        if incremental_backup:
+            incremental_backup.place(note, dir_path, text)
+        else:
+            filename = extract_filename(note['d']['content'], note['id'])
+            path = get_unique_filepath(dir_path, filename, '.md')
+            #print path
+            write_note(path, note, text)
+        count = count + 1
+        written.add(note['id'])
+        progress.write(json.dumps({'id': note['id']}) + "\n")
+        progress.flush()
+
+    # checkpoint: the page is complete, continue from the next one
+    if progress and 'mark' in dump:
+        progress.write(json.dumps({'mark': dump['mark']}) + "\n")
+        progress.flush()
+
+if incremental_backup:
+    incremental_backup.finish(written)
+
+if archive_backup:
+    archive_backup.close()
+else:
+    progress.close()
+    os.remove(progress_path)
 
-print("Done: %d files (%d in _trash)." % (len(index), trashed))
+print("Done: %d files (%d in _trash)." % (count, trashed))
+if incremental_backup:
+    print("Incremental: %(created)d created, %(updated)d updated, %(moved)d moved, "
+          "%(unchanged)d unchanged, %(removed)d stale removed." % incremental_backup.stats)
@@ -8,11 +8,18 @@ import sys
 import re
 import json
 import shutil
+import sqlite3
 from simplenote_metadata import (
     extract_id_from_content,
     get_content_without_id,
     build_content_with_id
 )
+from simplenote_manifest import NoteManifest
+from simplenote_matcher import KeywordMatcher
+from simplenote_model import TagModel, tag_fingerprint, MIN_CONFIDENCE, np
+from simplenote_names import unique_path, release_path, reset_names
+from simplenote_scan import map_files
+from simplenote_search import SearchIndex, index_exists
 
 
 def get_default_backup_dir():
@@ -87,7 +94,7 @@ def get_existing_tags(backup_dir):
     tags = []
     for item in os.listdir(backup_dir):
         item_path = os.path.join(backup_dir, item)
-        if os.path.isdir(item_path) and item != '_trash':
+        if os.path.isdir(item_path) and item != '_trash' and not item.startswith('.'):
             tags.append(item)
     return sorted(tags)
 
@@ -139,21 +146,17 @@ AUTO_CLASSIFY_RULES = {
 }
 
 
+# All rules compiled into one automaton: a single pass over the text per note
+AUTO_CLASSIFY_MATCHER = KeywordMatcher(AUTO_CLASSIFY_RULES)
+
+
 def auto_classify_note(content, filename, existing_tags):
     """Automatically classify a note based on content and filename keywords"""
     text = (content + ' ' + filename).lower()
 
-    # Count matches for each tag
-    scores = {}
-    for tag, keywords in AUTO_CLASSIFY_RULES.items():
-        if tag not in existing_tags:
-            continue  # Only use existing tags
-        score = 0
-        for keyword in keywords:
-            if keyword.lower() in text:
-                score += 1
-        if score > 0:
-            scores[tag] = score
+    # Count matches for each tag (only use existing tags)
+    scores = {tag: score for tag, score in AUTO_CLASSIFY_MATCHER.scores(text).items()
+              if tag in existing_tags}
 
     if not scores:
         return None
@@ -163,139 +166,217 @@ def auto_classify_note(content, filename, existing_tags):
     return best_tag
 
 
-def auto_classify_all(backup_dir, dry_run=False):
-    """Auto-classify all untagged files in root directory"""
+def train_model(backup_dir, manifest=None):
+    """Train the tag model on the notes filed in tag directories
+
+    Only tag directories whose files changed since the last training are
+    re-read. Returns (model, retrained_tags).
+    """
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = NoteManifest(backup_dir)
+
     existing_tags = get_existing_tags(backup_dir)
-    unclassified = list_unclassified(backup_dir)
+    tag_files = {tag: [] for tag in existing_tags}
+    root = os.path.normpath(backup_dir)
+    for path in manifest.scan():
+        tag = os.path.basename(os.path.dirname(path))
+        if tag in tag_files and os.path.dirname(os.path.dirname(path)) == root:
+            tag_files[tag].append(path)
+
+    model = TagModel.load(backup_dir)
+    retrained = []
+    for tag in [t for t in model.tags if t not in tag_files]:
+        model.remove_tag(tag)
+        retrained.append(tag)
+    for tag, paths in tag_files.items():
+        fingerprint = tag_fingerprint([[os.path.relpath(p, backup_dir), meta['content_hash']]
+                                       for p, meta in manifest.lookup_many(paths)])
+        if model.fingerprints.get(tag) != fingerprint:
+            model.set_tag(tag, [note['content'] for _, note in map_files(parse_note_file, paths)],
+                          fingerprint)
+            retrained.append(tag)
+
+    if retrained:
+        model.save(backup_dir)
+    if own_manifest:
+        manifest.save()
+
+    return model, retrained
+
+
+def auto_classify_all(backup_dir, dry_run=False, manifest=None, use_model=False):
+    """Auto-classify all untagged files in root directory
+
+    With use_model=True the trained tag model (updated first) is used
+    instead of the keyword rules.
+    """
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = NoteManifest(backup_dir)
 
-    classified = 0
-    skipped = 0
+    existing_tags = get_existing_tags(backup_dir)
+    unclassified = [n for n in list_unclassified(backup_dir, manifest) if n['needs_tag']]
 
-    for note in unclassified:
-        if not note['needs_tag']:
-            continue
+    if use_model:
+        model, _ = train_model(backup_dir, manifest)
+        predictions = model.predict([n['content'] for n in unclassified], set(existing_tags))
+    else:
+        predictions = [(auto_classify_note(n['content'], n['filename'], existing_tags), None)
+                       for n in unclassified]
 
-        suggested_tag = auto_classify_note(note['content'], note['filename'], existing_tags)
+    classified = 0
+    skipped = 0
 
-        if suggested_tag:
+    for note, (suggested_tag, probability) in zip(unclassified, predictions):
+        if probability is not None and probability < MIN_CONFIDENCE:
+            print(f"[SKIP] {note['filename']} - low confidence ({suggested_tag} {probability:.0%})")
+            skipped += 1
+        elif suggested_tag:
             if dry_run:
                 print(f"[DRY RUN] {note['filename']} -> {suggested_tag}")
             else:
-                apply_tag(backup_dir, note['filename'], suggested_tag)
+                apply_tag(backup_dir, note['filename'], suggested_tag, manifest)
             classified += 1
         else:
             print(f"[SKIP] {note['filename']} - no matching keywords")
             skipped += 1
 
+    if own_manifest:
+        manifest.save()
+
     return classified, skipped
 
 
-def list_unclassified(backup_dir):
-    """List files that need classification (no tags or ID-named)"""
-    unclassified = []
+def list_unclassified(backup_dir, manifest=None):
+    """List files that need classification (no tags or ID-named)
 
-    for filename in os.listdir(backup_dir):
-        if not filename.endswith('.md'):
-            continue
-        filepath = os.path.join(backup_dir, filename)
-        if os.path.isdir(filepath):
-            continue
+    Tags come from the shared manifest; only the listed files are read.
+    Files are stat'ed and read in parallel and listed in filename order.
+    """
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = NoteManifest(backup_dir)
+
+    candidates = []
 
-        note = parse_note_file(filepath)
+    root_paths = [os.path.join(backup_dir, f) for f in manifest.root_files()]
+    for filepath, meta in manifest.lookup_many(root_paths):
+        filename = os.path.basename(filepath)
 
         # Check if needs classification
-        needs_tag = len(note['tags']) == 0
+        needs_tag = len(meta['tags']) == 0
         # Check if filename is a hash (32 hex chars)
         basename = os.path.splitext(filename)[0]
         is_hash_name = bool(re.match(r'^[0-9a-f]{32}$', basename))
 
         if needs_tag or is_hash_name:
-            unclassified.append({
-                'filename': filename,
-                'filepath': filepath,
-                'content': note['content'],
-                'tags': note['tags'],
-                'needs_tag': needs_tag,
-                'needs_rename': is_hash_name,
-                'has_existing_tag': False
-            })
+            candidates.append((filepath, needs_tag, is_hash_name))
+
+    notes = dict(map_files(parse_note_file, [c[0] for c in candidates]))
+    unclassified = []
+    for filepath, needs_tag, is_hash_name in candidates:
+        note = notes[filepath]
+        unclassified.append({
+            'filename': os.path.basename(filepath),
+            'filepath': filepath,
+            'content': note['content'],
+            'tags': note['tags'],
+            'needs_tag': needs_tag,
+            'needs_rename': is_hash_name,
+            'has_existing_tag': False
+        })
+
+    if own_manifest:
+        manifest.save()
 
     return unclassified
 
 
-def list_all_root_files(backup_dir):
-    """List ALL .md files in root directory (including tagged ones not yet moved)"""
-    files = []
+def list_all_root_files(backup_dir, include_content=True, manifest=None):
+    """List ALL .md files in root directory (including tagged ones not yet moved)
 
-    for filename in os.listdir(backup_dir):
-        if not filename.endswith('.md'):
-            continue
-        filepath = os.path.join(backup_dir, filename)
-        if os.path.isdir(filepath):
-            continue
+    With include_content=False only the cached manifest metadata is used and
+    'content' is left empty (enough for status counts).
+    """
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = NoteManifest(backup_dir)
+
+    files = []
 
-        note = parse_note_file(filepath)
+    root_paths = [os.path.join(backup_dir, f) for f in manifest.root_files()]
+    notes = dict(map_files(parse_note_file, root_paths)) if include_content else {}
+    for filepath, meta in manifest.lookup_many(root_paths):
+        filename = os.path.basename(filepath)
+        content = notes[filepath]['content'] if include_content else ''
 
         # Check various states
-        needs_tag = len(note['tags']) == 0
+        needs_tag = len(meta['tags']) == 0
         basename = os.path.splitext(filename)[0]
         is_hash_name = bool(re.match(r'^[0-9a-f]{32}$', basename))
-        has_existing_tag = len(note['tags']) > 0
+        has_existing_tag = len(meta['tags']) > 0
 
         files.append({
             'filename': filename,
             'filepath': filepath,
-            'content': note['content'],
-            'tags': note['tags'],
+            'content': content,
+            'tags': meta['tags'],
             'needs_tag': needs_tag,
             'needs_rename': is_hash_name,
             'has_existing_tag': has_existing_tag
         })
 
+    if own_manifest:
+        manifest.save()
+
     return files
 
 
-def organize_tagged(backup_dir):
+def organize_tagged(backup_dir, manifest=None):
     """Move files that already have tags to their tag directories"""
-    moved_count = 0
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = NoteManifest(backup_dir)
 
-    for filename in os.listdir(backup_dir):
-        if not filename.endswith('.md'):
-            continue
-        filepath = os.path.join(backup_dir, filename)
-        if os.path.isdir(filepath):
-            continue
+    moved_count = 0
 
-        note = parse_note_file(filepath)
+    root_paths = [os.path.join(backup_dir, f) for f in manifest.root_files()]
+    for filepath, meta in manifest.lookup_many(root_paths):
+        filename = os.path.basename(filepath)
 
         # Skip files without tags
-        if not note['tags']:
+        if not meta['tags']:
             continue
 
         # Use first tag as destination
-        first_tag = note['tags'][0]
+        first_tag = meta['tags'][0]
         tag_dir = os.path.join(backup_dir, first_tag)
 
         # Create tag directory if needed
         os.makedirs(tag_dir, exist_ok=True)
 
         # Move file
-        dst_path = os.path.join(tag_dir, filename)
-        counter = 1
         base, ext = os.path.splitext(filename)
-        while os.path.exists(dst_path):
-            dst_path = os.path.join(tag_dir, f"{base}_{counter}{ext}")
-            counter += 1
+        dst_path = unique_path(tag_dir, base, ext)
 
         shutil.move(filepath, dst_path)
+        release_path(filepath)
+        manifest.move(filepath, dst_path)
         print(f"Organized: {filename} -> {first_tag}/{os.path.basename(dst_path)}")
         moved_count += 1
 
+    if own_manifest:
+        manifest.save()
+
     return moved_count
 
 
-def apply_tag(backup_dir, filename, new_tag):
-    """Apply a tag to a note file - move to tag directory and update Tags line"""
+def apply_tag(backup_dir, filename, new_tag, manifest=None):
+    """Apply a tag to a note file - move to tag directory and update Tags line
+
+    If a manifest is given, the written and removed files are recorded in it.
+    """
     src_path = os.path.join(backup_dir, filename)
     if not os.path.exists(src_path):
         print(f"Error: File not found: {src_path}")
@@ -337,12 +418,8 @@ def apply_tag(backup_dir, filename, new_tag):
         new_content = base_content
 
     # Get unique filepath in destination
-    dst_path = os.path.join(tag_dir, new_filename)
-    counter = 1
-    while os.path.exists(dst_path):
-        name, ext = os.path.splitext(new_filename)
-        dst_path = os.path.join(tag_dir, f"{name}_{counter}{ext}")
-        counter += 1
+    name, ext = os.path.splitext(new_filename)
+    dst_path = unique_path(tag_dir, name, ext)
 
     # Write to new location
     with open(dst_path, 'w', encoding='utf-8') as f:
@@ -354,13 +431,39 @@ def apply_tag(backup_dir, filename, new_tag):
 
     # Remove original
     os.remove(src_path)
+    release_path(src_path)
+
+    if manifest is not None:
+        manifest.record(dst_path, new_content)
+        manifest.forget(src_path)
 
     print(f"Moved: {filename} -> {new_tag}/{os.path.basename(dst_path)}")
     return True
 
 
-def rename_file(backup_dir, old_filename, new_title):
-    """Rename a file based on new title"""
+def search_notes(backup_dir, query, limit=20, refresh=False):
+    """Search notes with the full-text index
+
+    The index is built on first use; afterwards pull/classify/sync keep it
+    up to date. With refresh=True it is first reconciled with the tree.
+    """
+    built = index_exists(backup_dir)
+    index = SearchIndex(backup_dir)
+    try:
+        if refresh or not built:
+            manifest = NoteManifest(backup_dir)
+            index.refresh(manifest)
+            manifest.save()
+        return index.search(query, limit)
+    finally:
+        index.close()
+
+
+def rename_file(backup_dir, old_filename, new_title, manifest=None):
+    """Rename a file based on new title
+
+    If a manifest is given, the renamed file is recorded in it.
+    """
     src_path = os.path.join(backup_dir, old_filename)
     if not os.path.exists(src_path):
         print(f"Error: File not found: {src_path}")
@@ -369,15 +472,17 @@ def rename_file(backup_dir, old_filename, new_title):
     # Sanitize title for filename
     safe_title = re.sub(r'[<>:"/\\|?*]', '_', new_title)
     safe_title = safe_title[:100]
-    new_filename = safe_title + '.md'
 
-    dst_path = os.path.join(backup_dir, new_filename)
-    counter = 1
-    while os.path.exists(dst_path):
-        dst_path = os.path.join(backup_dir, f"{safe_title}_{counter}.md")
-        counter += 1
+    dst_path = unique_path(backup_dir, safe_title, '.md')
 
     shutil.move(src_path, dst_path)
+    release_path(src_path)
+
+    if manifest is not None:
+        with open(dst_path, 'r', encoding='utf-8') as f:
+            manifest.record(dst_path, f.read())
+        manifest.forget(src_path)
+
     print(f"Renamed: {old_filename} -> {os.path.basename(dst_path)}")
     return True
 
@@ -394,9 +499,14 @@ def main():
         print("  python3 simplenote-classify.py status [backup_dir]  # Show all root files status")
         print("  python3 simplenote-classify.py auto [backup_dir]  # Auto-classify using keywords")
         print("  python3 simplenote-classify.py auto --dry-run [backup_dir]  # Preview auto-classify")
+        print("  python3 simplenote-classify.py auto --model [backup_dir]  # Auto-classify using the trained model")
+        print("  python3 simplenote-classify.py train [backup_dir]  # Train the model on tag directories")
+        print("  python3 simplenote-classify.py search <query> [backup_dir] [--json] [--limit N]  # Full-text search")
+        print("  python3 simplenote-classify.py reindex [backup_dir]  # Update the search index from the tree")
         sys.exit(1)
 
     command = sys.argv[1]
+    reset_names()
 
     if command == 'list':
         backup_dir = sys.argv[2] if len(sys.argv) > 2 else get_default_backup_dir()
@@ -429,7 +539,9 @@ def main():
         filename = sys.argv[2]
         tag = sys.argv[3]
         backup_dir = sys.argv[4] if len(sys.argv) > 4 else get_default_backup_dir()
-        apply_tag(backup_dir, filename, tag)
+        manifest = NoteManifest(backup_dir)
+        apply_tag(backup_dir, filename, tag, manifest)
+        manifest.save()
 
     elif command == 'rename':
         if len(sys.argv) < 4:
@@ -438,7 +550,9 @@ def main():
         filename = sys.argv[2]
         new_title = sys.argv[3]
         backup_dir = sys.argv[4] if len(sys.argv) > 4 else get_default_backup_dir()
-        rename_file(backup_dir, filename, new_title)
+        manifest = NoteManifest(backup_dir)
+        rename_file(backup_dir, filename, new_title, manifest)
+        manifest.save()
 
     elif command == 'json':
         backup_dir = sys.argv[2] if len(sys.argv) > 2 else get_default_backup_dir()
@@ -489,7 +603,7 @@ def main():
 
     elif command == 'status':
         backup_dir = sys.argv[2] if len(sys.argv) > 2 else get_default_backup_dir()
-        all_files = list_all_root_files(backup_dir)
+        all_files = list_all_root_files(backup_dir, include_content=False)
         needs_tag = [f for f in all_files if f['needs_tag']]
         has_tag = [f for f in all_files if f['has_existing_tag']]
 
@@ -506,18 +620,74 @@ def main():
             if len(has_tag) > 10:
                 print(f"  ... and {len(has_tag) - 10} more")
 
+    elif command == 'train':
+        backup_dir = sys.argv[2] if len(sys.argv) > 2 else get_default_backup_dir()
+        if np is None:
+            print("Error: numpy is required for the tag model (pip install numpy)")
+            sys.exit(1)
+        model, retrained = train_model(backup_dir)
+        print(f"Retrained {len(retrained)} of {len(model.tags)} tags:")
+        for tag, docs in zip(model.tags, model.docs):
+            mark = ' (updated)' if tag in retrained else ''
+            print(f"  - {tag}: {docs} notes{mark}")
+
+    elif command == 'search':
+        as_json = '--json' in sys.argv
+        args = [a for a in sys.argv[2:] if a != '--json']
+        limit = 20
+        if '--limit' in args:
+            i = args.index('--limit')
+            limit = int(args[i + 1])
+            del args[i:i + 2]
+        if not args:
+            print("Usage: python3 simplenote-classify.py search <query> [backup_dir] [--json] [--limit N]")
+            sys.exit(1)
+        query = args[0]
+        backup_dir = args[1] if len(args) > 1 else get_default_backup_dir()
+        try:
+            results = search_notes(backup_dir, query, limit)
+        except sqlite3.OperationalError as e:
+            print(f"Error: Search index unavailable ({e}). SQLite 3.34+ with FTS5 is required.")
+            sys.exit(1)
+
+        if as_json:
+            print(json.dumps({'query': query, 'count': len(results), 'results': results},
+                             ensure_ascii=False, indent=2))
+        else:
+            print(f"Found {len(results)} notes for: {query}\n")
+            for r in results:
+                tags = f" [{', '.join(r['tags'])}]" if r['tags'] else ''
+                print(f"  {r['path']}{tags}")
+                print(f"    -> {' '.join(r['snippet'].split())[:100]}")
+
+    elif command == 'reindex':
+        backup_dir = sys.argv[2] if len(sys.argv) > 2 else get_default_backup_dir()
+        manifest = NoteManifest(backup_dir)
+        index = SearchIndex(backup_dir)
+        try:
+            updated = index.refresh(manifest)
+        finally:
+            index.close()
+        manifest.save()
+        print(f"Search index updated: {updated} file(s) re-indexed or removed.")
+
     elif command == 'auto':
         dry_run = '--dry-run' in sys.argv
+        use_model = '--model' in sys.argv
         # Get backup_dir from remaining args
-        args = [a for a in sys.argv[2:] if a != '--dry-run']
+        args = [a for a in sys.argv[2:] if a not in ('--dry-run', '--model')]
         backup_dir = args[0] if args else get_default_backup_dir()
+        if use_model and np is None:
+            print("Error: numpy is required for --model (pip install numpy)")
+            sys.exit(1)
 
+        method = 'the trained model' if use_model else 'keyword matching'
         if dry_run:
-            print("[DRY RUN] Auto-classifying files using keyword matching...\n")
+            print(f"[DRY RUN] Auto-classifying files using {method}...\n")
         else:
-            print("Auto-classifying files using keyword matching...\n")
+            print(f"Auto-classifying files using {method}...\n")
 
-        classified, skipped = auto_classify_all(backup_dir, dry_run)
+        classified, skipped = auto_classify_all(backup_dir, dry_run, use_model=use_model)
 
         print(f"\nAuto-classify complete: {classified} classified, {skipped} skipped")
         if skipped > 0:
@@ -8,14 +8,30 @@ Commands:
   python3 simplenote-import.py sync [backup_dir]     - Sync all changes
   python3 simplenote-import.py dry-run [backup_dir]  - Preview changes
   python3 simplenote-import.py json [backup_dir]     - JSON output for Claude
+  python3 simplenote-import.py watch [backup_dir]    - Push local edits as they happen
+
+sync / dry-run only look at files changed since the last sync (see PUSH_STATE)
+and exit without contacting the server when there are none. Add --full to
+compare every file against the whole remote index.
 """
 import os
 import sys
-import glob
 import json
+import time
 import uuid
+import signal
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from simperium.core import Api as SimperiumApi
-from simplenote_metadata import extract_id_from_content, get_content_without_id
+from simplenote_metadata import extract_id_from_content, get_content_without_id, content_hash
+from simplenote_manifest import NoteManifest
+from simplenote_remote import (
+    with_retry, fetch_remote_snapshot, fetch_notes, api_options, backoff_delay,
+    bulk_post_deltas, snapshot_versions, NoteBodies
+)
+from simplenote_state import load_state, save_state
+from simplenote_watch import ChangeWatcher, DEBOUNCE_SECONDS
 
 
 def load_env(env_path=None):
@@ -40,15 +56,15 @@ load_env()
 APPNAME = 'chalk-bump-f49'  # Simplenote
 TOKEN = os.environ.get('TOKEN')
 
+# bulk_post の並列送信設定
+UPLOAD_WORKERS = 4                # 同時に送信中にするバッチ数
+MAX_BATCH_BYTES = 512 * 1024      # 1バッチのペイロード上限（JSONバイト数）
+TARGET_BATCH_SECONDS = 5.0        # これより遅いバッチが続けばバッチサイズを縮小
 
-def fetch_existing_notes(api):
-    """既存ノートを全て取得"""
-    dump = api.note.index(data=True)
-    notes = dump['index']
-    while 'mark' in dump:
-        dump = api.note.index(data=True, mark=dump['mark'])
-        notes.extend(dump['index'])
-    return notes
+# 前回同期時のローカル状態（相対パス -> {note_id, hash, tags}）
+PUSH_STATE = 'push-state.json'
+PUSH_STATE_VERSION = 1
+MAX_NOTE_FETCHES = 50             # これより多く変更されていればスナップショットで取得
 
 
 def parse_local_file(filepath):
@@ -83,60 +99,84 @@ def parse_local_file(filepath):
     return '\n'.join(clean_lines), local_tags, note_id
 
 
-def find_existing_note(content, existing, local_note_id=None, matched_ids=None):
-    """既存ノートと比較して、同一または類似を判定
+def build_remote_index(existing):
+    """既存ノートのインデックスを構築（削除済みは除外）
 
-    マッチング優先順位:
-    1. IDマッチ（ファイルにIDがあれば最優先）
-    2. コンテンツ完全一致
-    3. タイトル一致（後方互換性）
+    by_id: ID -> ノート
+    by_hash / by_title: コンテンツハッシュ / 先頭行 -> ノートIDのキュー（ID順）
+    """
+    by_id = {}
+    by_hash = {}
+    by_title = {}
+    # IDでソートして処理順序を安定化
+    for note in sorted(existing, key=lambda n: n.id):
+        if note.deleted:
+            continue
+        by_id[note.id] = note
+        by_hash.setdefault(note.content_hash, deque()).append(note.id)
+        by_title.setdefault(note.title, deque()).append(note.id)
+    return {'by_id': by_id, 'by_hash': by_hash, 'by_title': by_title}
 
-    local_note_id: ローカルファイルから抽出したID
-    matched_ids: 既にマッチ済みのノートIDのセット（重複タイトル対策）
+
+def _first_unmatched(candidates, matched_ids):
+    """候補の先頭からマッチ済みを取り除き、最初の未マッチを返す
+
+    matched_idsは1回の分析中は増える一方なので、取り除いた候補が再び有効になることはない。
+    """
+    if not candidates:
+        return None
+    while candidates and candidates[0] in matched_ids:
+        candidates.popleft()
+    return candidates[0] if candidates else None
+
+
+def match_existing_note(index, local_hash, local_title, local_note_id=None, matched_ids=None):
+    """インデックスを使って既存ノートを検索（find_existing_noteと同じ優先順位）
+
+    local_hash: ローカルコンテンツのハッシュ
+    local_title: ローカルコンテンツの先頭行
     """
     if matched_ids is None:
         matched_ids = set()
 
     # 1. IDマッチ（最優先）
     if local_note_id and local_note_id not in matched_ids:
-        for note in existing:
-            if note['id'] == local_note_id and not note['d'].get('deleted'):
-                existing_content = note['d'].get('content', '')
-                existing_tags = note['d'].get('tags', [])
-                if existing_content == content:
-                    return ('identical', note['id'], existing_tags)
-                else:
-                    return ('update', note['id'], existing_tags)
+        note = index['by_id'].get(local_note_id)
+        if note:
+            if note.content_hash == local_hash:
+                return ('identical', note.id, note.tags)
+            else:
+                return ('update', note.id, note.tags)
 
-    # IDでソートして処理順序を安定化
-    for note in sorted(existing, key=lambda n: n['id']):
-        if note['d'].get('deleted'):
-            continue
-        # 既にマッチ済みのノートはスキップ
-        if note['id'] in matched_ids:
-            continue
+    # 2. コンテンツ完全一致（既にマッチ済みのノートはスキップ）
+    note_id = _first_unmatched(index['by_hash'].get(local_hash), matched_ids)
+    if note_id:
+        return ('identical', note_id, index['by_id'][note_id].tags)
 
-        existing_content = note['d'].get('content', '')
-        existing_tags = note['d'].get('tags', [])
+    # 3. タイトル一致（後方互換性）
+    note_id = _first_unmatched(index['by_title'].get(local_title), matched_ids)
+    if note_id:
+        return ('update', note_id, index['by_id'][note_id].tags)
 
-        # 2. コンテンツ完全一致
-        if existing_content == content:
-            return ('identical', note['id'], existing_tags)
+    return ('create', None, [])
 
-    # 3. タイトル一致（後方互換性）
-    for note in sorted(existing, key=lambda n: n['id']):
-        if note['d'].get('deleted'):
-            continue
-        if note['id'] in matched_ids:
-            continue
 
-        existing_content = note['d'].get('content', '')
-        existing_tags = note['d'].get('tags', [])
+def find_existing_note(content, existing, local_note_id=None, matched_ids=None, index=None):
+    """既存ノートと比較して、同一または類似を判定
 
-        if existing_content.split('\n')[0] == content.split('\n')[0]:
-            return ('update', note['id'], existing_tags)
+    マッチング優先順位:
+    1. IDマッチ（ファイルにIDがあれば最優先）
+    2. コンテンツ完全一致
+    3. タイトル一致（後方互換性）
 
-    return ('create', None, [])
+    local_note_id: ローカルファイルから抽出したID
+    matched_ids: 既にマッチ済みのノートIDのセット（重複タイトル対策）
+    index: build_remote_index() の結果。繰り返し呼ぶ場合は一度だけ構築して渡す
+    """
+    if index is None:
+        index = build_remote_index(existing)
+    return match_existing_note(index, content_hash(content), content.split('\n')[0],
+                               local_note_id, matched_ids)
 
 
 def get_tag_from_path(filepath, import_dir):
@@ -148,20 +188,127 @@ def get_tag_from_path(filepath, import_dir):
     return None
 
 
-def analyze_sync_status(import_dir):
-    """同期状態を分析"""
-    if not TOKEN:
-        print("Error: TOKEN not found. Set TOKEN in .env file or environment variable.")
-        return None
+def get_effective_tags(filepath, import_dir, meta):
+    """同期するタグ（ディレクトリからのタグを優先）"""
+    dir_tag = get_tag_from_path(filepath, import_dir)
+    return [dir_tag] if dir_tag else meta['tags']
+
+
+def load_push_state(import_dir):
+    """前回同期時のローカル状態を読み込む"""
+    data = load_state(import_dir, PUSH_STATE)
+    if data and data.get('version') == PUSH_STATE_VERSION:
+        return data.get('files', {})
+    return {}
 
-    api = SimperiumApi(APPNAME, TOKEN)
+
+def find_dirty_files(import_dir, manifest, push_state):
+    """前回の同期以降に変更されたファイル（内容・タグ・パス・IDのいずれか）を返す
+
+    マニフェストのstatキャッシュを使うので、変更のないファイルは読み直さない。
+    """
+    md_files = [f for f in manifest.scan() if '/_trash/' not in f]
+    dirty = []
+    for filepath, meta in manifest.lookup_many(md_files):
+        record = push_state.get(os.path.relpath(filepath, import_dir))
+        if (record is None
+                or record['hash'] != meta['content_hash']
+                or record['tags'] != get_effective_tags(filepath, import_dir, meta)
+                or meta['note_id'] not in (None, record['note_id'])):
+            dirty.append(filepath)
+    return dirty
+
+
+def fetch_affected_notes(api, import_dir, manifest, filepaths, bodies=None):
+    """変更されたファイルのノートだけをリモートから取得
+
+    全ファイルがIDコメントを持ち、そのノートがリモートに存在する場合だけ個別取得で済ませる。
+    IDのないファイルはコンテンツ・タイトルで全ノートと照合する必要があるので、
+    その場合（および変更が多い場合）はスナップショット（差分取得）を返す。
+    個別取得したノートは、本文がスナップショットと同じならそのバージョンを差分送信の基準にする。
+    bodies: 本文ストア（NoteBodies）。呼び出し側がノートを使い終えたら閉じる
+    """
+    note_ids = None
+    if len(filepaths) <= MAX_NOTE_FETCHES:
+        note_ids = [meta['note_id'] for _, meta in manifest.lookup_many(filepaths)]
+
+    if note_ids and all(note_ids):
+        note_ids = list(dict.fromkeys(note_ids))  # 同じIDのファイルが複数あっても取得は1回
+        print(f"Fetching {len(note_ids)} changed note(s) from Simplenote...", file=sys.stderr)
+        notes = fetch_notes(api, note_ids, bodies)
+        if len(notes) == len(note_ids) and not any(note.deleted for note in notes):
+            known = snapshot_versions(import_dir)
+            for note in notes:
+                version, chash = known.get(note.id, (None, None))
+                if chash == note.content_hash:
+                    note.v = version
+            return notes
 
     print("Fetching existing notes from Simplenote...", file=sys.stderr)
-    existing_notes = fetch_existing_notes(api)
+    notes, _ = fetch_remote_snapshot(api, import_dir, bodies=bodies)
+    return notes
+
+
+def record_synced(import_dir, manifest, results, synced):
+    """リモートと一致したファイルをプッシュ状態に記録
+
+    synced: {filepath: note_id}（一致していたファイルと送信に成功したファイル）
+    記録する内容は分析時点のもの（送信中に編集されたファイルは次回また変更扱いになる）。
+    """
+    push_state = load_push_state(import_dir)
+    for filepath, note_id in synced.items():
+        record = dict(results['local_state'][filepath], note_id=note_id)
+        push_state[os.path.relpath(filepath, import_dir)] = record
+    # 消えたファイルの記録を削除
+    if manifest.paths is not None:
+        present = {os.path.relpath(p, import_dir) for p in manifest.paths}
+        push_state = {k: v for k, v in push_state.items() if k in present}
+    save_state(import_dir, PUSH_STATE, {'version': PUSH_STATE_VERSION, 'files': push_state})
+
+
+def analyze_sync_status(import_dir, manifest=None, api=None, existing_notes=None, filepaths=None,
+                        bodies=None):
+    """同期状態を分析
+
+    ローカルファイルの解析結果はマニフェストから取得する（変更されたファイルのみ読み直し）。
+    manifest / api / existing_notes: 同期スクリプトから取得済みのスナップショットを渡す場合に指定
+    filepaths: 指定したファイルだけを分析（変更ファイル・watch用）。他のファイルのノートはマッチ済みとして扱う
+    bodies: 取得する場合の本文ストア（NoteBodies）
+    """
+    if api is None:
+        if not TOKEN:
+            print("Error: TOKEN not found. Set TOKEN in .env file or environment variable.")
+            return None
+        api = with_retry(SimperiumApi(APPNAME, TOKEN, **api_options()))
+
+    if existing_notes is None:
+        print("Fetching existing notes from Simplenote...", file=sys.stderr)
+        existing_notes, _ = fetch_remote_snapshot(api, import_dir, bodies=bodies)
+
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = NoteManifest(import_dir)
 
     # .mdファイルを検索（_trashディレクトリを除外）、ソートして処理順序を安定化
-    md_files = sorted([f for f in glob.glob(os.path.join(import_dir, '**/*.md'), recursive=True)
-                if '/_trash/' not in f])
+    md_files = [f for f in manifest.scan() if '/_trash/' not in f]
+
+    # 既にマッチしたノートIDを追跡（重複タイトル対策）
+    matched_ids = set()
+    if filepaths is not None:
+        # 分析しないファイルのノート（IDコメント、またはIDのないファイルなら前回の同期で
+        # 対応付けたもの）はマッチ済み扱い。新しいファイルがタイトル一致で奪わないようにする
+        wanted = {os.path.normpath(p) for p in filepaths}
+        push_state = load_push_state(import_dir)
+        for filepath in md_files:
+            if filepath in wanted:
+                continue
+            key = os.path.relpath(filepath, import_dir)
+            entry = manifest.files.get(key)
+            record = push_state.get(key)
+            for note_id in (entry and entry['note_id'], record and record['note_id']):
+                if note_id:
+                    matched_ids.add(note_id)
+        md_files = [f for f in md_files if f in wanted]
 
     results = {
         'to_create': [],
@@ -169,20 +316,21 @@ def analyze_sync_status(import_dir):
         'tag_changes': [],
         'identical': [],
         'local_count': len(md_files),
-        'remote_count': len([n for n in existing_notes if not n['d'].get('deleted')])
+        'remote_count': len([n for n in existing_notes if not n.deleted]),
+        'local_state': {}  # filepath -> {note_id, hash, tags}（分析時点）
     }
 
-    # 既にマッチしたノートIDを追跡（重複タイトル対策）
-    matched_ids = set()
-
-    for filepath in md_files:
-        content, local_tags, local_note_id = parse_local_file(filepath)
-        dir_tag = get_tag_from_path(filepath, import_dir)
+    index = build_remote_index(existing_notes)
 
+    # stat・解析はスレッドプールで並列に（結果はパス順）
+    for filepath, meta in manifest.lookup_many(md_files):
         # ディレクトリからのタグを優先
-        effective_tags = [dir_tag] if dir_tag else local_tags
+        effective_tags = get_effective_tags(filepath, import_dir, meta)
 
-        action, note_id, remote_tags = find_existing_note(content, existing_notes, local_note_id, matched_ids)
+        action, note_id, remote_tags = match_existing_note(index, meta['content_hash'], meta['title'],
+                                                           meta['note_id'], matched_ids)
+        results['local_state'][filepath] = {'note_id': note_id, 'hash': meta['content_hash'],
+                                            'tags': effective_tags}
 
         if action == 'create':
             results['to_create'].append({
@@ -195,7 +343,9 @@ def analyze_sync_status(import_dir):
             results['to_update'].append({
                 'filepath': filepath,
                 'note_id': note_id,
-                'tags': effective_tags
+                'tags': effective_tags,
+                'remote_tags': remote_tags,
+                'remote_note': index['by_id'][note_id]  # 差分送信の基準（バージョン・本文）
             })
         else:  # identical
             # マッチしたノートIDを記録
@@ -211,21 +361,145 @@ def analyze_sync_status(import_dir):
             else:
                 results['identical'].append(filepath)
 
+    if own_manifest:
+        manifest.save()
+
     return results, api, existing_notes
 
 
-def do_sync(import_dir, dry_run=False, batch_size=50):
-    """同期を実行 (bulk_post APIを使用)"""
-    import time
+def _timed_bulk_post(api, batch_data, bases=None):
+    """bulk_postを送信し、(レスポンス, 所要秒数) を返す（bases があれば本文は差分で送信）"""
+    started = time.monotonic()
+    if bases:
+        response = bulk_post_deltas(api, batch_data, bases)
+    else:
+        response = api.note.bulk_post(batch_data, wait=True)
+    return response, time.monotonic() - started
+
+
+def iter_bulk_post(api, items, action_name, batch_size=50, workers=UPLOAD_WORKERS, bases=None):
+    """(note_id, data) を bulk_post で並列送信し、送信順にバッチ結果を返す
+
+    最大 workers 個のバッチを同時に送信する。バッチはノート数 (batch_size) と
+    ペイロードのバイト数 (MAX_BATCH_BYTES) で区切り、レイテンシが
+    TARGET_BATCH_SECONDS を超えたらノート数を半分に、十分速ければ batch_size まで戻す。
+    bases: {note_id: RemoteNote}。含まれるノートの本文は差分で送る（bulk_post_deltas）
+
+    yields: (成功したノートIDのリスト, エラー数) をバッチの送信順に
+    """
+    items = iter(items)
+    limit = batch_size
+    pending = None  # バイト上限で次のバッチに回したアイテム
+
+    def next_batch():
+        nonlocal pending
+        batch = {}
+        batch_bytes = 0
+        while len(batch) < limit:
+            item = pending if pending is not None else next(items, None)
+            pending = None
+            if item is None:
+                break
+            note_id, data = item
+            size = len(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+            if batch and batch_bytes + size > MAX_BATCH_BYTES:
+                pending = item
+                break
+            batch[note_id] = data
+            batch_bytes += size
+        return batch
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < workers:
+                batch = next_batch()
+                if not batch:
+                    exhausted = True
+                    break
+                in_flight.append((batch, executor.submit(_timed_bulk_post, api, batch, bases)))
+            if not in_flight:
+                break
+
+            # 送信順に結果を処理（進捗表示の順序を保つ）
+            batch, future = in_flight.popleft()
+            try:
+                response, elapsed = future.result()
+            except Exception as e:
+                print(f"  Batch error ({action_name}): {e}")
+                yield [], len(batch)
+                continue
+
+            done = []
+            failed = 0
+            for r in response:
+                if 'error' in r:
+                    print(f"  Error ({action_name}): {r}")
+                    failed += 1
+                else:
+                    done.append(r.get('id'))
+
+            if elapsed > TARGET_BATCH_SECONDS:
+                limit = max(1, limit // 2)
+            elif elapsed < TARGET_BATCH_SECONDS / 2:
+                limit = min(batch_size, limit + max(1, limit // 2))
+
+            yield done, failed
+
+
+def do_sync(import_dir, dry_run=False, batch_size=50, manifest=None, api=None, existing_notes=None,
+            full=False):
+    """同期を実行 (bulk_post APIを並列に使用)
 
-    result = analyze_sync_status(import_dir)
+    リモートのスナップショットを渡されない場合は、前回の同期以降に変更されたファイルだけを
+    そのノートと比較する。変更がなければサーバーに接続せずに終了する。
+    取得したノートの本文ストアは送信が終わったら閉じる。
+    full: 全ファイルをリモートの全ノートと比較する
+    """
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = NoteManifest(import_dir)
+
+    filepaths = None
+    if existing_notes is None and not full:
+        filepaths = find_dirty_files(import_dir, manifest, load_push_state(import_dir))
+        if not filepaths:
+            print("No local changes since the last sync.")
+            if own_manifest:
+                manifest.save()
+            return
+        if api is None:
+            if not TOKEN:
+                print("Error: TOKEN not found. Set TOKEN in .env file or environment variable.")
+                return
+            api = with_retry(SimperiumApi(APPNAME, TOKEN, **api_options()))
+
+    if existing_notes is not None:
+        return _sync_files(import_dir, manifest, own_manifest, api, existing_notes, filepaths,
+                           dry_run, batch_size, None)
+    with NoteBodies(import_dir) as bodies:
+        if filepaths is not None:
+            existing_notes = fetch_affected_notes(api, import_dir, manifest, filepaths, bodies)
+        return _sync_files(import_dir, manifest, own_manifest, api, existing_notes, filepaths,
+                           dry_run, batch_size, bodies)
+
+
+def _sync_files(import_dir, manifest, own_manifest, api, existing_notes, filepaths, dry_run, batch_size,
+                bodies):
+    """do_sync の本体（filepaths: 変更ファイルだけを分析する場合、bodies: 取得する場合の本文ストア）"""
+    result = analyze_sync_status(import_dir, manifest, api, existing_notes, filepaths=filepaths,
+                                 bodies=bodies)
     if result is None:
         return
 
     results, api, existing_notes = result
 
     print(f"\n=== Sync Summary ===")
-    print(f"Local files: {results['local_count']}")
+    if filepaths is not None:
+        print(f"Changed files: {results['local_count']}")
+    else:
+        print(f"Local files: {results['local_count']}")
     print(f"Remote notes: {results['remote_count']}")
     print(f"To create: {len(results['to_create'])}")
     print(f"To update (content): {len(results['to_update'])}")
@@ -250,123 +524,192 @@ def do_sync(import_dir, dry_run=False, batch_size=50):
             print("\nWould update (tags only):")
             for item in results['tag_changes'][:10]:
                 print(f"  # {os.path.basename(item['filepath'])}: {item['old_tags']} -> {item['new_tags']}")
+        if own_manifest:
+            manifest.save()
         return
 
     # 実際に同期を実行
+    synced = {filepath: results['local_state'][filepath]['note_id'] for filepath in results['identical']}
+    created, updated, tag_updated, errors = push_changes(api, results, batch_size, synced)
+    record_synced(import_dir, manifest, results, synced)
+    if own_manifest:
+        manifest.save()
+
+    print(f"\nDone: {created} created, {updated} updated, {tag_updated} tags updated, {len(results['identical'])} unchanged.")
+    if errors > 0:
+        print(f"Errors: {errors}")
+
+
+def push_changes(api, results, batch_size=50, synced=None):
+    """analyze_sync_status() の結果をリモートに送信 -> (作成数, 更新数, タグ更新数, エラー数)
+
+    synced: 指定すると送信に成功したファイルを {filepath: note_id} で追加する
+
+    Simperiumは送ったフィールドだけを既存ノートにマージする（replace指定なし）ため、
+    更新では変わったフィールドだけを送る。タグのみの変更では本文を送らない。
+    本文は照合したリモートノートのバージョンに対する差分で送る（基準が分からない場合や
+    サーバーが差分を受け付けなかった場合は本文全体）。
+    """
     created = 0
     updated = 0
     tag_updated = 0
     errors = 0
+    if synced is None:
+        synced = {}
+    sent = {}  # note_id -> filepath
+    done_ids = []
 
-    def process_batch(batch_data, action_name):
-        """バッチをbulk_postで送信"""
-        nonlocal errors
-        if not batch_data:
-            return 0
-        try:
-            results = api.note.bulk_post(batch_data, wait=True)
-            success = 0
-            for r in results:
-                if 'error' in r:
-                    print(f"  Error ({action_name}): {r}")
-                    errors += 1
-                else:
-                    success += 1
-            return success
-        except Exception as e:
-            print(f"  Batch error ({action_name}): {e}")
-            errors += len(batch_data)
-            return 0
-
-    # 新規作成（バッチ処理）
+    # 新規作成（並列バッチ処理）
     if results['to_create']:
         print(f"\nCreating {len(results['to_create'])} notes...")
-        batch = {}
-        for i, item in enumerate(results['to_create']):
-            content, _, _ = parse_local_file(item['filepath'])
-            current_time = time.time()
-            new_id = str(uuid.uuid4()).replace('-', '')
-            batch[new_id] = {
-                'content': content,
-                'tags': item['tags'],
-                'deleted': False,
-                'shareURL': '',
-                'publishURL': '',
-                'systemTags': [],
-                'modificationDate': current_time,
-                'creationDate': current_time
-            }
-
-            if len(batch) >= batch_size:
-                count = process_batch(batch, "create")
-                created += count
-                print(f"  Progress: {created}/{len(results['to_create'])} created")
-                batch = {}
 
-        # 残りを処理
-        if batch:
-            count = process_batch(batch, "create")
-            created += count
+        def create_items():
+            for item in results['to_create']:
+                content, _, _ = parse_local_file(item['filepath'])
+                current_time = time.time()
+                new_id = str(uuid.uuid4()).replace('-', '')
+                sent[new_id] = item['filepath']
+                yield new_id, {
+                    'content': content,
+                    'tags': item['tags'],
+                    'deleted': False,
+                    'shareURL': '',
+                    'publishURL': '',
+                    'systemTags': [],
+                    'modificationDate': current_time,
+                    'creationDate': current_time
+                }
+
+        for done, failed in iter_bulk_post(api, create_items(), "create", batch_size):
+            created += len(done)
+            done_ids.extend(done)
+            errors += failed
             print(f"  Progress: {created}/{len(results['to_create'])} created")
 
-    # コンテンツ更新（バッチ処理）
+    # コンテンツ更新（並列バッチ処理）
     if results['to_update']:
         print(f"\nUpdating {len(results['to_update'])} notes (content)...")
-        batch = {}
-        for i, item in enumerate(results['to_update']):
-            content, _, _ = parse_local_file(item['filepath'])
-            current_time = time.time()
-            batch[item['note_id']] = {
-                'content': content,
-                'tags': item['tags'],
-                'deleted': False,
-                'modificationDate': current_time
-            }
-
-            if len(batch) >= batch_size:
-                count = process_batch(batch, "update")
-                updated += count
-                print(f"  Progress: {updated}/{len(results['to_update'])} updated")
-                batch = {}
 
-        if batch:
-            count = process_batch(batch, "update")
-            updated += count
+        bases = {}
+
+        def update_items():
+            for item in results['to_update']:
+                content, _, _ = parse_local_file(item['filepath'])
+                sent[item['note_id']] = item['filepath']
+                bases[item['note_id']] = item['remote_note']
+                data = {'content': content, 'modificationDate': time.time()}
+                if item['tags'] != item['remote_tags']:
+                    data['tags'] = item['tags']
+                yield item['note_id'], data
+
+        for done, failed in iter_bulk_post(api, update_items(), "update", batch_size, bases=bases):
+            updated += len(done)
+            done_ids.extend(done)
+            errors += failed
             print(f"  Progress: {updated}/{len(results['to_update'])} updated")
 
-    # タグのみ更新（バッチ処理）
+    # タグのみ更新（並列バッチ処理）
     if results['tag_changes']:
         print(f"\nUpdating {len(results['tag_changes'])} notes (tags only)...")
-        batch = {}
-        for i, item in enumerate(results['tag_changes']):
-            content, _, _ = parse_local_file(item['filepath'])
-            current_time = time.time()
-            batch[item['note_id']] = {
-                'content': content,
-                'tags': item['new_tags'],
-                'deleted': False,
-                'modificationDate': current_time
-            }
 
-            if len(batch) >= batch_size:
-                count = process_batch(batch, "tag update")
-                tag_updated += count
-                print(f"  Progress: {tag_updated}/{len(results['tag_changes'])} tag updates")
-                batch = {}
-
-        if batch:
-            count = process_batch(batch, "tag update")
-            tag_updated += count
+        def tag_items():
+            for item in results['tag_changes']:
+                sent[item['note_id']] = item['filepath']
+                yield item['note_id'], {
+                    'tags': item['new_tags'],
+                    'modificationDate': time.time()
+                }
+
+        for done, failed in iter_bulk_post(api, tag_items(), "tag update", batch_size):
+            tag_updated += len(done)
+            done_ids.extend(done)
+            errors += failed
             print(f"  Progress: {tag_updated}/{len(results['tag_changes'])} tag updates")
 
-    print(f"\nDone: {created} created, {updated} updated, {tag_updated} tags updated, {len(results['identical'])} unchanged.")
-    if errors > 0:
-        print(f"Errors: {errors}")
+    for note_id in done_ids:
+        if note_id in sent:
+            synced[sent[note_id]] = note_id
+    return created, updated, tag_updated, errors
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def watch(import_dir, debounce=DEBOUNCE_SECONDS, poll=False, batch_size=50):
+    """ローカルの変更を監視し、変更されたノートだけをプッシュし続ける
+
+    起動時に通常の同期を1回行い、以降はファイルの変更イベントをdebounce秒まとめてから
+    変更されたファイルだけを分析・送信する。リモートの状態は差分取得スナップショットで更新する。
+    エラー（通信・送信の失敗、途中で消えたファイルなど）は記録して待ち、マニフェストを読み直して
+    通常の同期（前回同期以降の変更ファイルをすべて対象）で追いついてから監視を続ける。
+    """
+    if not TOKEN:
+        print("Error: TOKEN not found. Set TOKEN in .env file or environment variable.")
+        return False
+
+    # launchd / kill で停止されたときも後始末してから終了
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+
+    api = with_retry(SimperiumApi(APPNAME, TOKEN, **api_options()))
+    manifest = NoteManifest(import_dir)
+    watcher = ChangeWatcher(import_dir, debounce=debounce, poll=poll)
+    watcher.start()
+
+    print(f"\nWatching {import_dir} for changes ({watcher.backend}, debounce {debounce}s). Ctrl+C to stop.")
+    failures = 0
+    catch_up = True  # 起動時・エラー後は通常の同期で追いつく
+    try:
+        while True:
+            try:
+                if catch_up:
+                    with NoteBodies(import_dir) as bodies:
+                        existing_notes, _ = fetch_remote_snapshot(api, import_dir, bodies=bodies)
+                        do_sync(import_dir, manifest=manifest, api=api, existing_notes=existing_notes,
+                                batch_size=batch_size)
+                    manifest.save()
+                    catch_up = False
+                    failures = 0
+
+                changed = watcher.wait_batch()
+                if not changed:
+                    continue
+                manifest.refresh_paths(changed)
+                with NoteBodies(import_dir) as bodies:
+                    existing_notes, _ = fetch_remote_snapshot(api, import_dir, bodies=bodies)
+                    results, _, _ = analyze_sync_status(import_dir, manifest, api, existing_notes,
+                                                        filepaths=changed)
+                    synced = {filepath: results['local_state'][filepath]['note_id']
+                              for filepath in results['identical']}
+                    created, updated, tag_updated, errors = push_changes(api, results, batch_size, synced)
+                record_synced(import_dir, manifest, results, synced)
+                manifest.save()
+
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                print(f"[{timestamp}] {len(changed)} changed file(s): {created} created, {updated} updated, "
+                      f"{tag_updated} tags updated, {len(results['identical'])} unchanged"
+                      + (f", {errors} errors" if errors else ""), flush=True)
+            except Exception as e:
+                failures += 1
+                catch_up = True
+                # 消えたファイルなどでパス一覧が古くなっている可能性があるので読み直す
+                manifest = NoteManifest(import_dir)
+                delay = backoff_delay(min(failures, 6))
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                print(f"[{timestamp}] Watch error: {e} (retrying in {delay:.0f}s)", flush=True)
+                time.sleep(delay)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        watcher.stop()
+        manifest.save()
+    return True
 
 
 def show_status(import_dir):
     """同期状態を表示"""
-    result = analyze_sync_status(import_dir)
+    with NoteBodies(import_dir) as bodies:
+        result = analyze_sync_status(import_dir, bodies=bodies)
     if result is None:
         return
 
@@ -392,7 +735,8 @@ def show_status(import_dir):
 
 def show_json(import_dir):
     """JSON形式で状態を出力"""
-    result = analyze_sync_status(import_dir)
+    with NoteBodies(import_dir) as bodies:
+        result = analyze_sync_status(import_dir, bodies=bodies)
     if result is None:
         return
 
@@ -424,19 +768,34 @@ def main():
         print("  python3 simplenote-import.py sync [backup_dir]     - Sync all changes")
         print("  python3 simplenote-import.py dry-run [backup_dir]  - Preview changes")
         print("  python3 simplenote-import.py json [backup_dir]     - JSON output for Claude")
+        print("  (sync / dry-run: add --full to compare every file with the whole remote index)")
+        print("  python3 simplenote-import.py watch [backup_dir] [--debounce SECONDS] [--poll]")
+        print("                                                     - Push local edits as they happen")
         sys.exit(1)
 
     command = sys.argv[1]
-    import_dir = sys.argv[2] if len(sys.argv) > 2 else get_default_backup_dir()
+    args = sys.argv[2:]
+    debounce = DEBOUNCE_SECONDS
+    if '--debounce' in args:
+        i = args.index('--debounce')
+        debounce = float(args[i + 1])
+        del args[i:i + 2]
+    poll = '--poll' in args
+    full = '--full' in args
+    args = [a for a in args if a not in ('--poll', '--full')]
+    import_dir = args[0] if args else get_default_backup_dir()
 
     if command == 'status':
         show_status(import_dir)
     elif command == 'sync':
-        do_sync(import_dir, dry_run=False)
+        do_sync(import_dir, dry_run=False, full=full)
     elif command == 'dry-run':
-        do_sync(import_dir, dry_run=True)
+        do_sync(import_dir, dry_run=True, full=full)
     elif command == 'json':
         show_json(import_dir)
+    elif command == 'watch':
+        if not watch(import_dir, debounce=debounce, poll=poll):
+            sys.exit(1)
     else:
         print(f"Unknown command: {command}")
         sys.exit(1)
@@ -7,19 +7,35 @@ Commands:
   python3 simplenote-pull.py status [backup_dir]   - Show differences
   python3 simplenote-pull.py pull [backup_dir]     - Apply remote changes to local
   python3 simplenote-pull.py dry-run [backup_dir]  - Preview changes without applying
+  python3 simplenote-pull.py watch [backup_dir]    - Apply remote changes as they happen
+
+Add --full to ignore the stored change cursor and download the whole index.
 """
 import os
 import sys
 import re
-import glob
+import time
 import shutil
+import signal
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from simperium.core import Api as SimperiumApi
-from simplenote_metadata import (
-    extract_id_from_content,
-    get_content_without_id,
-    build_content_with_id
+from simplenote_metadata import build_content_with_id
+from simplenote_remote import (
+    iter_remote_snapshot,
+    with_retry,
+    api_options,
+    wait_for_changes,
+    apply_changes,
+    snapshot_cursor,
+    backoff_delay,
+    NoteBodies,
+    CHANGES_TIMEOUT
 )
+from simplenote_manifest import NoteManifest
+from simplenote_names import unique_path, release_path, reset_names, path_key
 
 
 def load_env(env_path=None):
@@ -39,10 +55,14 @@ def get_default_backup_dir():
     return os.path.join(os.environ['HOME'], 'Dropbox/SimplenoteBackups')
 
 
+_log_lock = threading.Lock()
+
+
 def log(message, level="INFO"):
-    """タイムスタンプ付きログ出力"""
+    """タイムスタンプ付きログ出力（書き込みスレッドからも呼ばれるので行単位で排他）"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}] {level}: {message}")
+    with _log_lock:
+        print(f"[{timestamp}] {level}: {message}")
 
 
 load_env()
@@ -50,15 +70,37 @@ load_env()
 APPNAME = 'chalk-bump-f49'
 TOKEN = os.environ.get('TOKEN')
 
+# 書き込み待ちにできるページ数（これを超えたら解析側が書き込みの完了を待つ）
+WRITE_AHEAD_PAGES = 4
+
 
-def fetch_remote_notes(api):
+def iter_remote_notes(api, backup_dir, full=False, bodies=None):
+    """リモートノートをページ単位で取得（削除済み含む）
+
+    前回のchange version (cv) 以降に変更されたノートのみ取得し、
+    ローカルのスナップショットに適用する。初回またはカーソル期限切れ時はフル取得。
+    インデックスのページが届くたびにRemoteNoteのリストを返す（次のページは裏で取得中）。
+    bodies: 本文ストア（NoteBodies）。呼び出し側がノートを使い終えたら閉じる
+    """
+    batches = iter_remote_snapshot(api, backup_dir, full=full, bodies=bodies)
+    count = 0
+    while True:
+        try:
+            batch = next(batches)
+        except StopIteration as stop:
+            changed = stop.value
+            break
+        count += len(batch)
+        yield batch
+    if changed is None:
+        log(f"Full index fetched: {count} notes")
+    else:
+        log(f"Incremental fetch: {changed} changed note(s)")
+
+
+def fetch_remote_notes(api, backup_dir, full=False, bodies=None):
     """リモートノートを全て取得（削除済み含む）"""
-    dump = api.note.index(data=True)
-    notes = dump['index']
-    while 'mark' in dump:
-        dump = api.note.index(data=True, mark=dump['mark'])
-        notes.extend(dump['index'])
-    return notes
+    return [note for batch in iter_remote_notes(api, backup_dir, full=full, bodies=bodies) for note in batch]
 
 
 def extract_filename(content, note_id):
@@ -78,49 +120,24 @@ def extract_filename(content, note_id):
     return note_id
 
 
-def parse_local_file(filepath):
-    """ローカルファイルを解析してコンテンツ、タグ、IDを取得"""
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # Extract simplenote ID if present
-    note_id = extract_id_from_content(content)
-
-    # Remove ID comment from content for comparison
-    content = get_content_without_id(content)
-
-    lines = content.split('\n')
-    clean_lines = []
-    local_tags = []
-    system_tags = []
-
-    for line in lines:
-        if line.startswith('Tags: '):
-            tag_str = line[6:].strip()
-            if tag_str:
-                local_tags = [t.strip() for t in tag_str.split(',') if t.strip()]
-        elif line.startswith('System tags: '):
-            tag_str = line[13:].strip()
-            if tag_str:
-                system_tags = [t.strip() for t in tag_str.split(',') if t.strip()]
-        else:
-            clean_lines.append(line)
-
-    while clean_lines and clean_lines[-1] == '':
-        clean_lines.pop()
-
-    return '\n'.join(clean_lines), local_tags, system_tags, note_id
+def get_local_files(backup_dir, manifest=None):
+    """ローカルファイルを全て取得してタイトルとIDでインデックス化
 
+    解析結果はマニフェスト（キャッシュディレクトリの manifest.json）にキャッシュされ、
+    stat（サイズ・mtime・inode）が変わったファイルだけを読み直す。
+    stat・読み込みはスレッドプールで並列に行う（結果はパス順）。
+    各エントリは照合に使う値（タイトル・ハッシュ・ID・ディレクトリ）だけを持ち、本文は持たない。
+    ファイルを書き換えるときの本文はリモート側（RemoteNote.content）から読む。
+    """
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = NoteManifest(backup_dir)
 
-def get_local_files(backup_dir):
-    """ローカルファイルを全て取得してタイトルとIDでインデックス化"""
     files = {}
     id_to_filepath = {}  # ID -> filepath mapping for quick lookup
-    md_files = glob.glob(os.path.join(backup_dir, '**/*.md'), recursive=True)
 
-    for filepath in md_files:
-        content, tags, system_tags, note_id = parse_local_file(filepath)
-        title = content.split('\n')[0] if content else ''
+    for filepath, meta in manifest.lookup_many(manifest.scan()):
+        note_id = meta['note_id']
 
         # ディレクトリからタグを取得
         rel_path = os.path.relpath(filepath, backup_dir)
@@ -128,11 +145,9 @@ def get_local_files(backup_dir):
         dir_tag = parts[0] if len(parts) > 1 and parts[0] != '_trash' else None
 
         files[filepath] = {
-            'content': content,
-            'tags': tags,
-            'system_tags': system_tags,
             'dir_tag': dir_tag,
-            'title': title,
+            'title': meta['title'],
+            'content_hash': meta['content_hash'],
             'is_trash': '_trash' in filepath,
             'note_id': note_id
         }
@@ -141,66 +156,82 @@ def get_local_files(backup_dir):
         if note_id:
             id_to_filepath[note_id] = filepath
 
+    if own_manifest:
+        manifest.save()
+
     return files, id_to_filepath
 
 
-def find_local_match(remote_note, local_files, id_to_filepath, matched_ids=None):
+def build_local_indexes(local_files):
+    """コンテンツハッシュ・タイトルからローカルファイルへのインデックスを構築
+
+    各キーの候補はファイルパス順に並べる（従来のsorted()走査と同じ優先順位）。
+    """
+    by_hash = {}
+    by_title = {}
+    for filepath in sorted(local_files):
+        local = local_files[filepath]
+        by_hash.setdefault(local['content_hash'], deque()).append(filepath)
+        by_title.setdefault(local['title'], deque()).append(filepath)
+    return {'by_hash': by_hash, 'by_title': by_title}
+
+
+def _first_unmatched(candidates, matched_ids):
+    """候補の先頭からマッチ済みを取り除き、最初の未マッチを返す
+
+    matched_idsは1回の分析中は増える一方なので、取り除いた候補が再び有効になることはない。
+    """
+    if not candidates:
+        return None
+    while candidates and candidates[0] in matched_ids:
+        candidates.popleft()
+    return candidates[0] if candidates else None
+
+
+def find_local_match(remote_note, local_files, id_to_filepath, matched_ids=None, indexes=None):
     """リモートノートに対応するローカルファイルを検索
 
     マッチング優先順位:
     1. IDマッチ（ファイルにIDがあれば最優先）
     2. コンテンツ完全一致
     3. タイトル一致（後方互換性）
+
+    indexes: build_local_indexes() の結果。同じmatched_idsで繰り返し呼ぶ場合に渡す
     """
     if matched_ids is None:
         matched_ids = set()
+    if indexes is None:
+        indexes = build_local_indexes(local_files)
 
-    remote_id = remote_note['id']
-    remote_content = remote_note['d'].get('content', '')
-    remote_title = remote_content.split('\n')[0] if remote_content else ''
+    remote_id = remote_note.id
+    remote_title = remote_note.title
+    remote_hash = remote_note.content_hash
 
     # 1. IDマッチ（最優先）
     if remote_id in id_to_filepath:
         filepath = id_to_filepath[remote_id]
         if filepath not in matched_ids:
             local = local_files[filepath]
-            if local['content'] == remote_content:
+            if local['content_hash'] == remote_hash:
                 return filepath, 'identical'
             else:
                 return filepath, 'id_match'
 
     # 2. コンテンツ完全一致（既にマッチ済みを除く）
-    for filepath, local in sorted(local_files.items()):
-        if filepath in matched_ids:
-            continue
-        if local['content'] == remote_content:
-            return filepath, 'identical'
+    filepath = _first_unmatched(indexes['by_hash'].get(remote_hash), matched_ids)
+    if filepath:
+        return filepath, 'identical'
 
     # 3. タイトル一致（後方互換性、既にマッチ済みを除く）
-    for filepath, local in sorted(local_files.items()):
-        if filepath in matched_ids:
-            continue
-        if local['title'] == remote_title:
-            return filepath, 'title_match'
+    filepath = _first_unmatched(indexes['by_title'].get(remote_title), matched_ids)
+    if filepath:
+        return filepath, 'title_match'
 
     return None, None
 
 
-def analyze_differences(backup_dir):
-    """リモートとローカルの差分を分析"""
-    if not TOKEN:
-        log("TOKEN not found", "ERROR")
-        return None
-
-    api = SimperiumApi(APPNAME, TOKEN)
-
-    log("Fetching remote notes...")
-    remote_notes = fetch_remote_notes(api)
-
-    log("Scanning local files...")
-    local_files, id_to_filepath = get_local_files(backup_dir)
-
-    results = {
+def _new_results(local_files, id_to_filepath):
+    return {
         'tag_changes': [],      # タグ（ディレクトリ）変更
         'content_changes': [],  # コンテンツ変更
         'new_notes': [],        # リモートにあってローカルにない
@@ -213,70 +244,120 @@ def analyze_differences(backup_dir):
         'id_to_filepath': id_to_filepath  # Pass through for do_pull
     }
 
-    matched_local_files = set()
 
-    # アクティブなリモートノート
-    active_remote = [n for n in remote_notes if not n['d'].get('deleted')]
-    # 削除済みリモートノート
-    trashed_remote = [n for n in remote_notes if n['d'].get('deleted')]
-
-    results['remote_count'] = len(active_remote)
-    results['remote_trashed'] = len(trashed_remote)
+def analyze_differences(backup_dir, full=False, remote_notes=None, manifest=None, on_decided=None,
+                        bodies=None):
+    """リモートとローカルの差分を分析
 
-    # アクティブなリモートノートを処理
-    for note in active_remote:
-        remote_content = note['d'].get('content', '')
-        remote_tags = note['d'].get('tags', [])
-        remote_system_tags = note['d'].get('systemTags', [])
+    ローカルの走査はリモートの取得と並行して行い、リモートノートはページが届くたびに照合する。
+    照合はインデックス順に行うので、結果は全件を取得してから照合した場合と同じになる。
+    アクティブなノートの判定はそのページの照合で確定し、on_decided が指定されていれば
+    ページごとに {'tag_changes', 'content_changes', 'new_notes'} を渡す（書き込みの先行開始用）。
+    リモートで削除されたノート（_trash行き）と孤立ファイルは全ページの照合後に判定する。
 
-        # 単一タグの場合のみディレクトリ化
-        remote_dir_tag = remote_tags[0] if len(remote_tags) == 1 else None
+    remote_notes / manifest: 同期スクリプトから取得済みのスナップショットを渡す場合に指定
+    bodies: 取得する場合の本文ストア（NoteBodies）
+    """
+    if remote_notes is None:
+        if not TOKEN:
+            log("TOKEN not found", "ERROR")
+            return None
 
-        filepath, match_type = find_local_match(note, local_files, id_to_filepath, matched_local_files)
+        api = with_retry(SimperiumApi(APPNAME, TOKEN, **api_options()))
 
-        if filepath:
-            matched_local_files.add(filepath)
-            local = local_files[filepath]
+        log("Fetching remote notes...")
+        batches = iter_remote_notes(api, backup_dir, full=full, bodies=bodies)
+    else:
+        batches = [remote_notes]
 
-            if match_type == 'identical':
-                # コンテンツは同一、タグをチェック
-                if remote_dir_tag != local['dir_tag']:
-                    results['tag_changes'].append({
-                        'filepath': filepath,
-                        'old_tag': local['dir_tag'],
-                        'new_tag': remote_dir_tag,
-                        'content': remote_content,
+    log("Scanning local files...")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        scan = executor.submit(get_local_files, backup_dir, manifest)
+
+        results = None
+        matched_local_files = set()
+        # 削除済みリモートノートは全ページの照合後に処理（アクティブなノートを優先）
+        trashed_remote = []
+
+        # アクティブなリモートノートを処理（本文は書き込み時に読む: item['note'].content）
+        for batch in batches:
+            if results is None:
+                # 最初のページの取得中に走査が進む
+                local_files, id_to_filepath = scan.result()
+                results = _new_results(local_files, id_to_filepath)
+                indexes = build_local_indexes(local_files)
+
+            decided = {'tag_changes': [], 'content_changes': [], 'new_notes': []}
+            for note in batch:
+                if note.deleted:
+                    trashed_remote.append(note)
+                    continue
+                results['remote_count'] += 1
+
+                remote_tags = note.tags
+                remote_system_tags = note.system_tags
+
+                # 単一タグの場合のみディレクトリ化
+                remote_dir_tag = remote_tags[0] if len(remote_tags) == 1 else None
+
+                filepath, match_type = find_local_match(note, local_files, id_to_filepath,
+                                                        matched_local_files, indexes)
+
+                if filepath:
+                    matched_local_files.add(filepath)
+                    local = local_files[filepath]
+
+                    if match_type == 'identical':
+                        # コンテンツは同一、タグをチェック
+                        if remote_dir_tag != local['dir_tag']:
+                            decided['tag_changes'].append({
+                                'filepath': filepath,
+                                'old_tag': local['dir_tag'],
+                                'new_tag': remote_dir_tag,
+                                'note': note,
+                                'tags': remote_tags,
+                                'system_tags': remote_system_tags,
+                                'note_id': note.id
+                            })
+                        else:
+                            results['identical'].append(filepath)
+                    else:
+                        # ID一致またはタイトル一致だがコンテンツ異なる
+                        decided['content_changes'].append({
+                            'filepath': filepath,
+                            'old_tag': local['dir_tag'],
+                            'new_tag': remote_dir_tag,
+                            'note': note,
+                            'tags': remote_tags,
+                            'system_tags': remote_system_tags,
+                            'note_id': note.id
+                        })
+                else:
+                    # ローカルにない新規ノート
+                    decided['new_notes'].append({
+                        'note': note,
                         'tags': remote_tags,
                         'system_tags': remote_system_tags,
-                        'note_id': note['id']
+                        'dir_tag': remote_dir_tag,
+                        'note_id': note.id
                     })
-                else:
-                    results['identical'].append(filepath)
-            else:
-                # ID一致またはタイトル一致だがコンテンツ異なる
-                results['content_changes'].append({
-                    'filepath': filepath,
-                    'old_tag': local['dir_tag'],
-                    'new_tag': remote_dir_tag,
-                    'content': remote_content,
-                    'tags': remote_tags,
-                    'system_tags': remote_system_tags,
-                    'note_id': note['id']
-                })
-        else:
-            # ローカルにない新規ノート
-            results['new_notes'].append({
-                'content': remote_content,
-                'tags': remote_tags,
-                'system_tags': remote_system_tags,
-                'dir_tag': remote_dir_tag,
-                'note_id': note['id']
-            })
+
+            for key, items in decided.items():
+                results[key].extend(items)
+            if on_decided is not None:
+                on_decided(decided)
+
+        if results is None:
+            local_files, id_to_filepath = scan.result()
+            results = _new_results(local_files, id_to_filepath)
+            indexes = build_local_indexes(local_files)
+
+    results['remote_trashed'] = len(trashed_remote)
 
     # 削除済みリモートノートをチェック（ローカルにあれば_trashへ）
     for note in trashed_remote:
-        remote_content = note['d'].get('content', '')
-        filepath, match_type = find_local_match(note, local_files, id_to_filepath, matched_local_files)
+        filepath, match_type = find_local_match(note, local_files, id_to_filepath,
+                                                matched_local_files, indexes)
 
         if filepath and not local_files[filepath]['is_trash']:
             matched_local_files.add(filepath)
@@ -296,22 +377,27 @@ def analyze_differences(backup_dir):
     return results, backup_dir
 
 
+def write_note_file(filepath, note_id, content, tags, system_tags):
+    """ID付きのノートファイルを書き込み、書き込んだテキストを返す"""
+    text = build_content_with_id(note_id, content) + '\n'
+    if tags:
+        text += f"Tags: {', '.join(tags)}\n"
+    if system_tags:
+        text += f"System tags: {', '.join(system_tags)}\n"
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return text
+
+
 def get_unique_filepath(dir_path, base_name, ext):
-    """重複時に連番を付与"""
-    path = os.path.join(dir_path, base_name + ext)
-    if not os.path.exists(path):
-        return path
-    counter = 1
-    while True:
-        path = os.path.join(dir_path, f"{base_name}_{counter}{ext}")
-        if not os.path.exists(path):
-            return path
-        counter += 1
+    """重複時に連番を付与（ディレクトリ一覧をキャッシュ）"""
+    return unique_path(dir_path, base_name, ext)
 
 
-def show_status(backup_dir):
+def show_status(backup_dir, full=False):
     """差分状態を表示"""
-    result = analyze_differences(backup_dir)
+    with NoteBodies(backup_dir) as bodies:
+        result = analyze_differences(backup_dir, full=full, bodies=bodies)
     if result is None:
         return
 
@@ -357,9 +443,208 @@ def show_status(backup_dir):
         print(f"\nWarning: {untagged} new note(s) have no tag (will be in root)")
 
 
-def do_pull(backup_dir, dry_run=False, trash_orphans=False):
-    """リモートの変更をローカルに適用"""
-    result = analyze_differences(backup_dir)
+def _target_dir(backup_dir, tag):
+    return os.path.join(backup_dir, tag) if tag else backup_dir
+
+
+def apply_tag_change(backup_dir, manifest, item):
+    """タグ変更（ディレクトリ移動、ID確保）し、移動先のパスを返す"""
+    old_path = item['filepath']
+    filename = os.path.basename(old_path)
+
+    new_dir = _target_dir(backup_dir, item['new_tag'])
+    os.makedirs(new_dir, exist_ok=True)
+    new_path = get_unique_filepath(new_dir, os.path.splitext(filename)[0], '.md')
+
+    # Write content with ID (ensures ID is present for migrated files)
+    text = write_note_file(new_path, item['note_id'], item['note'].content,
+                           item['tags'], item['system_tags'])
+    manifest.record(new_path, text)
+
+    # Remove old file
+    os.remove(old_path)
+    release_path(old_path)
+    manifest.forget(old_path)
+
+    old_tag = item['old_tag'] or 'root'
+    new_tag = item['new_tag'] or 'root'
+    log(f"Tag changed: {filename} ({old_tag}/ -> {new_tag}/)")
+    return new_path
+
+
+def apply_content_change(backup_dir, manifest, item):
+    """コンテンツ変更（タグも変わっている場合は移動）し、書き込んだパスを返す"""
+    filepath = item['filepath']
+
+    if item['new_tag'] != item['old_tag']:
+        filename = os.path.basename(filepath)
+        new_dir = _target_dir(backup_dir, item['new_tag'])
+        os.makedirs(new_dir, exist_ok=True)
+        new_path = get_unique_filepath(new_dir, os.path.splitext(filename)[0], '.md')
+        os.remove(filepath)
+        release_path(filepath)
+        manifest.forget(filepath)
+        filepath = new_path
+
+    # コンテンツを更新（ID付き）
+    text = write_note_file(filepath, item['note_id'], item['note'].content,
+                           item['tags'], item['system_tags'])
+    manifest.record(filepath, text)
+
+    log(f"Updated: {os.path.basename(filepath)}")
+    return filepath
+
+
+def create_note_file(backup_dir, manifest, item, content=None):
+    """新規ノート（ID付き）を書き込み、そのパスを返す
+
+    content: 読み込み済みの本文（省略時は item['note'] から読む）
+    """
+    if content is None:
+        content = item['note'].content
+    filename = extract_filename(content, 'new_note')
+
+    target_dir = _target_dir(backup_dir, item['dir_tag'])
+    os.makedirs(target_dir, exist_ok=True)
+    filepath = get_unique_filepath(target_dir, filename, '.md')
+
+    text = write_note_file(filepath, item['note_id'], content,
+                           item['tags'], item['system_tags'])
+    manifest.record(filepath, text)
+
+    tag_info = f"[{item['dir_tag']}]" if item['dir_tag'] else "[untagged]"
+    log(f"Created: {os.path.basename(filepath)} {tag_info}")
+    return filepath
+
+
+def move_to_trash(trash_dir, manifest, old_path):
+    """ファイルを_trashへ移動し、移動先のファイル名を返す"""
+    filename = os.path.basename(old_path)
+    new_path = get_unique_filepath(trash_dir, os.path.splitext(filename)[0], '.md')
+
+    shutil.move(old_path, new_path)
+    release_path(old_path)
+    manifest.move(old_path, new_path)
+    return filename
+
+
+class PullWriter:
+    """照合が済んだページの書き込みを別スレッドで実行する
+
+    タグ変更・コンテンツ更新・新規作成はページごとに書き込む。ただし移動先・作成先の名前
+    （name.md）が今回の実行より前からあるファイルで塞がっている項目は deferred に回し、
+    _trash への移動の後で apply_deferred() により書き込む。そのファイルが _trash へ移るか
+    別のディレクトリへ移れば、従来どおり空いた名前を引き継げる。
+    書き込み待ちのページが WRITE_AHEAD_PAGES に達したら、最も古いページの完了を待つ。
+    書き込み中のエラーは submit() / finish() で送出される。
+    """
+
+    def __init__(self, backup_dir, manifest):
+        self.backup_dir = backup_dir
+        self.manifest = manifest
+        self.counts = {'moved': 0, 'updated': 0, 'created': 0, 'untagged': 0}
+        self.deferred = {'tag_changes': [], 'content_changes': [], 'new_notes': []}
+        self.settled = set()  # 今回書き込んだパス（path_key）: 以降 _trash へ移ることはない
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = deque()
+
+    def submit(self, decided):
+        if not any(decided.values()):
+            return
+
+        while len(self.pending) >= WRITE_AHEAD_PAGES:
+            self.pending.popleft().result()
+        self.pending.append(self.executor.submit(self._write, decided))
+
+    def finish(self):
+        """残りの書き込みを待つ（失敗したら未着手のページは取り消す）"""
+        try:
+            while self.pending:
+                self.pending.popleft().result()
+        finally:
+            for future in self.pending:
+                future.cancel()
+            self.executor.shutdown()
+
+    def apply_deferred(self):
+        """名前が空くのを待っていた項目を書き込む（_trash への移動の後に呼ぶ）"""
+        for item in self.deferred['tag_changes']:
+            self._move(item)
+        for item in self.deferred['content_changes']:
+            self._update(item)
+        for item in self.deferred['new_notes']:
+            self._create(item)
+
+    def _write(self, decided):
+        for item in decided['tag_changes']:
+            if self._name_held(item['new_tag'], item['filepath']):
+                self.deferred['tag_changes'].append(item)
+            else:
+                self._move(item)
+        for item in decided['content_changes']:
+            if item['new_tag'] != item['old_tag'] and self._name_held(item['new_tag'], item['filepath']):
+                self.deferred['content_changes'].append(item)
+            else:
+                self._update(item)
+        for item in decided['new_notes']:
+            content = item['note'].content
+            filename = extract_filename(content, 'new_note') + '.md'
+            if self._name_held(item['dir_tag'], filename):
+                self.deferred['new_notes'].append(item)
+            else:
+                self._create(item, content)
+
+    def _name_held(self, tag, filename):
+        """tag のディレクトリの filename が、今回より前からあるファイルで塞がっているか"""
+        path = os.path.join(_target_dir(self.backup_dir, tag), os.path.basename(filename))
+        return os.path.exists(path) and path_key(path) not in self.settled
+
+    def _move(self, item):
+        self.settled.add(path_key(apply_tag_change(self.backup_dir, self.manifest, item)))
+        self.counts['moved'] += 1
+
+    def _update(self, item):
+        self.settled.add(path_key(apply_content_change(self.backup_dir, self.manifest, item)))
+        self.counts['updated'] += 1
+
+    def _create(self, item, content=None):
+        self.settled.add(path_key(create_note_file(self.backup_dir, self.manifest, item, content)))
+        self.counts['created'] += 1
+        if not item['dir_tag']:
+            self.counts['untagged'] += 1
+
+
+def do_pull(backup_dir, dry_run=False, trash_orphans=False, full=False, remote_notes=None, manifest=None):
+    """リモートの変更をローカルに適用
+
+    取得・照合・書き込みはパイプラインで進む: ページの照合が済むたびに、タグ変更・
+    コンテンツ更新・新規作成を書き込みスレッドへ渡し、次のページの取得・照合と並行して書き込む。
+    全ページの照合後に _trash への移動（リモートで削除・孤立）を行い、移動先の名前が既存の
+    ファイルで塞がっていて後回しにした項目を書き込む（_trash へ移したファイルの名前を引き継ぐ）。
+    書き込み・移動はマニフェストに反映する（同期スクリプトでは後続フェーズがそのまま使う）。
+    remote_notes を渡されない場合は自分で取得し、本文ストアは適用が終わったら閉じる。
+    """
+    if remote_notes is not None:
+        return _apply_pull(backup_dir, dry_run, trash_orphans, full, remote_notes, manifest, None)
+    with NoteBodies(backup_dir) as bodies:
+        return _apply_pull(backup_dir, dry_run, trash_orphans, full, None, manifest, bodies)
+
+
+def _apply_pull(backup_dir, dry_run, trash_orphans, full, remote_notes, manifest, bodies):
+    """do_pull の本体（bodies: 自分で取得する場合の本文ストア）"""
+    own_manifest = manifest is None
+    if own_manifest:
+        manifest = NoteManifest(backup_dir)
+    # ディレクトリ一覧は実行ごとに取り直す（前回以降にユーザーが作ったファイルを上書きしない）
+    reset_names()
+
+    writer = None if dry_run else PullWriter(backup_dir, manifest)
+    try:
+        result = analyze_differences(backup_dir, full=full, remote_notes=remote_notes, manifest=manifest,
+                                     on_decided=writer.submit if writer else None, bodies=bodies)
+    finally:
+        if writer is not None:
+            writer.finish()
     if result is None:
         return {'error': True}
 
@@ -391,7 +676,7 @@ def do_pull(backup_dir, dry_run=False, trash_orphans=False):
         if results['new_notes']:
             print("\nWould create:")
             for item in results['new_notes'][:10]:
-                title = item['content'].split('\n')[0][:50] if item['content'] else '(empty)'
+                title = item['note'].title[:50] if item['note'].title else '(empty)'
                 tag_info = f"[{item['dir_tag']}]" if item['dir_tag'] else "[untagged]"
                 print(f"  {title}... {tag_info}")
 
@@ -405,14 +690,13 @@ def do_pull(backup_dir, dry_run=False, trash_orphans=False):
             for item in results['orphaned'][:10]:
                 print(f"  {os.path.basename(item['filepath'])}")
 
+        if own_manifest:
+            manifest.save()
         return results
 
-    # 実際に適用
-    moved = 0
-    updated = 0
-    created = 0
+    # 実際に適用（名前が空いていた項目は照合と並行して書き込み済み）
+    counts = writer.counts
     trashed = 0
-    untagged_count = 0
 
     # _trash ディレクトリ作成
     trash_dir = os.path.join(backup_dir, '_trash')
@@ -420,111 +704,19 @@ def do_pull(backup_dir, dry_run=False, trash_orphans=False):
 
     # リモートで削除されたノート → ローカルを_trashへ
     for item in results['to_trash']:
-        old_path = item['filepath']
-        filename = os.path.basename(old_path)
-        new_path = get_unique_filepath(trash_dir, os.path.splitext(filename)[0], '.md')
-
-        shutil.move(old_path, new_path)
+        filename = move_to_trash(trash_dir, manifest, item['filepath'])
         log(f"Moved to _trash: {filename}")
         trashed += 1
 
     # 孤立ファイルを_trashへ（オプション）
     if trash_orphans:
         for item in results['orphaned']:
-            old_path = item['filepath']
-            filename = os.path.basename(old_path)
-            new_path = get_unique_filepath(trash_dir, os.path.splitext(filename)[0], '.md')
-
-            shutil.move(old_path, new_path)
+            filename = move_to_trash(trash_dir, manifest, item['filepath'])
             log(f"Moved orphaned to _trash: {filename}")
             trashed += 1
 
-    # タグ変更（ディレクトリ移動、ID確保）
-    for item in results['tag_changes']:
-        old_path = item['filepath']
-        filename = os.path.basename(old_path)
-
-        if item['new_tag']:
-            new_dir = os.path.join(backup_dir, item['new_tag'])
-        else:
-            new_dir = backup_dir
-
-        os.makedirs(new_dir, exist_ok=True)
-        new_path = get_unique_filepath(new_dir, os.path.splitext(filename)[0], '.md')
-
-        # Write content with ID (ensures ID is present for migrated files)
-        with open(new_path, 'w', encoding='utf-8') as f:
-            content_with_id = build_content_with_id(item['note_id'], item['content'])
-            f.write(content_with_id)
-            f.write('\n')
-            if item['tags']:
-                f.write(f"Tags: {', '.join(item['tags'])}\n")
-            if item['system_tags']:
-                f.write(f"System tags: {', '.join(item['system_tags'])}\n")
-
-        # Remove old file
-        os.remove(old_path)
-
-        old_tag = item['old_tag'] or 'root'
-        new_tag = item['new_tag'] or 'root'
-        log(f"Tag changed: {filename} ({old_tag}/ -> {new_tag}/)")
-        moved += 1
-
-    # コンテンツ変更
-    for item in results['content_changes']:
-        filepath = item['filepath']
-
-        # タグも変わっている場合は移動
-        if item['new_tag'] != item['old_tag']:
-            filename = os.path.basename(filepath)
-            if item['new_tag']:
-                new_dir = os.path.join(backup_dir, item['new_tag'])
-            else:
-                new_dir = backup_dir
-            os.makedirs(new_dir, exist_ok=True)
-            new_path = get_unique_filepath(new_dir, os.path.splitext(filename)[0], '.md')
-            os.remove(filepath)
-            filepath = new_path
-
-        # コンテンツを更新（ID付き）
-        with open(filepath, 'w', encoding='utf-8') as f:
-            content_with_id = build_content_with_id(item['note_id'], item['content'])
-            f.write(content_with_id)
-            f.write('\n')
-            if item['tags']:
-                f.write(f"Tags: {', '.join(item['tags'])}\n")
-            if item['system_tags']:
-                f.write(f"System tags: {', '.join(item['system_tags'])}\n")
-
-        log(f"Updated: {os.path.basename(filepath)}")
-        updated += 1
-
-    # 新規ノート（ID付き）
-    for item in results['new_notes']:
-        content = item['content']
-        filename = extract_filename(content, 'new_note')
-
-        if item['dir_tag']:
-            target_dir = os.path.join(backup_dir, item['dir_tag'])
-        else:
-            target_dir = backup_dir
-            untagged_count += 1
-
-        os.makedirs(target_dir, exist_ok=True)
-        filepath = get_unique_filepath(target_dir, filename, '.md')
-
-        with open(filepath, 'w', encoding='utf-8') as f:
-            content_with_id = build_content_with_id(item['note_id'], content)
-            f.write(content_with_id)
-            f.write('\n')
-            if item['tags']:
-                f.write(f"Tags: {', '.join(item['tags'])}\n")
-            if item['system_tags']:
-                f.write(f"System tags: {', '.join(item['system_tags'])}\n")
-
-        tag_info = f"[{item['dir_tag']}]" if item['dir_tag'] else "[untagged]"
-        log(f"Created: {os.path.basename(filepath)} {tag_info}")
-        created += 1
+    # 名前が塞がっていた項目（_trash へ移したファイルの名前を再利用できる）
+    writer.apply_deferred()
 
     # 空になったディレクトリを削除
     for item in os.listdir(backup_dir):
@@ -534,39 +726,105 @@ def do_pull(backup_dir, dry_run=False, trash_orphans=False):
                 os.rmdir(item_path)
                 log(f"Removed empty directory: {item}/")
 
+    if own_manifest:
+        manifest.save()
+
     log(f"=== Pull Complete ===")
-    log(f"Summary: {trashed} trashed, {moved} moved, {updated} updated, {created} created")
+    log(f"Summary: {trashed} trashed, {counts['moved']} moved, {counts['updated']} updated, "
+        f"{counts['created']} created")
 
-    if untagged_count > 0:
-        log(f"Warning: {untagged_count} untagged file(s) in root directory", "WARN")
+    if counts['untagged'] > 0:
+        log(f"Warning: {counts['untagged']} untagged file(s) in root directory", "WARN")
 
     return {
         'trashed': trashed,
-        'moved': moved,
-        'updated': updated,
-        'created': created,
-        'untagged': untagged_count,
+        'moved': counts['moved'],
+        'updated': counts['updated'],
+        'created': counts['created'],
+        'untagged': counts['untagged'],
         'orphaned': len(results['orphaned']) if not trash_orphans else 0
     }
 
 
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def watch(backup_dir, timeout=CHANGES_TIMEOUT):
+    """リモートの変更を待ち受け、届いたらすぐローカルに反映し続ける
+
+    起動時に通常のpullを1回行い、以降はスナップショットのcvを変更カーソルとして
+    changesフィードをlong pollする。変更されたノートだけを個別に取得して
+    スナップショットに反映し、タグ・_trash・IDのルールは通常のpullと同じ処理で適用する。
+    接続エラーや書き込みエラー時は待ってから差分取得でスナップショットを追いつかせて再開する。
+    do_pull は呼ぶたびにマニフェストとファイル名の一覧を取り直す。
+    """
+    if not TOKEN:
+        log("TOKEN not found", "ERROR")
+        return False
+
+    # launchd / kill で停止されたときも後始末してから終了
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+
+    api = with_retry(SimperiumApi(APPNAME, TOKEN, **api_options()))
+
+    log("Watching remote changes. Ctrl+C to stop.")
+    failures = 0
+    catch_up = True  # 起動時・エラー後は差分取得でスナップショットを追いつかせる
+    try:
+        while True:
+            try:
+                if catch_up:
+                    with NoteBodies(backup_dir) as bodies:
+                        remote_notes = fetch_remote_notes(api, backup_dir, bodies=bodies)
+                        do_pull(backup_dir, remote_notes=remote_notes)
+                    catch_up = False
+                    failures = 0
+                changes = wait_for_changes(api, snapshot_cursor(backup_dir), timeout)
+                if not changes:
+                    continue
+                with NoteBodies(backup_dir) as bodies:
+                    remote_notes, changed = apply_changes(api, backup_dir, changes, bodies)
+
+                    log(f"Change feed: {changed} changed note(s)")
+                    # ローカルの編集も反映されるよう、マニフェスト・ファイル名一覧は毎回読み直す
+                    do_pull(backup_dir, remote_notes=remote_notes)
+            except Exception as e:
+                # 通信エラーも書き込みエラー（ディスク・消えたファイル）も待ってから追いつき直す
+                failures += 1
+                catch_up = True
+                delay = backoff_delay(min(failures, 6))
+                log(f"Watch error: {e} (retrying in {delay:.0f}s)", "WARN")
+                time.sleep(delay)
+    except KeyboardInterrupt:
+        log("Stopped watching.")
+    return True
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage:")
         print("  python3 simplenote-pull.py status [backup_dir]   - Show differences")
         print("  python3 simplenote-pull.py pull [backup_dir]     - Apply remote changes")
         print("  python3 simplenote-pull.py dry-run [backup_dir]  - Preview changes")
+        print("  python3 simplenote-pull.py watch [backup_dir]    - Follow remote changes")
+        print("  (add --full to re-download the whole index)")
         sys.exit(1)
 
     command = sys.argv[1]
-    backup_dir = sys.argv[2] if len(sys.argv) > 2 else get_default_backup_dir()
+    full = '--full' in sys.argv
+    args = [a for a in sys.argv[2:] if a != '--full']
+    backup_dir = args[0] if args else get_default_backup_dir()
 
     if command == 'status':
-        show_status(backup_dir)
+        show_status(backup_dir, full=full)
     elif command == 'pull':
-        do_pull(backup_dir, dry_run=False, trash_orphans=False)
+        do_pull(backup_dir, dry_run=False, trash_orphans=False, full=full)
     elif command == 'dry-run':
-        do_pull(backup_dir, dry_run=True)
+        do_pull(backup_dir, dry_run=True, full=full)
+    elif command == 'watch':
+        if not watch(backup_dir):
+            sys.exit(1)
     else:
         print(f"Unknown command: {command}")
         sys.exit(1)
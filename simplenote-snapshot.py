@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Simplenote Snapshot Script
+Keeps point-in-time snapshots of all notes in a content-addressed store.
+
+Each note version is stored once as a blob (the backup file serialization,
+zlib-compressed, named by its SHA-256); each snapshot is a small manifest of
+note ID -> blob. Taking a snapshot uses the incremental remote fetch, so
+storage and time grow only with the notes that changed.
+
+Store layout (inside the backup directory):
+  .simplenote/snapshots/objects/<2 hex>/<62 hex>     - note blobs
+  .simplenote/snapshots/manifests/<name>.json.gz     - one per snapshot
+
+Commands:
+  python3 simplenote-snapshot.py take [backup_dir]                       - Take a snapshot
+  python3 simplenote-snapshot.py list [backup_dir]                       - List snapshots
+  python3 simplenote-snapshot.py diff <old> <new> [backup_dir] [--patch] - Compare two snapshots
+  python3 simplenote-snapshot.py restore <name> <target_dir> [backup_dir] - Restore a snapshot
+
+<name> may be a snapshot name, a unique prefix of one, or 'latest'.
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import zlib
+import difflib
+import hashlib
+from datetime import datetime
+from simperium.core import Api as SimperiumApi
+from simplenote_metadata import build_file_content
+from simplenote_remote import fetch_remote_snapshot, with_retry, api_options, NoteBodies
+from simplenote_state import get_state_dir
+from simplenote_names import unique_path, reset_names
+
+
+def load_env(env_path=None):
+    """Load environment variables from .env file"""
+    if env_path is None:
+        env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+    if os.path.exists(env_path):
+        with open(env_path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    os.environ.setdefault(key.strip(), value.strip())
+
+
+def get_default_backup_dir():
+    return os.path.join(os.environ['HOME'], 'Dropbox/SimplenoteBackups')
+
+
+load_env()
+
+APPNAME = 'chalk-bump-f49'
+TOKEN = os.environ.get('TOKEN')
+
+
+def extract_filename(content, note_id):
+    """ノート内容からファイル名を生成"""
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#'):
+            title = line.lstrip('#').strip()
+        else:
+            title = line
+        safe_title = re.sub(r'[<>:"/\\|?*]', '_', title)
+        safe_title = safe_title[:100]
+        if safe_title:
+            return safe_title
+    return note_id
+
+
+def get_store_dir(backup_dir):
+    return os.path.join(get_state_dir(backup_dir), 'snapshots')
+
+
+def blob_path(store, digest):
+    return os.path.join(store, 'objects', digest[:2], digest[2:])
+
+
+def write_blob(store, data):
+    """ブロブを保存（既に存在すれば何もしない）-> 新規に書き込んだらTrue"""
+    path = blob_path(store, hashlib.sha256(data).hexdigest())
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(zlib.compress(data))
+    os.replace(tmp_path, path)
+    return True
+
+
+def read_blob(store, digest):
+    with open(blob_path(store, digest), 'rb') as f:
+        return zlib.decompress(f.read()).decode('utf-8')
+
+
+def list_snapshots(store):
+    """スナップショット名を古い順に返す"""
+    manifest_dir = os.path.join(store, 'manifests')
+    if not os.path.isdir(manifest_dir):
+        return []
+    return sorted(f[:-len('.json.gz')] for f in os.listdir(manifest_dir) if f.endswith('.json.gz'))
+
+
+def resolve_snapshot(store, name):
+    """スナップショット名（'latest'・前方一致可）を解決"""
+    names = list_snapshots(store)
+    if name == 'latest':
+        return names[-1] if names else None
+    if name in names:
+        return name
+    matches = [n for n in names if n.startswith(name)]
+    return matches[0] if len(matches) == 1 else None
+
+
+def load_snapshot(store, name):
+    with gzip.open(os.path.join(store, 'manifests', name + '.json.gz'), 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_snapshot(store, name, snapshot):
+    manifest_dir = os.path.join(store, 'manifests')
+    os.makedirs(manifest_dir, exist_ok=True)
+    path = os.path.join(manifest_dir, name + '.json.gz')
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def note_relpath(note, content):
+    """バックアップと同じレイアウトでの相対パス（_trash / タグディレクトリ）"""
+    parts = []
+    if note.deleted:
+        parts.append('_trash')
+    if len(note.tags) == 1:
+        parts.append(note.tags[0])
+    parts.append(extract_filename(content, note.id) + '.md')
+    return os.path.join(*parts)
+
+
+def take_snapshot(backup_dir, full=False):
+    """リモートの現在の状態をスナップショットとして保存"""
+    if not TOKEN:
+        print("Error: TOKEN not found. Set TOKEN in .env file or environment variable.")
+        return None
+
+    api = with_retry(SimperiumApi(APPNAME, TOKEN, **api_options()))
+    store = get_store_dir(backup_dir)
+    names = list_snapshots(store)
+    previous = load_snapshot(store, names[-1]) if names else None
+    # 直前のスナップショットにあるブロブは存在確認を省略
+    known = {e['blob'] for e in previous['notes'].values()} if previous else set()
+
+    # 本文ストアはブロブを書き終えたら閉じる
+    with NoteBodies(backup_dir) as bodies:
+        notes, changed = fetch_remote_snapshot(api, backup_dir, full=full, bodies=bodies)
+
+        entries = {}
+        new_blobs = 0
+        for note in notes:
+            content = note.content
+            data = build_file_content(note.id, content, note.tags, note.system_tags).encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()
+            if digest not in known and write_blob(store, data):
+                new_blobs += 1
+            entries[note.id] = {
+                'blob': digest,
+                'path': note_relpath(note, content),
+                'mtime': note.modified
+            }
+
+    if previous and previous['notes'] == entries:
+        print(f"No changes since snapshot {names[-1]} ({len(entries)} notes).")
+        return names[-1]
+
+    name = datetime.now().strftime('%Y%m%d-%H%M%S')
+    suffix = 1
+    while name in names:
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{suffix}"
+        suffix += 1
+
+    save_snapshot(store, name, {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'notes': entries
+    })
+    print(f"Snapshot {name}: {len(entries)} notes, {new_blobs} new blob(s).")
+    return name
+
+
+def show_list(backup_dir):
+    """スナップショット一覧を表示"""
+    store = get_store_dir(backup_dir)
+    names = list_snapshots(store)
+    if not names:
+        print("No snapshots.")
+        return
+    for name in names:
+        snapshot = load_snapshot(store, name)
+        notes = snapshot['notes'].values()
+        trashed = len([e for e in notes if e['path'].startswith('_trash' + os.sep)])
+        print(f"  {name}  {len(snapshot['notes'])} notes ({trashed} in _trash)")
+
+
+def show_diff(backup_dir, old_name, new_name, patch=False):
+    """2つのスナップショットの差分を表示"""
+    store = get_store_dir(backup_dir)
+    resolved = [resolve_snapshot(store, old_name), resolve_snapshot(store, new_name)]
+    for name, given in zip(resolved, (old_name, new_name)):
+        if name is None:
+            print(f"Error: Snapshot not found (or ambiguous): {given}")
+            return False
+    old = load_snapshot(store, resolved[0])['notes']
+    new = load_snapshot(store, resolved[1])['notes']
+
+    added = sorted(new.keys() - old.keys(), key=lambda i: new[i]['path'])
+    removed = sorted(old.keys() - new.keys(), key=lambda i: old[i]['path'])
+    changed = sorted([i for i in new.keys() & old.keys() if new[i] != old[i]],
+                     key=lambda i: new[i]['path'])
+
+    print(f"=== {resolved[0]} -> {resolved[1]} ===")
+    print(f"Added: {len(added)}, Removed: {len(removed)}, Changed: {len(changed)}")
+    for note_id in added:
+        print(f"  + {new[note_id]['path']}")
+    for note_id in removed:
+        print(f"  - {old[note_id]['path']}")
+    for note_id in changed:
+        before, after = old[note_id], new[note_id]
+        if before['path'] != after['path']:
+            print(f"  ~ {before['path']} -> {after['path']}")
+        else:
+            print(f"  ~ {after['path']}")
+        if patch and before['blob'] != after['blob']:
+            lines = difflib.unified_diff(
+                read_blob(store, before['blob']).splitlines(keepends=True),
+                read_blob(store, after['blob']).splitlines(keepends=True),
+                fromfile=f"{resolved[0]}/{before['path']}",
+                tofile=f"{resolved[1]}/{after['path']}")
+            sys.stdout.writelines(lines)
+    return True
+
+
+def restore_snapshot(backup_dir, name, target_dir):
+    """スナップショットを空のディレクトリに復元"""
+    store = get_store_dir(backup_dir)
+    resolved = resolve_snapshot(store, name)
+    if resolved is None:
+        print(f"Error: Snapshot not found (or ambiguous): {name}")
+        return False
+    if os.path.isdir(target_dir) and os.listdir(target_dir):
+        print(f"Error: Target directory is not empty: {target_dir}")
+        return False
+
+    notes = load_snapshot(store, resolved)['notes']
+    reset_names()
+    for note_id, entry in sorted(notes.items(), key=lambda kv: kv[1]['path']):
+        dir_part, filename = os.path.split(entry['path'])
+        dir_path = os.path.join(target_dir, dir_part)
+        os.makedirs(dir_path, exist_ok=True)
+        path = unique_path(dir_path, os.path.splitext(filename)[0], '.md')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(read_blob(store, entry['blob']))
+        if entry.get('mtime') is not None:
+            os.utime(path, (entry['mtime'], entry['mtime']))
+
+    print(f"Restored snapshot {resolved}: {len(notes)} notes to {target_dir}")
+    return True
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage:")
+        print("  python3 simplenote-snapshot.py take [backup_dir]                        - Take a snapshot")
+        print("  python3 simplenote-snapshot.py list [backup_dir]                        - List snapshots")
+        print("  python3 simplenote-snapshot.py diff <old> <new> [backup_dir] [--patch]  - Compare snapshots")
+        print("  python3 simplenote-snapshot.py restore <name> <target_dir> [backup_dir] - Restore a snapshot")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    flags = [a for a in sys.argv[2:] if a.startswith('--')]
+    args = [a for a in sys.argv[2:] if not a.startswith('--')]
+
+    if command == 'take':
+        backup_dir = args[0] if args else get_default_backup_dir()
+        ok = take_snapshot(backup_dir, full='--full' in flags) is not None
+    elif command == 'list':
+        backup_dir = args[0] if args else get_default_backup_dir()
+        show_list(backup_dir)
+        ok = True
+    elif command == 'diff':
+        if len(args) < 2:
+            print("Usage: python3 simplenote-snapshot.py diff <old> <new> [backup_dir] [--patch]")
+            sys.exit(1)
+        backup_dir = args[2] if len(args) > 2 else get_default_backup_dir()
+        ok = show_diff(backup_dir, args[0], args[1], patch='--patch' in flags)
+    elif command == 'restore':
+        if len(args) < 2:
+            print("Usage: python3 simplenote-snapshot.py restore <name> <target_dir> [backup_dir]")
+            sys.exit(1)
+        backup_dir = args[2] if len(args) > 2 else get_default_backup_dir()
+        ok = restore_snapshot(backup_dir, args[0], args[1])
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Simplenote Sync Orchestrator
+Runs pull -> organize -> auto-classify -> push in a single process.
+
+One remote snapshot (incremental fetch) and one local snapshot (manifest with
+a single tree walk) are shared by all phases; each phase records the files it
+moves or writes so the next phase never re-scans or re-downloads.
+
+Commands:
+  python3 simplenote-sync.py sync [backup_dir]     - Run a full sync
+  python3 simplenote-sync.py dry-run [backup_dir]  - Preview without changes
+"""
+import os
+import sys
+import importlib.util
+from datetime import datetime
+from simperium.core import Api as SimperiumApi
+from simplenote_manifest import NoteManifest
+from simplenote_remote import with_retry, api_options, NoteBodies
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename, module_name):
+    """ハイフン付きスクリプトをモジュールとして読み込む"""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(SCRIPT_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+pull = load_script('simplenote-pull.py', 'simplenote_pull')
+push = load_script('simplenote-import.py', 'simplenote_import')
+classify = load_script('simplenote-classify.py', 'simplenote_classify')
+
+
+def log(message):
+    """タイムスタンプ付きログ出力"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] {message}", flush=True)
+
+
+def log_section(title):
+    log("========================================")
+    log(title)
+    log("========================================")
+
+
+def run_sync(backup_dir, dry_run=False, full=False):
+    """Pull -> Organize -> Auto-classify -> Push を1プロセスで実行"""
+    if not pull.TOKEN:
+        log("Error: TOKEN not found. Set TOKEN in .env file or environment variable.")
+        return False
+
+    api = with_retry(SimperiumApi(pull.APPNAME, pull.TOKEN, **api_options()))
+    manifest = NoteManifest(backup_dir)
+
+    # リモートノートの本文ストアは全フェーズ（pull の書き込み・push の差分送信）が終わるまで開いておく
+    with NoteBodies(backup_dir) as bodies:
+        log("Fetching remote notes...")
+        remote_notes = pull.fetch_remote_notes(api, backup_dir, full=full, bodies=bodies)
+
+        # Step 1: Pull remote changes to local
+        log_section("Step 1: Pull (Remote -> Local)")
+        pull.do_pull(backup_dir, dry_run=dry_run, remote_notes=remote_notes, manifest=manifest)
+
+        # Step 2: Organize files (move tagged files to correct directories)
+        log_section("Step 2: Organize (Move tagged files)")
+        if dry_run:
+            tagged = [f for f in classify.list_all_root_files(backup_dir, False, manifest)
+                      if f['has_existing_tag']]
+            log(f"[DRY RUN] Would organize {len(tagged)} tagged file(s)")
+        else:
+            moved = classify.organize_tagged(backup_dir, manifest)
+            log(f"Organized {moved} files with existing tags.")
+
+        # Step 3: Auto-classify untagged files using keyword matching
+        unclassified = [n for n in classify.list_unclassified(backup_dir, manifest) if n['needs_tag']]
+        if unclassified:
+            log_section(f"Step 2.5: Auto-classify ({len(unclassified)} untagged files)")
+            classified, skipped = classify.auto_classify_all(backup_dir, dry_run, manifest)
+            log(f"Auto-classify complete: {classified} classified, {skipped} skipped")
+            if skipped > 0:
+                log(f"WARNING: {skipped} file(s) could not be auto-classified")
+                log("Run '/classify' in Claude Code for manual classification")
+
+        # Step 4: Push local changes to remote (same remote snapshot, same manifest)
+        log_section("Step 3: Push (Local -> Remote)")
+        push.do_sync(backup_dir, dry_run=dry_run, manifest=manifest, api=api, existing_notes=remote_notes)
+
+    manifest.save()
+    log_section("Sync Complete")
+    return True
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage:")
+        print("  python3 simplenote-sync.py sync [backup_dir]     - Run a full sync")
+        print("  python3 simplenote-sync.py dry-run [backup_dir]  - Preview without changes")
+        print("  (add --full to re-download the whole index)")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    full = '--full' in sys.argv
+    args = [a for a in sys.argv[2:] if a != '--full']
+    backup_dir = args[0] if args else pull.get_default_backup_dir()
+
+    if command == 'sync':
+        ok = run_sync(backup_dir, dry_run=False, full=full)
+    elif command == 'dry-run':
+        ok = run_sync(backup_dir, dry_run=True, full=full)
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
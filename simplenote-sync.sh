@@ -5,7 +5,8 @@
 #
 # Flow:
 #   1. Check if local directory is empty -> Full backup
-#   2. Otherwise: Pull (Remote -> Local) -> Push (Local -> Remote)
+#   2. Otherwise: simplenote-sync.py runs Pull (Remote -> Local) -> Organize
+#      -> Auto-classify -> Push (Local -> Remote) in one process
 #
 # Usage:
 #   ./simplenote-sync.sh                    # Run sync
@@ -60,47 +61,13 @@ if [ ! -d "$BACKUP_DIR" ] || [ -z "$(find "$BACKUP_DIR" -name '*.md' -type f 2>/
     exit 0
 fi
 
-# Normal sync flow: Pull -> Organize -> Push
-
-# Step 1: Pull remote changes to local
-log_section "Step 1: Pull (Remote -> Local)"
-if [ "$DRY_RUN" = true ]; then
-    python3 "$SCRIPT_DIR/simplenote-pull.py" dry-run "$BACKUP_DIR"
-else
-    python3 "$SCRIPT_DIR/simplenote-pull.py" pull "$BACKUP_DIR"
-fi
-
-# Step 2: Organize files (move tagged files to correct directories)
-log_section "Step 2: Organize (Move tagged files)"
-python3 "$SCRIPT_DIR/simplenote-classify.py" organize
-
-# Step 3: Auto-classify untagged files using keyword matching
-UNCLASSIFIED=$(python3 "$SCRIPT_DIR/simplenote-classify.py" status 2>&1 | grep "Needs classification" | grep -oE '[0-9]+')
-if [ -n "$UNCLASSIFIED" ] && [ "$UNCLASSIFIED" -gt 0 ]; then
-    log_section "Step 2.5: Auto-classify ($UNCLASSIFIED untagged files)"
-    if [ "$DRY_RUN" = true ]; then
-        python3 "$SCRIPT_DIR/simplenote-classify.py" auto --dry-run
-    else
-        python3 "$SCRIPT_DIR/simplenote-classify.py" auto
-    fi
-
-    # Check if any files remain unclassified
-    REMAINING=$(python3 "$SCRIPT_DIR/simplenote-classify.py" status 2>&1 | grep "Needs classification" | grep -oE '[0-9]+')
-    if [ -n "$REMAINING" ] && [ "$REMAINING" -gt 0 ]; then
-        log "WARNING: $REMAINING file(s) could not be auto-classified"
-        log "Run '/classify' in Claude Code for manual classification"
-    fi
-fi
-
-# Step 4: Push local changes to remote
-log_section "Step 3: Push (Local -> Remote)"
+# Normal sync flow: Pull -> Organize -> Auto-classify -> Push
+# (single Python process sharing one remote and one local snapshot)
 if [ "$DRY_RUN" = true ]; then
-    python3 "$SCRIPT_DIR/simplenote-import.py" dry-run "$BACKUP_DIR"
+    python3 "$SCRIPT_DIR/simplenote-sync.py" dry-run "$BACKUP_DIR"
 else
-    python3 "$SCRIPT_DIR/simplenote-import.py" sync "$BACKUP_DIR"
+    python3 "$SCRIPT_DIR/simplenote-sync.py" sync "$BACKUP_DIR"
 fi
 
-log_section "Sync Complete"
-
 # Show summary
 log "Sync finished at $(date)"
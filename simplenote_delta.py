@@ -0,0 +1,70 @@
+"""
+Simplenote Content Deltas
+Encodes an edit of a note body as a diff-match-patch delta.
+
+The delta is the format of diff_match_patch.diff_toDelta(), which Simperium
+accepts as a `d` (diff) operation on a string field: tab-separated
+operations, `=N` keep N characters, `-N` delete N characters, `+text` insert
+URI-encoded text. Character counts are UTF-16 code units in the JavaScript
+library and code points in older Python ports; the two agree unless the
+text contains characters outside the BMP (e.g. emoji), so content_delta()
+returns None for such text and the caller sends the full body.
+
+The diff itself is computed with difflib: the common prefix and suffix are
+kept, and the changed middle is compared line by line, which keeps typical
+edits of large notes small without a character-level diff.
+"""
+import os
+import difflib
+from typing import Optional
+from urllib.parse import quote
+
+# diff_match_patch.diff_toDelta() が挿入テキストでエスケープしない文字
+DELTA_SAFE = "!~*'();/?:@&=+$,# "
+
+
+def _has_astral(text: str) -> bool:
+    return any(ord(c) > 0xFFFF for c in text)
+
+
+def _line_ops(old: str, new: str) -> list:
+    """Delta operations turning old into new, compared line by line."""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        removed = sum(len(line) for line in old_lines[i1:i2])
+        if tag == 'equal':
+            ops.append('=%d' % removed)
+            continue
+        if removed:
+            ops.append('-%d' % removed)
+        if j2 > j1:
+            ops.append('+' + quote(''.join(new_lines[j1:j2]).encode('utf-8'), DELTA_SAFE))
+    return ops
+
+
+def content_delta(base: str, text: str) -> Optional[str]:
+    """Build a diff-match-patch delta turning base into text.
+
+    Args:
+        base: Content the delta applies to (the remote body)
+        text: New content
+
+    Returns:
+        Delta string, or None if the text contains characters outside the
+        BMP (character counts would be ambiguous)
+    """
+    if _has_astral(base) or _has_astral(text):
+        return None
+
+    prefix = len(os.path.commonprefix([base, text]))
+    # 末尾は先頭の共通部分より後ろだけで比べる（重ならないように）
+    suffix = len(os.path.commonprefix([base[prefix:][::-1], text[prefix:][::-1]]))
+
+    ops = ['=%d' % prefix] if prefix else []
+    ops.extend(_line_ops(base[prefix:len(base) - suffix], text[prefix:len(text) - suffix]))
+    if suffix:
+        ops.append('=%d' % suffix)
+    return '\t'.join(ops)
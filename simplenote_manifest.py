@@ -0,0 +1,208 @@
+"""
+Simplenote Local Manifest
+Caches the parsed metadata of local .md files between runs.
+
+Entries are keyed by path (relative to the backup directory) and validated
+against the file's (size, mtime_ns, inode) stat tuple; a file is only opened
+and parsed again when that tuple changes. The manifest is stored in
+`manifest.json` in the cache directory (see simplenote_state) and shared by
+pull, import and classify.
+
+Within one process the manifest also serves as the local snapshot: scan()
+walks the tree once, and the phases of a sync run report their moves and
+writes (move/record/forget) so later phases see the current tree without
+walking it again.
+
+lookup_many() stats and parses a batch of files on a thread pool (see
+simplenote_scan); cache updates are applied afterwards on the calling thread.
+
+Every path whose entry changed during the run is remembered; save() hands
+them to the search index (simplenote_search) if one has been built.
+
+Entry format:
+    {'stat': [size, mtime_ns, inode], 'note_id': ..., 'tags': [...],
+     'system_tags': [...], 'title': ..., 'content_hash': ...}
+"""
+import os
+import glob
+
+from simplenote_metadata import parse_note_text, content_hash
+from simplenote_state import load_cache, save_cache
+from simplenote_scan import map_files, SCAN_WORKERS
+from simplenote_search import SearchIndex, index_exists
+
+MANIFEST_STATE = 'manifest.json'
+MANIFEST_VERSION = 1
+
+
+def _stat_key(st) -> list:
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def build_entry(text: str) -> dict:
+    """Build manifest metadata from raw file text (without the stat key)."""
+    content, tags, system_tags, note_id = parse_note_text(text)
+    return {
+        'note_id': note_id,
+        'tags': tags,
+        'system_tags': system_tags,
+        'title': content.split('\n')[0] if content else '',
+        'content_hash': content_hash(content)
+    }
+
+
+class NoteManifest:
+    """Stat-validated cache of parsed note metadata for one backup directory."""
+
+    def __init__(self, backup_dir: str):
+        self.backup_dir = backup_dir
+        data = load_cache(backup_dir, MANIFEST_STATE)
+        if data and data.get('version') == MANIFEST_VERSION:
+            self.files = data.get('files', {})
+        else:
+            self.files = {}
+        self.dirty = False
+        self.paths = None  # set of .md paths once scan() has run
+        self.changed = set()  # keys written/moved/removed/re-parsed in this run
+
+    def _key(self, filepath: str) -> str:
+        return os.path.relpath(filepath, self.backup_dir)
+
+    def scan(self) -> list:
+        """Return all .md paths under the backup directory, sorted.
+
+        The tree is walked only on the first call; afterwards the in-memory
+        path set (kept current by move/record/forget) is returned. Entries of
+        files that no longer exist are pruned.
+        """
+        if self.paths is None:
+            md_files = glob.glob(os.path.join(self.backup_dir, '**/*.md'), recursive=True)
+            self.paths = {os.path.normpath(p) for p in md_files}
+            self.prune(self.paths)
+        return sorted(self.paths)
+
+    def root_files(self) -> list:
+        """Return the .md filenames directly in the backup directory."""
+        if self.paths is None:
+            return [f for f in os.listdir(self.backup_dir)
+                    if f.endswith('.md') and not os.path.isdir(os.path.join(self.backup_dir, f))]
+        root = os.path.normpath(self.backup_dir)
+        return [os.path.basename(p) for p in self.paths if os.path.dirname(p) == root]
+
+    def refresh_paths(self, filepaths) -> None:
+        """Update the scanned path set for files that appeared or disappeared.
+
+        Used when changes are reported by filesystem events instead of a walk.
+        A path that no longer exists is forgotten, together with everything
+        below it if it was a directory.
+        """
+        if self.paths is None:
+            return
+        for filepath in filepaths:
+            filepath = os.path.normpath(filepath)
+            if os.path.isfile(filepath):
+                self.paths.add(filepath)
+            elif not os.path.exists(filepath):
+                prefix = filepath + os.sep
+                for path in [p for p in self.paths if p == filepath or p.startswith(prefix)]:
+                    self.forget(path)
+
+    def lookup(self, filepath: str) -> dict:
+        """Return metadata for a file, re-parsing it only if its stat changed.
+
+        Args:
+            filepath: Path to the markdown file
+
+        Returns:
+            Entry dict (note_id, tags, system_tags, title, content_hash)
+        """
+        entry, fresh = self._load(filepath)
+        if fresh:
+            self._store(self._key(filepath), entry)
+        return entry
+
+    def lookup_many(self, filepaths, workers: int = SCAN_WORKERS) -> list:
+        """Look up many files concurrently.
+
+        Args:
+            filepaths: Paths of markdown files
+            workers: Maximum number of files stat'ed/read at the same time
+
+        Returns:
+            List of (filepath, entry) sorted by filepath
+        """
+        results = []
+        for filepath, (entry, fresh) in map_files(self._load, filepaths, workers):
+            if fresh:
+                self._store(self._key(filepath), entry)
+            results.append((filepath, entry))
+        return results
+
+    def _load(self, filepath: str) -> tuple:
+        """Return (entry, fresh) without modifying the cache (thread-safe)."""
+        stat = _stat_key(os.stat(filepath))
+        entry = self.files.get(self._key(filepath))
+        if entry is not None and entry['stat'] == stat:
+            return entry, False
+
+        with open(filepath, 'r', encoding='utf-8') as f:
+            text = f.read()
+        entry = build_entry(text)
+        entry['stat'] = stat
+        return entry, True
+
+    def _store(self, key: str, entry: dict) -> None:
+        self.files[key] = entry
+        self.changed.add(key)
+        self.dirty = True
+
+    def record(self, filepath: str, text: str) -> dict:
+        """Store metadata for a file that was just written with the given text."""
+        entry = build_entry(text)
+        entry['stat'] = _stat_key(os.stat(filepath))
+        self._store(self._key(filepath), entry)
+        if self.paths is not None:
+            self.paths.add(os.path.normpath(filepath))
+        return entry
+
+    def move(self, src: str, dst: str) -> None:
+        """Carry an entry over to a renamed file (rename keeps the stat tuple)."""
+        entry = self.files.pop(self._key(src), None)
+        if entry is not None:
+            self._store(self._key(dst), entry)
+        self.changed.add(self._key(src))
+        if self.paths is not None:
+            self.paths.discard(os.path.normpath(src))
+            self.paths.add(os.path.normpath(dst))
+
+    def forget(self, filepath: str) -> None:
+        """Drop the entry of a removed file."""
+        if self.files.pop(self._key(filepath), None) is not None:
+            self.dirty = True
+        self.changed.add(self._key(filepath))
+        if self.paths is not None:
+            self.paths.discard(os.path.normpath(filepath))
+
+    def prune(self, filepaths) -> None:
+        """Keep only the entries for the given paths (after a full tree scan)."""
+        keep = {self._key(p) for p in filepaths}
+        stale = [key for key in self.files if key not in keep]
+        for key in stale:
+            del self.files[key]
+        self.changed.update(stale)
+        if stale:
+            self.dirty = True
+
+    def save(self) -> None:
+        """Write the manifest back if anything changed and update the search index."""
+        if self.dirty:
+            save_cache(self.backup_dir, MANIFEST_STATE,
+                       {'version': MANIFEST_VERSION, 'files': self.files})
+            self.dirty = False
+        if self.changed and index_exists(self.backup_dir):
+            index = SearchIndex(self.backup_dir)
+            try:
+                index.update(self.changed, self.files)
+            finally:
+                index.close()
+        self.changed = set()
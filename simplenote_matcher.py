@@ -0,0 +1,118 @@
+"""
+Simplenote Keyword Matcher
+Scores tags by keyword occurrence with a single pass over the text.
+
+The keyword rules ({tag: [keyword, ...]}) are compiled once into an
+Aho-Corasick automaton over the lowercased keywords. Scanning a text visits
+each character once, whatever the number of keywords, and yields the set of
+keywords that occur in it; a tag's score is the number of its keywords found,
+exactly as with one `keyword.lower() in text` check per keyword.
+
+No keyword can span a character that appears in no keyword, so the text is
+first cut (in C, with one regex) into runs of keyword characters and each
+distinct run is scanned once; repeated words cost nothing extra.
+"""
+import re
+from collections import deque
+
+
+class KeywordMatcher:
+    """Multi-pattern matcher compiled from tag keyword rules.
+
+    Args:
+        rules: Mapping of tag -> list of keywords (matched case-insensitively
+            via str.lower(); a keyword listed twice for a tag counts twice)
+    """
+
+    def __init__(self, rules: dict):
+        self.tags = list(rules)
+
+        # lowercased keyword -> {tag index: weight}
+        weights = {}
+        for i, tag in enumerate(self.tags):
+            for keyword in rules[tag]:
+                tag_weights = weights.setdefault(keyword.lower(), {})
+                tag_weights[i] = tag_weights.get(i, 0) + 1
+        self.keywords = list(weights.items())
+
+        # Trie of the keywords
+        self._goto = [{}]
+        self._out = [[]]
+        for keyword_id, (keyword, _) in enumerate(self.keywords):
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._out.append([])
+                    self._goto[state][ch] = nxt
+                state = nxt
+            self._out[state].append(keyword_id)
+
+        # Failure links (breadth-first), merging outputs along the chain
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+        alphabet = sorted({ch for keyword, _ in self.keywords for ch in keyword})
+        self._runs = re.compile('[%s]+' % ''.join(re.escape(ch) for ch in alphabet)) if alphabet else None
+
+    def find(self, text: str) -> set:
+        """Return the ids (indexes into self.keywords) of keywords in text.
+
+        Args:
+            text: Already lowercased text
+
+        Returns:
+            Set of keyword ids occurring at least once
+        """
+        found = set(self._out[0])  # empty keyword matches everything
+        if self._runs is not None:
+            for run in set(self._runs.findall(text)):
+                found.update(self._scan(run))
+        return found
+
+    def _scan(self, text: str) -> set:
+        """Run the automaton over text and return the keyword ids seen."""
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        found = set()
+        state = 0
+        for ch in text:
+            while True:
+                nxt = goto[state].get(ch)
+                if nxt is not None:
+                    state = nxt
+                    break
+                if not state:
+                    break
+                state = fail[state]
+            if out[state]:
+                found.update(out[state])
+        return found
+
+    def scores(self, text: str) -> dict:
+        """Score every tag against text.
+
+        Args:
+            text: Already lowercased text
+
+        Returns:
+            {tag: number of its keywords found} for tags with a non-zero
+            score, in rule order
+        """
+        totals = [0] * len(self.tags)
+        for keyword_id in self.find(text):
+            for i, weight in self.keywords[keyword_id][1].items():
+                totals[i] += weight
+        return {self.tags[i]: score for i, score in enumerate(totals) if score}
@@ -5,6 +5,7 @@ Handles ID comments embedded in markdown files for reliable sync.
 Format: <!-- simplenote-id: 9f8a7c6b5e4d3c2b1a0f9e8d7c6b5a4f -->
 """
 import re
+import hashlib
 from typing import Optional
 
 # Pattern matches: <!-- simplenote-id: <32 hex chars> -->
@@ -100,3 +101,74 @@ def build_content_with_id(note_id: str, content: str) -> str:
     clean_content = get_content_without_id(content)
     id_comment = f"<!-- simplenote-id: {note_id} -->\n"
     return id_comment + clean_content
+
+
+def content_hash(content: str) -> str:
+    """Return a stable hash of note content for equality lookups.
+
+    Args:
+        content: Note content (without ID comment and tag lines)
+
+    Returns:
+        SHA-1 hex digest of the UTF-8 encoded content
+    """
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def parse_note_text(text: str) -> tuple:
+    """Split raw file text into note content, tags, system tags and ID.
+
+    The `Tags:` / `System tags:` footer lines and the ID comment are removed
+    from the content, and trailing empty lines are stripped, so the result
+    compares equal to the remote note content.
+
+    Args:
+        text: Raw file content as string
+
+    Returns:
+        (content, tags, system_tags, note_id)
+    """
+    note_id = extract_id_from_content(text)
+    lines = get_content_without_id(text).split('\n')
+    clean_lines = []
+    tags = []
+    system_tags = []
+
+    for line in lines:
+        if line.startswith('Tags: '):
+            tag_str = line[6:].strip()
+            if tag_str:
+                tags = [t.strip() for t in tag_str.split(',') if t.strip()]
+        elif line.startswith('System tags: '):
+            tag_str = line[13:].strip()
+            if tag_str:
+                system_tags = [t.strip() for t in tag_str.split(',') if t.strip()]
+        else:
+            clean_lines.append(line)
+
+    while clean_lines and clean_lines[-1] == '':
+        clean_lines.pop()
+
+    return '\n'.join(clean_lines), tags, system_tags, note_id
+
+
+def build_file_content(note_id: str, content: str, tags: list, system_tags: list) -> str:
+    """Build the backup file text for a remote note.
+
+    Format: ID comment, note content, then a `Tags:` line (always) and a
+    `System tags:` line (only if there are any).
+
+    Args:
+        note_id: The 32-character hex note ID
+        content: The note content
+        tags: Note tags
+        system_tags: Note system tags (e.g. pinned)
+
+    Returns:
+        File content as string
+    """
+    text = build_content_with_id(note_id, content) + "\n"
+    text += "Tags: %s\n" % ", ".join(tags)
+    if system_tags:
+        text += "System tags: %s\n" % ", ".join(system_tags)
+    return text
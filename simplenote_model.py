@@ -0,0 +1,185 @@
+"""
+Simplenote Tag Model
+Learns tags from the notes already filed in tag directories.
+
+Every `<backup_dir>/<tag>/*.md` file is a labeled example. Notes are turned
+into hashed character n-gram counts (1- to 3-grams of the lowercased text),
+which needs no tokenizer and works for Japanese as well as English, and a
+multinomial naive Bayes model is fitted per tag.
+
+Naive Bayes only needs per-tag feature sums, so the model is updated one tag
+directory at a time: each tag stores a fingerprint of its files (path and
+content hash from the manifest) and only tags whose directory changed are
+re-read. The model is cached in `tag-model.npz` in the cache directory
+(see simplenote_state).
+
+Feature hashing and prediction are vectorized with NumPy over all notes of a
+batch at once. NumPy is optional; callers should check `np is not None`.
+"""
+import os
+import json
+import hashlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from simplenote_state import get_cache_path
+
+MODEL_STATE = 'tag-model.npz'
+MODEL_VERSION = 1
+NGRAM_SIZES = (1, 2, 3)
+HASH_BITS = 18
+ALPHA = 0.1             # additive smoothing
+MIN_CONFIDENCE = 0.6    # minimum posterior probability to accept a prediction
+
+# per-position multipliers of the n-gram hash (odd 64-bit constants)
+_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9)
+
+
+def _codepoints(texts: list) -> tuple:
+    """Concatenate texts into one code point array.
+
+    Returns:
+        (codes, doc_ids) - doc_ids[i] is the index of the text codes[i] belongs to
+    """
+    encoded = [t.lower().encode('utf-32-le') for t in texts]
+    codes = np.frombuffer(b''.join(encoded), dtype=np.uint32).astype(np.uint64)
+    lengths = np.array([len(e) // 4 for e in encoded], dtype=np.int64)
+    doc_ids = np.repeat(np.arange(len(texts)), lengths)
+    return codes, doc_ids
+
+
+def hash_features(texts: list) -> tuple:
+    """Hash the character n-grams of a batch of texts.
+
+    Args:
+        texts: Note texts
+
+    Returns:
+        (doc_ids, features) - parallel arrays with one entry per n-gram
+        occurrence: the text index and the hashed feature (< 2**HASH_BITS)
+    """
+    codes, doc_ids = _codepoints(texts)
+    all_docs = []
+    all_features = []
+    with np.errstate(over='ignore'):
+        for n in NGRAM_SIZES:
+            count = len(codes) - n + 1
+            if count <= 0:
+                continue
+            h = np.full(count, n, dtype=np.uint64)
+            for k in range(n):
+                h += codes[k:k + count] * np.uint64(_MULTIPLIERS[k])
+            # drop n-grams that cross the boundary between two texts
+            valid = doc_ids[:count] == doc_ids[n - 1:n - 1 + count]
+            h = h[valid]
+            h ^= h >> np.uint64(29)
+            h *= np.uint64(0xBF58476D1CE4E5B9)
+            h ^= h >> np.uint64(32)
+            all_docs.append(doc_ids[:count][valid])
+            all_features.append((h >> np.uint64(64 - HASH_BITS)).astype(np.int64))
+    if not all_docs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(all_docs), np.concatenate(all_features)
+
+
+def tag_fingerprint(entries: list) -> str:
+    """Fingerprint a tag directory from its (relpath, content_hash) pairs."""
+    return hashlib.sha1(json.dumps(sorted(entries), ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class TagModel:
+    """Multinomial naive Bayes over hashed character n-grams.
+
+    Per tag it keeps the summed feature counts, the number of documents and
+    the fingerprint of the directory the counts were computed from.
+    """
+
+    def __init__(self):
+        self.tags = []
+        self.counts = np.zeros((0, 1 << HASH_BITS), dtype=np.float32)
+        self.docs = np.zeros(0, dtype=np.int64)
+        self.fingerprints = {}
+
+    @classmethod
+    def load(cls, backup_dir: str) -> 'TagModel':
+        """Load the cached model (an empty model if missing or outdated)."""
+        model = cls()
+        path = get_cache_path(backup_dir, MODEL_STATE)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data['meta']))
+                if meta.get('version') != MODEL_VERSION or meta.get('hash_bits') != HASH_BITS:
+                    return model
+                model.tags = meta['tags']
+                model.fingerprints = meta['fingerprints']
+                model.counts = data['counts']
+                model.docs = data['docs']
+        except (IOError, OSError, ValueError, KeyError):
+            return cls()
+        return model
+
+    def save(self, backup_dir: str) -> None:
+        """Atomically write the model to the cache directory."""
+        path = get_cache_path(backup_dir, MODEL_STATE)
+        meta = {'version': MODEL_VERSION, 'hash_bits': HASH_BITS,
+                'tags': self.tags, 'fingerprints': self.fingerprints}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(meta, ensure_ascii=False)),
+                                counts=self.counts, docs=self.docs)
+        os.replace(tmp_path, path)
+
+    def set_tag(self, tag: str, texts: list, fingerprint: str) -> None:
+        """Replace the statistics of one tag with those of the given texts."""
+        if tag not in self.tags:
+            self.tags.append(tag)
+            self.counts = np.vstack([self.counts, np.zeros((1, 1 << HASH_BITS), dtype=np.float32)])
+            self.docs = np.append(self.docs, 0)
+        i = self.tags.index(tag)
+        _, features = hash_features(texts)
+        self.counts[i] = np.bincount(features, minlength=1 << HASH_BITS)
+        self.docs[i] = len(texts)
+        self.fingerprints[tag] = fingerprint
+
+    def remove_tag(self, tag: str) -> None:
+        """Drop a tag whose directory no longer exists."""
+        i = self.tags.index(tag)
+        del self.tags[i]
+        self.counts = np.delete(self.counts, i, axis=0)
+        self.docs = np.delete(self.docs, i)
+        self.fingerprints.pop(tag, None)
+
+    def predict(self, texts: list, allowed_tags=None) -> list:
+        """Predict a tag for each text.
+
+        Args:
+            texts: Note texts
+            allowed_tags: Only consider these tags (default: all trained tags)
+
+        Returns:
+            List of (tag, probability) per text; tag is None when no tag is
+            allowed or the model is empty
+        """
+        usable = [i for i, tag in enumerate(self.tags)
+                  if self.docs[i] > 0 and (allowed_tags is None or tag in allowed_tags)]
+        if not texts or not usable:
+            return [(None, 0.0)] * len(texts)
+
+        counts = self.counts[usable].astype(np.float64)
+        log_prob = np.log(counts + ALPHA) - np.log(counts.sum(axis=1, keepdims=True) + ALPHA * counts.shape[1])
+        log_prior = np.log(self.docs[usable] / self.docs[usable].sum())
+
+        doc_ids, features = hash_features(texts)
+        scores = np.empty((len(usable), len(texts)))
+        for row in range(len(usable)):
+            scores[row] = log_prior[row] + np.bincount(doc_ids, weights=log_prob[row][features],
+                                                       minlength=len(texts))
+
+        scores -= scores.max(axis=0)
+        probs = np.exp(scores)
+        probs /= probs.sum(axis=0)
+        best = probs.argmax(axis=0)
+        return [(self.tags[usable[b]], float(probs[b, j])) for j, b in enumerate(best)]
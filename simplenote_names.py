@@ -0,0 +1,130 @@
+"""
+Simplenote Filename Allocation
+Hands out unique `name.md` / `name_1.md` / ... paths without probing the
+filesystem once per counter value.
+
+Each directory is listed once with os.scandir; after that the allocator
+keeps the set of taken names in memory and remembers, per base name, the
+counter to continue from, so the N-th duplicate title costs O(1) amortized
+instead of N stat calls. The first free counter is still returned, as with
+the old os.path.exists loops.
+
+A listing is only valid for one run: files created by the user or another
+process later are not in it. reset_names() starts a new run (pull, classify,
+backup, ...) with fresh listings, and every name is still checked with one
+os.path.exists before it is handed out, so an existing file is never
+returned.
+
+Names are compared NFC-normalized and case-folded, because the default macOS
+filesystems treat `TODO.md`/`todo.md` and NFC/NFD forms as the same file.
+"""
+import os
+import unicodedata
+
+
+def _name_key(name: str) -> str:
+    return unicodedata.normalize('NFC', name).casefold()
+
+
+class NameAllocator:
+    """Per-directory allocator of unique file names.
+
+    Args:
+        scan: List directories on first use. Pass False to allocate names in a
+            purely in-memory namespace (e.g. paths inside an archive).
+    """
+
+    def __init__(self, scan: bool = True):
+        self.scan = scan
+        self._names = {}  # dir -> set of taken name keys
+        self._hints = {}  # dir -> {(base key, ext): next counter to try}
+
+    def _taken(self, dir_key: str) -> set:
+        names = self._names.get(dir_key)
+        if names is None:
+            names = set()
+            if self.scan:
+                try:
+                    with os.scandir(dir_key) as entries:
+                        for entry in entries:
+                            names.add(_name_key(entry.name))
+                except (FileNotFoundError, NotADirectoryError):
+                    pass
+            self._names[dir_key] = names
+        return names
+
+    def allocate(self, dir_path: str, base_name: str, ext: str) -> str:
+        """Reserve and return a unique path `dir/base.ext` or `dir/base_k.ext`.
+
+        Args:
+            dir_path: Target directory (need not exist yet)
+            base_name: File name without extension
+            ext: Extension including the dot (e.g. '.md')
+
+        Returns:
+            Path that does not collide with existing or already allocated files
+        """
+        dir_key = os.path.normpath(dir_path)
+        names = self._taken(dir_key)
+
+        name = base_name + ext
+        if self._free(dir_path, names, name):
+            names.add(_name_key(name))
+            return os.path.join(dir_path, name)
+
+        hints = self._hints.setdefault(dir_key, {})
+        hint_key = (_name_key(base_name), ext)
+        counter = hints.get(hint_key, 1)
+        while not self._free(dir_path, names, f"{base_name}_{counter}{ext}"):
+            counter += 1
+        hints[hint_key] = counter + 1
+
+        name = f"{base_name}_{counter}{ext}"
+        names.add(_name_key(name))
+        return os.path.join(dir_path, name)
+
+    def _free(self, dir_path: str, names: set, name: str) -> bool:
+        """True if name is neither allocated nor (when scanning) on disk."""
+        if _name_key(name) in names:
+            return False
+        if self.scan and os.path.exists(os.path.join(dir_path, name)):
+            # 一覧の取得後に作られたファイル
+            names.add(_name_key(name))
+            return False
+        return True
+
+    def release(self, path: str) -> None:
+        """Mark a path as free again (the file was moved away or deleted)."""
+        dir_key = os.path.normpath(os.path.dirname(path))
+        names = self._names.get(dir_key)
+        if names is not None:
+            names.discard(_name_key(os.path.basename(path)))
+            # 空いた番号を再利用できるようにヒントを破棄
+            self._hints.pop(dir_key, None)
+
+
+_allocator = None
+
+
+def reset_names() -> None:
+    """Start a new run: forget all directory listings of the shared allocator."""
+    global _allocator
+    _allocator = NameAllocator()
+
+
+def unique_path(dir_path: str, base_name: str, ext: str) -> str:
+    """Allocate a unique path using the allocator of the current run."""
+    if _allocator is None:
+        reset_names()
+    return _allocator.allocate(dir_path, base_name, ext)
+
+
+def path_key(path: str) -> tuple:
+    """Key under which the allocator treats two paths as the same file."""
+    return os.path.normpath(os.path.dirname(path)), _name_key(os.path.basename(path))
+
+
+def release_path(path: str) -> None:
+    """Release a path in the allocator of the current run."""
+    if _allocator is not None:
+        _allocator.release(path)
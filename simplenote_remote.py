@@ -0,0 +1,756 @@
+"""
+Simplenote Remote Utilities
+Fetches notes from the Simperium `note` bucket.
+
+The remote snapshot is a local mirror of the bucket index plus the change
+version (cv) it was taken at. Later runs only request the documents changed
+since that cv. When the cursor is no longer accepted, the index is paged
+without data (ids and versions only) and compared with the versions in the
+snapshot; only new or changed notes are then fetched, with bounded parallel
+GETs (fetch_notes). A full download with data is the last resort.
+
+iter_remote_snapshot() hands the notes out page by page while the index is
+still downloading, so a caller can work on one page while the next arrives;
+fetch_remote_snapshot() collects them into one list.
+
+Notes are held as compact RemoteNote records (id, version, tags, flags,
+title and content hash). Bodies are not kept in memory: while the index
+pages arrive they are written to `remote-bodies.db` (SQLite, in the cache
+directory next to the snapshot; see simplenote_state) and RemoteNote.content
+reads one back when a note is actually written. Memory therefore grows with the number of notes, not with their size.
+The fetch functions take the body store as `bodies`; the caller opens it
+(`with NoteBodies(backup_dir) as bodies:`) and closes it once it is done
+with the records. Without one they open their own, which stays open as long
+as the returned records exist.
+
+with_retry() wraps a SimperiumApi so every bucket call goes through a shared
+retry layer: exponential backoff with jitter for transient failures (network
+errors, 429, 5xx), Retry-After support, a process-wide request rate limit,
+and bulk_post batches that are split and resent when they fail partway.
+
+bulk_post_deltas() sends content updates as diff-match-patch deltas
+(simplenote_delta) against the version of the note they were based on. The
+jsondiff change objects go to the bucket's /changes endpoint, the same
+request simperium's bulk_post() makes; notes without a known base, and
+notes the server rejects (e.g. the base version is no longer current), are
+sent with their full content instead.
+
+The changes feed (wait_for_changes) is a long poll on the bucket's change
+cursor: it returns as soon as a note changes after the given cv. The
+affected notes are then fetched one by one and merged into the snapshot
+(apply_changes), so a running process follows remote edits without paging
+the index again.
+
+The API endpoint can be pointed elsewhere (e.g. a local stand-in server) with
+SIMPERIUM_URL=http://127.0.0.1:8000; see api_options().
+"""
+import os
+import time
+import uuid
+import random
+import socket
+import sqlite3
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import requests
+
+from simplenote_metadata import content_hash
+from simplenote_delta import content_delta
+from simplenote_state import load_cache, save_cache, get_cache_path
+
+SNAPSHOT_STATE = 'remote-notes.json'
+SNAPSHOT_VERSION = 2
+BODIES_STATE = 'remote-bodies.db'
+
+RETRY_ATTEMPTS = 6              # 1回目 + リトライ5回
+RETRY_BASE_DELAY = 1.0          # 秒
+RETRY_MAX_DELAY = 60.0          # 秒
+MAX_REQUESTS_PER_SECOND = 10.0
+CHANGES_TIMEOUT = 60            # 秒（long poll の待ち時間）
+FETCH_WORKERS = 8               # 個別取得（GET）の同時実行数
+MAX_TARGETED_FETCHES = 100      # これより多く変わっていればデータ付きの全件取得に切り替え
+
+
+def api_options() -> dict:
+    """Return SimperiumApi keyword options for the endpoint in SIMPERIUM_URL.
+
+    Returns:
+        {'scheme': ..., 'host': ...} or {} to use the default API host
+    """
+    url = os.environ.get('SIMPERIUM_URL')
+    if not url:
+        return {}
+    parts = urlsplit(url if '://' in url else 'https://' + url)
+    return {'scheme': parts.scheme, 'host': parts.netloc}
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing requests at least 1/rate seconds apart.
+
+    pause() blocks all callers until a given time (used for 429 Retry-After).
+    """
+
+    def __init__(self, rate: float = MAX_REQUESTS_PER_SECOND):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time)
+            self.next_time = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, seconds: float) -> None:
+        with self.lock:
+            self.next_time = max(self.next_time, time.monotonic() + seconds)
+
+
+def _status_code(exc) -> Optional[int]:
+    """Return the HTTP status of an exception (urllib or requests style)."""
+    code = getattr(exc, 'code', None)
+    if isinstance(code, int):
+        return code
+    response = getattr(exc, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def _retry_after(exc) -> Optional[float]:
+    """Return the Retry-After delay (seconds) sent with an HTTP error."""
+    headers = getattr(exc, 'headers', None)
+    if headers is None:
+        headers = getattr(getattr(exc, 'response', None), 'headers', None)
+    value = headers.get('Retry-After') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient(exc) -> bool:
+    """True for failures worth retrying: network errors, timeouts, 429 and 5xx."""
+    code = _status_code(exc)
+    if code is not None:
+        return code == 429 or code >= 500
+    return isinstance(exc, (OSError, TimeoutError, ConnectionError))
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given attempt (0-based)."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+def call_with_retry(func, *args, limiter: Optional[RateLimiter] = None,
+                    attempts: int = RETRY_ATTEMPTS, **kwargs):
+    """Call func, retrying transient failures with backoff.
+
+    Args:
+        func: Function performing one request
+        limiter: RateLimiter to respect before each attempt
+        attempts: Maximum number of attempts
+
+    Returns:
+        func's return value (the last error is re-raised when attempts run out)
+    """
+    for attempt in range(attempts):
+        if limiter is not None:
+            limiter.wait()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if not is_transient(e) or attempt == attempts - 1:
+                raise
+            delay = backoff_delay(attempt)
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+                if limiter is not None and _status_code(e) == 429:
+                    limiter.pause(retry_after)
+            time.sleep(delay)
+
+
+class RetryingBucket:
+    """Wraps a simperium Bucket; each call goes through call_with_retry()."""
+
+    def __init__(self, bucket, limiter: RateLimiter):
+        self.bucket = bucket
+        self.limiter = limiter
+
+    def __getattr__(self, name):
+        return getattr(self.bucket, name)
+
+    def index(self, **kwargs):
+        return call_with_retry(self.bucket.index, limiter=self.limiter, **kwargs)
+
+    def get(self, item, **kwargs):
+        return call_with_retry(self.bucket.get, item, limiter=self.limiter, **kwargs)
+
+    def post(self, item, data, **kwargs):
+        return call_with_retry(self.bucket.post, item, data, limiter=self.limiter, **kwargs)
+
+    def changes(self, **kwargs):
+        return call_with_retry(self.bucket.changes, limiter=self.limiter, **kwargs)
+
+    def post_changes(self, changes):
+        """Send jsondiff change objects (see send_changes).
+
+        A retried request resends the same ccids, so changes the server
+        already applied are not applied twice.
+        """
+        return call_with_retry(send_changes, self.bucket, changes, limiter=self.limiter)
+
+    def bulk_post(self, bulk_data, wait=True):
+        """bulk_post that splits failing batches and resends transient per-note errors.
+
+        A request that still fails after retries is split in half and each
+        half is sent separately; a single note that fails becomes an
+        {'id': ..., 'error': ...} entry, so callers keep per-note accounting.
+        """
+        try:
+            response = call_with_retry(self.bucket.bulk_post, bulk_data, wait=wait,
+                                       limiter=self.limiter)
+        except Exception as e:
+            if not is_transient(e) or len(bulk_data) == 1:
+                if len(bulk_data) == 1:
+                    return [{'id': note_id, 'error': str(e)} for note_id in bulk_data]
+                raise
+            items = list(bulk_data.items())
+            half = len(items) // 2
+            return (self.bulk_post(dict(items[:half]), wait=wait) +
+                    self.bulk_post(dict(items[half:]), wait=wait))
+
+        # 一時的なエラー（429/5xx）になったノートだけを再送
+        failed = {}
+        results = []
+        for r in response:
+            error = r.get('error') if isinstance(r, dict) else None
+            if isinstance(error, int) and (error == 429 or error >= 500) and r.get('id') in bulk_data:
+                failed[r['id']] = bulk_data[r['id']]
+            else:
+                results.append(r)
+        if failed and len(failed) < len(bulk_data):
+            results.extend(self.bulk_post(failed, wait=wait))
+        elif failed:
+            # バッチ全体が一時エラー → 待ってから1回だけ送り直す
+            time.sleep(backoff_delay(1))
+            results.extend(call_with_retry(self.bucket.bulk_post, failed, wait=wait,
+                                           limiter=self.limiter))
+        return results
+
+
+class RetryingApi:
+    """SimperiumApi wrapper exposing a RetryingBucket as `note`."""
+
+    def __init__(self, api, rate: float = MAX_REQUESTS_PER_SECOND):
+        self.api = api
+        self.note = RetryingBucket(api.note, RateLimiter(rate))
+
+    def __getattr__(self, name):
+        return getattr(self.api, name)
+
+
+def with_retry(api, rate: float = MAX_REQUESTS_PER_SECOND):
+    """Wrap a SimperiumApi with the shared retry layer (idempotent)."""
+    if isinstance(api, RetryingApi):
+        return api
+    return RetryingApi(api, rate)
+
+
+def send_changes(bucket, changes: list) -> list:
+    """POST jsondiff change objects to a bucket's /changes endpoint.
+
+    This is the request simperium's Bucket.bulk_post() makes, but with the
+    change objects given by the caller, so they can carry `d` (diff)
+    operations and the source version (`sv`) they apply to. The call waits
+    until the server has applied them.
+
+    Args:
+        bucket: simperium Bucket
+        changes: Change objects ({'id', 'o': 'M', 'ccid', 'sv', 'v': {...}})
+
+    Returns:
+        Change responses; rejected changes carry an 'error' code
+    """
+    url = bucket._build_url('%s/%s/changes' % (bucket.appname, bucket.bucket))
+    r = requests.post(url, json=changes, headers=bucket._auth_header(),
+                      params={'clientid': bucket.clientid, 'wait': '1'})
+    r.raise_for_status()
+    return r.json()
+
+
+def _delta_base(note) -> Optional[tuple]:
+    """Return (version, content) of a remote note if both are known."""
+    if note is None or note.v is None or note.bodies is None:
+        return None
+    try:
+        return note.v, note.content
+    except KeyError:
+        return None
+
+
+def bulk_post_deltas(api, bulk_data: dict, bases: dict) -> list:
+    """bulk_post that sends content as a delta against the remote base version.
+
+    A note is sent as a diff when its base (version and body) is known and
+    the delta is smaller than the content; its other fields are set as in
+    bulk_post. All other notes, and diffs the server rejects, are sent with
+    bulk_post (full content).
+
+    Args:
+        api: SimperiumApi wrapped by with_retry()
+        bulk_data: {note_id: data} as for bulk_post
+        bases: {note_id: RemoteNote} the updates were made against
+
+    Returns:
+        Change responses as returned by bulk_post
+    """
+    changes = []
+    full = {}
+    for note_id, data in bulk_data.items():
+        base = _delta_base(bases.get(note_id)) if 'content' in data else None
+        delta = content_delta(base[1], data['content']) if base else None
+        if delta is None or len(delta) >= len(data['content'].encode('utf-8')):
+            full[note_id] = data
+            continue
+        fields = {key: {'o': '+', 'v': value} for key, value in data.items() if key != 'content'}
+        fields['content'] = {'o': 'd', 'v': delta}
+        changes.append({'id': note_id, 'o': 'M', 'ccid': uuid.uuid4().hex, 'sv': base[0], 'v': fields})
+
+    results = []
+    if changes:
+        try:
+            responses = api.note.post_changes(changes)
+        except Exception as exc:
+            # サーバーが拒否した場合（HTTPエラー）だけ本文全体の送信に切り替える
+            if _status_code(exc) is None:
+                raise
+            responses = [{'id': change['id'], 'error': _status_code(exc)} for change in changes]
+        for r in responses:
+            if 'error' in r and r.get('id') in bulk_data:
+                # 基準バージョンが古い・差分を適用できないなど → 本文全体で送り直す
+                full[r['id']] = bulk_data[r['id']]
+            else:
+                results.append(r)
+    if full:
+        results.extend(api.note.bulk_post(full, wait=True))
+    return results
+
+
+def snapshot_versions(backup_dir: str) -> dict:
+    """Return {note_id: (version, content_hash)} from the stored snapshot."""
+    snapshot = load_cache(backup_dir, SNAPSHOT_STATE)
+    if not snapshot or snapshot.get('version') != SNAPSHOT_VERSION:
+        return {}
+    return {row[0]: (row[1], row[7]) for row in snapshot['notes']}
+
+
+def iter_index_pages(api, mark=None, **kwargs):
+    """Yield the note index page by page.
+
+    As soon as a page arrives, the request for the next page is started in a
+    background thread, so the caller can process (e.g. write) one page while
+    the next one is downloading. At most two pages are held at a time.
+
+    Args:
+        api: SimperiumApi instance
+        mark: Page cursor to start from (to resume an interrupted paging)
+        **kwargs: Extra arguments for api.note.index (data, since, ...)
+
+    Yields:
+        Raw index responses ({'index': [...], 'current': ..., 'mark': ...})
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        if mark:
+            future = executor.submit(api.note.index, mark=mark, **kwargs)
+        else:
+            future = executor.submit(api.note.index, **kwargs)
+        while future is not None:
+            dump = future.result()
+            if 'mark' in dump:
+                future = executor.submit(api.note.index, mark=dump['mark'], **kwargs)
+            else:
+                future = None
+            yield dump
+
+
+class NoteBodies:
+    """On-disk store of remote note bodies, keyed by note id (thread-safe).
+
+    Usable as a context manager; close() releases the SQLite connection.
+    """
+
+    def __init__(self, backup_dir: str):
+        path = get_cache_path(backup_dir, BODIES_STATE)
+        self.existed = os.path.exists(path)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS bodies (id TEXT PRIMARY KEY, content TEXT NOT NULL)')
+        self.lock = threading.Lock()
+
+    def __enter__(self) -> 'NoteBodies':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
+
+    def get(self, note_id: str) -> str:
+        """Return the body of a note.
+
+        Raises:
+            KeyError: If the body is not stored
+        """
+        with self.lock:
+            row = self.db.execute('SELECT content FROM bodies WHERE id = ?', (note_id,)).fetchone()
+        if row is None:
+            raise KeyError(note_id)
+        return row[0]
+
+    def put(self, items) -> None:
+        """Store (note_id, content) pairs."""
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO bodies (id, content) VALUES (?, ?)', items)
+
+    def delete(self, note_ids) -> None:
+        with self.lock, self.db:
+            self.db.executemany('DELETE FROM bodies WHERE id = ?', [(i,) for i in note_ids])
+
+    def retain(self, note_ids) -> None:
+        """Drop the bodies of all notes not in note_ids."""
+        with self.lock:
+            stored = [row[0] for row in self.db.execute('SELECT id FROM bodies')]
+        self.delete([i for i in stored if i not in note_ids])
+
+
+class RemoteNote:
+    """Compact record of a remote note; the body stays in NoteBodies.
+
+    Attributes:
+        id, v: Note id and version
+        tags, system_tags: Tag lists
+        deleted: True if the note is in the trash
+        modified: modificationDate
+        title: First line of the content
+        content_hash: content_hash() of the content
+    """
+
+    __slots__ = ('id', 'v', 'tags', 'system_tags', 'deleted', 'modified', 'title', 'content_hash', 'bodies')
+
+    def __init__(self, note_id, v, tags, system_tags, deleted, modified, title, chash, bodies=None):
+        self.id = note_id
+        self.v = v
+        self.tags = tags
+        self.system_tags = system_tags
+        self.deleted = deleted
+        self.modified = modified
+        self.title = title
+        self.content_hash = chash
+        self.bodies = bodies
+
+    @classmethod
+    def from_data(cls, note_id: str, v, d: dict, bodies: Optional[NoteBodies] = None) -> 'RemoteNote':
+        """Build a record from the note data of an index entry or GET."""
+        content = d.get('content', '')
+        return cls(note_id, v, d.get('tags', []), d.get('systemTags', []), bool(d.get('deleted')),
+                   d.get('modificationDate'), content.split('\n')[0] if content else '',
+                   content_hash(content), bodies)
+
+    @classmethod
+    def from_row(cls, row: list, bodies: Optional[NoteBodies] = None) -> 'RemoteNote':
+        return cls(*row, bodies)
+
+    def to_row(self) -> list:
+        return [self.id, self.v, self.tags, self.system_tags, self.deleted, self.modified,
+                self.title, self.content_hash]
+
+    @property
+    def content(self) -> str:
+        """The note body, read from the body store."""
+        return self.bodies.get(self.id)
+
+
+def iter_index_records(api, bodies: Optional[NoteBodies] = None, **kwargs):
+    """Page through the note index (with data) as compact records.
+
+    Args:
+        api: SimperiumApi instance
+        bodies: Store receiving the note bodies page by page (None: bodies
+            are dropped and RemoteNote.content is unavailable)
+        **kwargs: Extra arguments for api.note.index (since, ...)
+
+    Yields:
+        (notes, current_cv) per page - list of RemoteNote; current_cv is None
+        if the server did not send it
+    """
+    for dump in iter_index_pages(api, data=True, **kwargs):
+        page = dump['index']
+        if bodies is not None:
+            bodies.put([(n['id'], n['d'].get('content', '')) for n in page])
+        yield [RemoteNote.from_data(n['id'], n.get('v'), n['d'], bodies) for n in page], dump.get('current')
+
+
+def fetch_index(api, bodies: Optional[NoteBodies] = None, **kwargs) -> tuple:
+    """Page through the whole note index (with data) as compact records.
+
+    Args:
+        api: SimperiumApi instance
+        bodies: Store receiving the note bodies page by page
+        **kwargs: Extra arguments for api.note.index (since, ...)
+
+    Returns:
+        (notes, current_cv) - list of RemoteNote; current_cv is None if the
+        server did not send it
+    """
+    notes = []
+    current = None
+    for page, page_current in iter_index_records(api, bodies, **kwargs):
+        current = current or page_current
+        notes.extend(page)
+    return notes, current
+
+
+def fetch_notes(api, note_ids: list, bodies: Optional[NoteBodies] = None,
+                versions: Optional[dict] = None, workers: int = FETCH_WORKERS) -> list:
+    """Fetch individual notes with bounded parallel GETs.
+
+    Args:
+        api: SimperiumApi instance
+        note_ids: Ids of the notes to fetch
+        bodies: Store receiving the bodies (None: bodies are dropped)
+        versions: Known version per note id, recorded in the records
+        workers: Maximum number of requests in flight
+
+    Returns:
+        List of RemoteNote in note_ids order; notes that no longer exist
+        are left out
+    """
+    versions = versions or {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        data = list(executor.map(api.note.get, note_ids))
+    found = [(note_id, d) for note_id, d in zip(note_ids, data) if d is not None]
+    if bodies is not None:
+        bodies.put([(note_id, d.get('content', '')) for note_id, d in found])
+    return [RemoteNote.from_data(note_id, versions.get(note_id), d, bodies) for note_id, d in found]
+
+
+def fetch_versions(api) -> tuple:
+    """Page through the index without data.
+
+    Returns:
+        (versions, current_cv) - {note_id: version} in index order
+    """
+    versions = {}
+    current = None
+    for dump in iter_index_pages(api):
+        if current is None:
+            current = dump.get('current')
+        for entry in dump['index']:
+            versions[entry['id']] = entry.get('v')
+    return versions, current
+
+
+def _refresh_by_version(api, bodies: NoteBodies, rows: list) -> Optional[tuple]:
+    """Bring stored records up to date using a data-less index.
+
+    Returns:
+        (notes, current_cv, changed), or None when too many notes changed
+        for per-note fetches to pay off
+    """
+    versions, current = fetch_versions(api)
+    known = {row[0]: row for row in rows}
+    stale = [note_id for note_id, v in versions.items()
+             if note_id not in known or v is None or known[note_id][1] != v]
+    if len(stale) > MAX_TARGETED_FETCHES:
+        return None
+
+    updates = fetch_notes(api, stale, bodies, versions)
+    stale_ids = set(stale)
+    notes = updates + [RemoteNote.from_row(row, bodies) for note_id, row in known.items()
+                       if note_id in versions and note_id not in stale_ids]
+    fetched = {note.id for note in updates}
+    bodies.delete([note_id for note_id in known if note_id not in versions] +
+                  [note_id for note_id in stale if note_id not in fetched])
+    return notes, current, len(stale)
+
+
+def iter_remote_snapshot(api, backup_dir: str, full: bool = False, bodies: Optional[NoteBodies] = None):
+    """Yield all remote notes batch by batch, fetching only what changed since the last run.
+
+    Batches are handed out as soon as they arrive (one per index page for a
+    full fetch), so callers can work on them while the next page downloads.
+    The snapshot is saved once every batch has been yielded.
+
+    If the stored cursor is rejected (expired), the snapshot is reconciled
+    by version with a data-less index instead. The full index with data is
+    downloaded on the first run, with full=True, or when many notes changed.
+
+    Args:
+        api: SimperiumApi instance
+        backup_dir: Backup directory holding the snapshot state
+        full: Force a full index download
+        bodies: Open body store for the records (None: open one)
+
+    Yields:
+        Lists of RemoteNote, in index order overall (most recently modified
+        first)
+
+    Returns:
+        (as StopIteration.value) the number of changed notes for an
+        incremental fetch, or None for a full fetch
+    """
+    if bodies is None:
+        bodies = NoteBodies(backup_dir)
+    snapshot = None
+    if not full and bodies.existed:
+        snapshot = load_cache(backup_dir, SNAPSHOT_STATE)
+        if snapshot and snapshot.get('version') != SNAPSHOT_VERSION:
+            snapshot = None
+
+    if snapshot and snapshot.get('cv'):
+        updates = []
+        current = None
+        try:
+            for page, page_current in iter_index_records(api, bodies, since=snapshot['cv']):
+                current = current or page_current
+                updates.extend(page)
+                yield page
+        except Exception as exc:
+            # カーソル期限切れなど、サーバーが拒否した場合（HTTPエラー）だけ
+            # バージョン照合（またはフル取得）にフォールバック。それ以外はそのまま送出
+            if updates or _status_code(exc) is None:
+                raise
+            updates = None
+
+        if updates is not None:
+            updated_ids = {note.id for note in updates}
+            rest = [RemoteNote.from_row(row, bodies) for row in snapshot['notes']
+                    if row[0] not in updated_ids]
+            yield rest
+            # 変更がなくcvも進んでいなければ書き直さない（同期フォルダへの無駄なアップロードを避ける）
+            if updates or (current and current != snapshot['cv']):
+                _save_snapshot(backup_dir, updates + rest, current)
+            return len(updates)
+
+    if snapshot and snapshot['notes']:
+        refreshed = _refresh_by_version(api, bodies, snapshot['notes'])
+        if refreshed is not None:
+            notes, current, changed = refreshed
+            yield notes
+            _save_snapshot(backup_dir, notes, current)
+            return changed
+
+    notes = []
+    current = None
+    for page, page_current in iter_index_records(api, bodies):
+        current = current or page_current
+        notes.extend(page)
+        yield page
+    bodies.retain({note.id for note in notes})
+    _save_snapshot(backup_dir, notes, current)
+    return None
+
+
+def fetch_remote_snapshot(api, backup_dir: str, full: bool = False,
+                          bodies: Optional[NoteBodies] = None) -> tuple:
+    """Return all remote notes, fetching only what changed since the last run.
+
+    Collects iter_remote_snapshot() into one list.
+
+    Args:
+        api: SimperiumApi instance
+        backup_dir: Backup directory holding the snapshot state
+        full: Force a full index download
+        bodies: Open body store for the records (None: open one)
+
+    Returns:
+        (notes, changed) - RemoteNote records in index order (most recently
+        modified first); changed is the number of changed notes for an
+        incremental fetch, or None for a full fetch
+    """
+    notes = []
+    batches = iter_remote_snapshot(api, backup_dir, full=full, bodies=bodies)
+    while True:
+        try:
+            notes.extend(next(batches))
+        except StopIteration as stop:
+            return notes, stop.value
+
+
+def wait_for_changes(api, cv: str, timeout: float = CHANGES_TIMEOUT) -> list:
+    """Long-poll the changes feed for changes after cv.
+
+    The request is not retried: a timeout just means nothing changed, and
+    other errors are left to the caller's reconnect loop.
+
+    Args:
+        api: SimperiumApi instance
+        cv: Change cursor (the snapshot's cv)
+        timeout: Seconds to wait for a change
+
+    Returns:
+        List of change records ({'id', 'o', 'ev', 'cv', ...}); empty on timeout
+    """
+    bucket = getattr(api.note, 'bucket', api.note)
+    try:
+        return bucket.changes(cv=cv, timeout=timeout) or []
+    except (socket.timeout, TimeoutError):
+        return []
+
+
+def apply_changes(api, backup_dir: str, changes: list, bodies: Optional[NoteBodies] = None) -> tuple:
+    """Merge a batch from the changes feed into the stored snapshot.
+
+    Modified notes are fetched individually (once per note, however many
+    changes it got in the batch, several at a time); notes removed from the
+    bucket are dropped.
+
+    Args:
+        api: SimperiumApi instance
+        backup_dir: Backup directory holding the snapshot state
+        changes: Change records returned by wait_for_changes()
+        bodies: Open body store for the records (None: open one)
+
+    Returns:
+        (notes, changed) - all remote notes (changed ones first) and the
+        number of notes that changed
+    """
+    if bodies is None:
+        bodies = NoteBodies(backup_dir)
+    snapshot = load_cache(backup_dir, SNAPSHOT_STATE) or {'cv': None, 'notes': []}
+    latest = {}
+    for change in changes:
+        latest[change['id']] = change
+
+    modified = [note_id for note_id, change in latest.items() if change.get('o') != '-']
+    updates = fetch_notes(api, modified, bodies, {note_id: latest[note_id].get('ev') for note_id in modified})
+    updated_ids = {note.id for note in updates}
+    bodies.delete([note_id for note_id in latest if note_id not in updated_ids])
+
+    notes = updates + [RemoteNote.from_row(row, bodies) for row in snapshot['notes'] if row[0] not in latest]
+    _save_snapshot(backup_dir, notes, changes[-1].get('cv', snapshot['cv']) if changes else snapshot['cv'])
+    return notes, len(latest)
+
+
+def snapshot_cursor(backup_dir: str) -> Optional[str]:
+    """Return the change version the stored snapshot was taken at."""
+    snapshot = load_cache(backup_dir, SNAPSHOT_STATE)
+    return snapshot.get('cv') if snapshot else None
+
+
+def _save_snapshot(backup_dir: str, notes: list, cv: Optional[str]) -> None:
+    save_cache(backup_dir, SNAPSHOT_STATE, {'version': SNAPSHOT_VERSION, 'cv': cv,
+                                            'notes': [note.to_row() for note in notes]})
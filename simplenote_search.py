@@ -0,0 +1,170 @@
+"""
+Simplenote Search Index
+Full-text index over the notes of a backup directory.
+
+The index is an SQLite FTS5 table with the trigram tokenizer, which matches
+any substring of three or more characters and so works for Japanese without
+word segmentation. Shorter terms (common in Japanese, e.g. two-kanji words)
+fall back to LIKE over the same table.
+
+The index lives in `search.db` in the cache directory (see simplenote_state)
+and is keyed by the manifest's relative paths. Once it exists, NoteManifest.save() passes it every path that
+was written, moved, trashed or re-parsed during the run, so pull, classify
+and sync keep it current without walking the tree. refresh() reconciles the
+index with the whole tree (stat-based, only changed files are read).
+"""
+import os
+import json
+import sqlite3
+
+from simplenote_metadata import parse_note_text
+from simplenote_state import get_cache_path
+from simplenote_scan import map_files
+
+SEARCH_STATE = 'search.db'
+MIN_TRIGRAM_LENGTH = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    stat TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS notes USING fts5(
+    note_id UNINDEXED, title, tags, content, tokenize='trigram'
+);
+"""
+
+
+def index_exists(backup_dir: str) -> bool:
+    """True if a search index has been built for the backup directory."""
+    return os.path.exists(get_cache_path(backup_dir, SEARCH_STATE))
+
+
+def _read(filepath: str):
+    """Read a note file; None if it disappeared or is unreadable."""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return f.read()
+    except (IOError, OSError, UnicodeDecodeError):
+        return None
+
+
+class SearchIndex:
+    """SQLite FTS5 index of note titles, tags and content.
+
+    Raises:
+        sqlite3.OperationalError: If SQLite lacks FTS5 or the trigram
+            tokenizer (SQLite 3.34+ is required)
+    """
+
+    def __init__(self, backup_dir: str):
+        self.backup_dir = backup_dir
+        self.db = sqlite3.connect(get_cache_path(backup_dir, SEARCH_STATE))
+        self.db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def update(self, relpaths, entries: dict) -> int:
+        """Re-index the given paths.
+
+        Args:
+            relpaths: Paths (relative to the backup directory) that changed
+            entries: Manifest entries by relative path; paths missing from it
+                are removed from the index
+
+        Returns:
+            Number of paths updated or removed
+        """
+        relpaths = sorted(set(relpaths))
+        present = [p for p in relpaths if p in entries]
+        texts = dict(map_files(_read, [os.path.join(self.backup_dir, p) for p in present]))
+
+        with self.db:
+            for relpath in relpaths:
+                self._delete(relpath)
+            for relpath in present:
+                text = texts.get(os.path.join(self.backup_dir, relpath))
+                if text is None:
+                    continue
+                self._insert(relpath, json.dumps(entries[relpath]['stat']), text)
+        return len(relpaths)
+
+    def refresh(self, manifest) -> int:
+        """Bring the index in line with the whole tree.
+
+        Args:
+            manifest: NoteManifest of the backup directory (scanned here;
+                its pending changes are cleared since they are applied)
+
+        Returns:
+            Number of paths updated or removed
+        """
+        entries = {os.path.relpath(p, self.backup_dir): entry
+                   for p, entry in manifest.lookup_many(manifest.scan())}
+        indexed = dict(self.db.execute('SELECT path, stat FROM docs'))
+        changed = [p for p in indexed if p not in entries]
+        changed += [p for p, entry in entries.items() if indexed.get(p) != json.dumps(entry['stat'])]
+        manifest.changed.clear()
+        return self.update(changed, entries) if changed else 0
+
+    def _delete(self, relpath: str) -> None:
+        row = self.db.execute('SELECT id FROM docs WHERE path = ?', (relpath,)).fetchone()
+        if row:
+            self.db.execute('DELETE FROM notes WHERE rowid = ?', row)
+            self.db.execute('DELETE FROM docs WHERE id = ?', row)
+
+    def _insert(self, relpath: str, stat: str, text: str) -> None:
+        content, tags, _, note_id = parse_note_text(text)
+        title = content.split('\n')[0] if content else ''
+        # directory tag counts as a tag (as in pull/import)
+        parts = relpath.split(os.sep)
+        if len(parts) > 1 and parts[0] != '_trash' and parts[0] not in tags:
+            tags = [parts[0]] + tags
+        cursor = self.db.execute('INSERT INTO docs (path, stat) VALUES (?, ?)', (relpath, stat))
+        self.db.execute('INSERT INTO notes (rowid, note_id, title, tags, content) VALUES (?, ?, ?, ?, ?)',
+                        (cursor.lastrowid, note_id, title, ', '.join(tags), content))
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """Find notes containing all whitespace-separated terms of the query.
+
+        Terms are matched as substrings (case-insensitive) of the title,
+        tags or content. Results are ranked by BM25 when at least one term is
+        long enough for the trigram index, otherwise ordered by path.
+
+        Args:
+            query: Search terms
+            limit: Maximum number of results
+
+        Returns:
+            List of dicts (path, note_id, title, tags, snippet)
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        long_terms = [t for t in terms if len(t) >= MIN_TRIGRAM_LENGTH]
+        short_terms = [t for t in terms if len(t) < MIN_TRIGRAM_LENGTH]
+
+        where = []
+        params = []
+        if long_terms:
+            where.append('notes MATCH ?')
+            params.append(' AND '.join('"%s"' % t.replace('"', '""') for t in long_terms))
+        for term in short_terms:
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            where.append("(title LIKE ? ESCAPE '\\' OR tags LIKE ? ESCAPE '\\' OR content LIKE ? ESCAPE '\\')")
+            params.extend([pattern] * 3)
+        if long_terms:
+            snippet, order = "snippet(notes, 3, '[', ']', '...', 12)", 'rank'
+        else:
+            snippet, order = 'substr(notes.content, 1, 80)', 'docs.path'
+
+        sql = ("SELECT docs.path, notes.note_id, notes.title, notes.tags, "
+               f"{snippet} "
+               "FROM notes JOIN docs ON docs.id = notes.rowid "
+               f"WHERE {' AND '.join(where)} ORDER BY {order} LIMIT ?")
+        rows = self.db.execute(sql, params + [limit]).fetchall()
+        return [{'path': path, 'note_id': note_id, 'title': title,
+                 'tags': tags.split(', ') if tags else [], 'snippet': snippet}
+                for path, note_id, title, tags, snippet in rows]
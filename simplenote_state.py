@@ -0,0 +1,131 @@
+"""
+Simplenote Sync State
+Persists small pieces of sync state (cursors, caches) for a backup directory.
+
+State that describes the backup itself (push state, snapshots, resume
+progress) lives in a hidden `.simplenote/` directory inside the backup
+directory. The note scanners never pick it up: glob('**/*.md') skips
+dot-directories and the root listings only look at `.md` files.
+
+Rebuildable caches (remote snapshot and note bodies, manifest, search index,
+tag model) live outside the backup directory, which is usually synced by
+Dropbox: live SQLite files sync badly there and the bodies would take the
+user's quota twice. The cache directory is `$SIMPLENOTE_CACHE_DIR`, else
+`$XDG_CACHE_HOME/simplenote-backup` (default `~/.cache/simplenote-backup`),
+with one subdirectory per backup directory. Files left in `.simplenote/` by
+older versions are moved there on first use.
+"""
+import os
+import json
+import shutil
+import hashlib
+
+STATE_DIRNAME = '.simplenote'
+CACHE_ENV = 'SIMPLENOTE_CACHE_DIR'
+
+
+def get_state_dir(backup_dir: str) -> str:
+    """Return the state directory for a backup directory (created on demand).
+
+    Args:
+        backup_dir: Path to the backup directory
+
+    Returns:
+        Path to `<backup_dir>/.simplenote`
+    """
+    state_dir = os.path.join(backup_dir, STATE_DIRNAME)
+    os.makedirs(state_dir, exist_ok=True)
+    return state_dir
+
+
+def get_state_path(backup_dir: str, name: str) -> str:
+    """Return the path of a named state file."""
+    return os.path.join(get_state_dir(backup_dir), name)
+
+
+def get_cache_dir(backup_dir: str) -> str:
+    """Return the cache directory for a backup directory (created on demand).
+
+    Args:
+        backup_dir: Path to the backup directory
+
+    Returns:
+        Path to `<cache root>/<backup dir name>-<hash of its real path>`
+    """
+    root = os.environ.get(CACHE_ENV)
+    if not root:
+        xdg = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        root = os.path.join(xdg, 'simplenote-backup')
+    real = os.path.realpath(backup_dir)
+    key = hashlib.sha1(real.encode('utf-8')).hexdigest()[:12]
+    cache_dir = os.path.join(root, f"{os.path.basename(real) or 'root'}-{key}")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def get_cache_path(backup_dir: str, name: str) -> str:
+    """Return the path of a named cache file.
+
+    A file of the same name left in `.simplenote/` by an older version is
+    moved to the cache directory (with its SQLite journal files, if any).
+    """
+    path = os.path.join(get_cache_dir(backup_dir), name)
+    legacy = os.path.join(backup_dir, STATE_DIRNAME, name)
+    if os.path.exists(legacy) and not os.path.exists(path):
+        for suffix in ('', '-journal', '-wal', '-shm'):
+            if os.path.exists(legacy + suffix):
+                shutil.move(legacy + suffix, path + suffix)
+    return path
+
+
+def _load_json(path: str, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+
+def _save_json(path: str, data) -> None:
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_state(backup_dir: str, name: str, default=None):
+    """Load a JSON state file.
+
+    Args:
+        backup_dir: Path to the backup directory
+        name: State file name (e.g. 'remote-notes.json')
+        default: Value returned when the file is missing or unreadable
+
+    Returns:
+        Decoded JSON data, or default
+    """
+    return _load_json(os.path.join(backup_dir, STATE_DIRNAME, name), default)
+
+
+def save_state(backup_dir: str, name: str, data) -> None:
+    """Atomically write a JSON state file.
+
+    The data is written to a temporary file and renamed into place, so an
+    interrupted run never leaves a truncated state file behind.
+
+    Args:
+        backup_dir: Path to the backup directory
+        name: State file name
+        data: JSON-serializable data
+    """
+    _save_json(get_state_path(backup_dir, name), data)
+
+
+def load_cache(backup_dir: str, name: str, default=None):
+    """Load a JSON cache file (see load_state)."""
+    return _load_json(get_cache_path(backup_dir, name), default)
+
+
+def save_cache(backup_dir: str, name: str, data) -> None:
+    """Atomically write a JSON cache file (see save_state)."""
+    _save_json(get_cache_path(backup_dir, name), data)
@@ -0,0 +1,153 @@
+"""
+Simplenote Local Change Watcher
+Collects the .md files changed under a backup directory.
+
+With the optional `watchdog` package, filesystem events (inotify, FSEvents,
+...) are used and the process sleeps while nothing happens. Without it the
+tree is polled by stat every few seconds.
+
+Bursts of events (an editor saving several times, a sync moving many files)
+are coalesced: wait_batch() returns once no new event has arrived for the
+debounce window. The state directory and `_trash/` are ignored.
+
+A batch holds every path that changed, appeared or disappeared (the source
+of a move included); for a moved or deleted directory the directory path
+itself is reported.
+"""
+import os
+import time
+import threading
+
+try:
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+from simplenote_state import STATE_DIRNAME
+
+DEBOUNCE_SECONDS = 2.0
+POLL_INTERVAL = 5.0
+
+
+def _wanted(root: str, path: str, is_dir: bool = False) -> bool:
+    if not is_dir and not path.endswith('.md'):
+        return False
+    parts = os.path.relpath(path, root).split(os.sep)
+    return parts[0] not in (STATE_DIRNAME, '_trash') and not parts[0].startswith('..')
+
+
+def _walk_md(root: str):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') and d != '_trash']
+        for filename in filenames:
+            if filename.endswith('.md'):
+                yield os.path.join(dirpath, filename)
+
+
+class ChangeWatcher:
+    """Watch a backup directory for changed note files.
+
+    Args:
+        root: Backup directory
+        debounce: Seconds without events after which a batch is complete
+        poll: Force polling even if watchdog is installed
+    """
+
+    def __init__(self, root: str, debounce: float = DEBOUNCE_SECONDS, poll: bool = False):
+        self.root = os.path.normpath(root)
+        self.debounce = debounce
+        self.changed = set()
+        self.last_event = 0.0
+        self.cond = threading.Condition()
+        self.observer = None
+        self.poller = None
+        self.stopped = False
+        self.backend = 'polling' if poll or Observer is None else 'watchdog'
+
+    def start(self) -> None:
+        if self.backend == 'watchdog':
+            self.observer = Observer()
+            self.observer.schedule(self, self.root, recursive=True)
+            self.observer.start()
+        else:
+            self.poller = threading.Thread(target=self._poll, daemon=True)
+            self.poller.start()
+
+    def stop(self) -> None:
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+
+    def _add(self, paths, is_dir: bool = False) -> None:
+        paths = [os.path.normpath(p) for p in paths if _wanted(self.root, p, is_dir)]
+        if paths:
+            with self.cond:
+                self.changed.update(paths)
+                self.last_event = time.monotonic()
+                self.cond.notify_all()
+
+    def dispatch(self, event) -> None:
+        """watchdog event callback (the observer calls handler.dispatch)."""
+        event_type = event.event_type
+        if event_type not in ('created', 'modified', 'moved', 'deleted', 'closed'):
+            return
+        src = os.fsdecode(event.src_path)
+        dest = os.fsdecode(getattr(event, 'dest_path', '') or '')
+        if event.is_directory:
+            if event_type in ('moved', 'deleted'):
+                self._add([src], is_dir=True)
+            # a tag directory was created/renamed: every file in it is affected
+            target = dest or src
+            if event_type in ('created', 'moved') and os.path.isdir(target):
+                self._add(_walk_md(target))
+            return
+        self._add([src, dest] if dest else [src])
+
+    def _poll(self) -> None:
+        known = {}
+        for path in _walk_md(self.root):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            known[path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        while not self.stopped:
+            time.sleep(POLL_INTERVAL)
+            current = {}
+            for path in _walk_md(self.root):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                current[path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+            self._add([p for p, key in current.items() if known.get(p) != key] +
+                      [p for p in known if p not in current])
+            known = current
+
+    def wait_batch(self, timeout: float = None) -> set:
+        """Block until a debounced batch of changes is ready.
+
+        Args:
+            timeout: Give up after this many seconds (None: wait forever)
+
+        Returns:
+            Set of changed .md paths (empty on timeout or stop)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while not self.changed and not self.stopped:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return set()
+                self.cond.wait(remaining)
+            # wait until the burst is over
+            while not self.stopped:
+                quiet = time.monotonic() - self.last_event
+                if quiet >= self.debounce:
+                    break
+                self.cond.wait(self.debounce - quiet)
+            batch, self.changed = self.changed, set()
+            return batch
@@ -0,0 +1,223 @@
+"""
+Shared fixtures for the test suite.
+
+The scripts are loaded as modules the same way simplenote-sync.py does it.
+Network access is replaced by FakeBucket, an in-memory stand-in for the
+Simperium `note` bucket with the same call signatures.
+"""
+import os
+import sys
+import copy
+import importlib.util
+import urllib.error
+from urllib.parse import unquote
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+pytest.importorskip('simperium.core')
+
+_scripts = {}
+
+
+def load_script(filename):
+    """ハイフン付きスクリプトをモジュールとして読み込む（1回だけ）"""
+    if filename not in _scripts:
+        module_name = os.path.splitext(filename)[0].replace('-', '_')
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_DIR, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _scripts[filename] = module
+    return _scripts[filename]
+
+
+def http_error(code):
+    return urllib.error.HTTPError('http://fake', code, 'error', {}, None)
+
+
+def apply_delta(text, delta):
+    """diff_match_patch.diff_fromDelta() と同じ規則で差分を適用する"""
+    out = []
+    pos = 0
+    for op in delta.split('\t') if delta else []:
+        if op[0] == '+':
+            out.append(unquote(op[1:]))
+        elif op[0] == '=':
+            out.append(text[pos:pos + int(op[1:])])
+            pos += int(op[1:])
+        elif op[0] == '-':
+            pos += int(op[1:])
+        else:
+            raise ValueError(op)
+    if pos != len(text):
+        raise ValueError('delta length %d does not match text length %d' % (pos, len(text)))
+    return ''.join(out)
+
+
+class FakeBucket:
+    """In-memory Simperium bucket.
+
+    notes: {note_id: {'v': version, 'cv': change version, 'd': data}}
+    calls: (method, args) of every request, in order
+    errors: {method: [exception, ...]} raised (and consumed) by the next calls
+    min_cv: cursors older than this are rejected like an expired cursor
+    """
+
+    def __init__(self, page_size=3):
+        self.notes = {}
+        self.cv = 0
+        self.min_cv = 0
+        self.page_size = page_size
+        self.calls = []
+        self.errors = {}
+
+    def _call(self, method, *args):
+        self.calls.append((method, args))
+        pending = self.errors.get(method)
+        if pending:
+            raise pending.pop(0)
+
+    def count(self, method):
+        return sum(1 for name, _ in self.calls if name == method)
+
+    def put(self, note_id, content, tags=(), deleted=False, **fields):
+        """Create or update a note directly on the 'server'."""
+        data = {'content': content, 'tags': list(tags), 'systemTags': [], 'deleted': deleted,
+                'modificationDate': 1700000000 + self.cv, 'creationDate': 1700000000}
+        data.update(fields)
+        self._store(note_id, data)
+
+    def _store(self, note_id, data):
+        self.cv += 1
+        note = self.notes.setdefault(note_id, {'v': 0, 'cv': 0, 'd': {}})
+        note['d'].update(copy.deepcopy(data))
+        note['v'] += 1
+        note['cv'] = self.cv
+
+    def content(self, note_id):
+        return self.notes[note_id]['d']['content']
+
+    def index(self, data=False, mark=None, limit=None, since=None):
+        self._call('index', data, mark, since)
+        items = sorted(self.notes.items(), key=lambda kv: -kv[1]['cv'])
+        if since is not None:
+            if int(since) < self.min_cv:
+                raise http_error(404)
+            items = [(k, n) for k, n in items if n['cv'] > int(since)]
+        start = int(mark or 0)
+        page = items[start:start + (limit or self.page_size)]
+        out = {'index': [dict({'id': k, 'v': n['v']}, **({'d': copy.deepcopy(n['d'])} if data else {}))
+                         for k, n in page],
+               'current': str(self.cv)}
+        if start + len(page) < len(items):
+            out['mark'] = str(start + len(page))
+        return out
+
+    def get(self, item, default=None, version=None):
+        self._call('get', item)
+        note = self.notes.get(item)
+        return copy.deepcopy(note['d']) if note else default
+
+    def bulk_post(self, bulk_data, wait=True):
+        self._call('bulk_post', list(bulk_data))
+        for note_id, data in bulk_data.items():
+            self._store(note_id, data)
+        return [{'id': note_id} for note_id in bulk_data]
+
+    def post_changes(self, changes):
+        """/changes への jsondiff 変更（simplenote_remote.send_changes の代わり）"""
+        self._call('post_changes', [change['id'] for change in changes])
+        responses = []
+        for change in changes:
+            note = self.notes.get(change['id'])
+            if note is None or change.get('sv') != note['v']:
+                responses.append({'id': change['id'], 'error': 405})
+                continue
+            data = {}
+            for key, op in change['v'].items():
+                if op['o'] == 'd':
+                    try:
+                        data[key] = apply_delta(note['d'][key], op['v'])
+                    except ValueError:
+                        responses.append({'id': change['id'], 'error': 440})
+                        break
+                else:
+                    data[key] = op['v']
+            else:
+                self._store(change['id'], data)
+                responses.append({'id': change['id'], 'ccid': change['ccid'], 'ev': note['v']})
+        return responses
+
+    def changes(self, cv=None, timeout=None):
+        self._call('changes', cv)
+        return [{'id': k, 'o': 'M', 'ev': n['v'], 'cv': str(n['cv'])}
+                for k, n in sorted(self.notes.items(), key=lambda kv: kv[1]['cv'])
+                if cv is None or n['cv'] > int(cv)]
+
+
+class FakeApi:
+    def __init__(self, bucket=None):
+        self.note = bucket or FakeBucket()
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """キャッシュはテストごとの一時ディレクトリへ"""
+    path = tmp_path / 'cache'
+    monkeypatch.setenv('SIMPLENOTE_CACHE_DIR', str(path))
+    return path
+
+
+@pytest.fixture(autouse=True)
+def fake_transport(monkeypatch):
+    """/changes への直接のPOSTも FakeBucket へ"""
+    import simplenote_remote
+    monkeypatch.setattr(simplenote_remote, 'send_changes', lambda bucket, changes: bucket.post_changes(changes))
+
+
+@pytest.fixture
+def body_stores(monkeypatch):
+    """NoteBodies の生成を記録する（閉じ忘れの確認用）
+
+    track(module, ...) はそのモジュールの NoteBodies を置き換え、生成されたストアのリストを返す。
+    """
+    import simplenote_remote
+    stores = []
+
+    class TrackedBodies(simplenote_remote.NoteBodies):
+        def __init__(self, backup_dir):
+            super().__init__(backup_dir)
+            self.closed = False
+            stores.append(self)
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    def track(*modules):
+        for module in (simplenote_remote,) + modules:
+            monkeypatch.setattr(module, 'NoteBodies', TrackedBodies)
+        return stores
+    return track
+
+
+@pytest.fixture
+def bucket():
+    return FakeBucket()
+
+
+@pytest.fixture
+def api(bucket):
+    from simplenote_remote import with_retry
+    return with_retry(FakeApi(bucket), rate=0)
+
+
+def write_note(path, content, note_id=None, tags=()):
+    """バックアップ形式の.mdファイルを書く"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    text = f"<!-- simplenote-id: {note_id} -->\n" if note_id else ''
+    text += content + '\n\nTags: ' + ', '.join(tags) + '\n'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
@@ -0,0 +1,126 @@
+"""Tests for simplenote-backup.py (run as a script against FakeBucket)."""
+import os
+import sys
+import time
+import runpy
+import tarfile
+import zipfile
+
+import pytest
+import simperium.core
+
+from conftest import REPO_DIR, FakeApi
+
+NOTE_A = 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'
+NOTE_B = 'bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb'
+NOTE_C = 'cccccccccccccccccccccccccccccccc'
+
+# 1980-01-01 00:00 UTC（UTCより西ではローカル時刻がまだ1979年）
+ZIP_EPOCH_UTC = 315532800
+
+
+@pytest.fixture
+def run_backup(monkeypatch, bucket):
+    """simplenote-backup.py を FakeBucket に対して実行する"""
+    monkeypatch.setenv('TOKEN', 'token')
+    monkeypatch.setattr(simperium.core, 'Api', lambda *args, **kwargs: FakeApi(bucket))
+
+    def run(target, *flags):
+        monkeypatch.setattr(sys, 'argv', ['simplenote-backup.py', str(target)] + list(flags))
+        runpy.run_path(os.path.join(REPO_DIR, 'simplenote-backup.py'), run_name='__main__')
+
+    return run
+
+
+@pytest.fixture
+def west_of_utc(monkeypatch):
+    monkeypatch.setenv('TZ', 'America/Los_Angeles')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.fixture
+def notes(bucket):
+    bucket.put(NOTE_A, 'Plan\nsteps', tags=['work'], modificationDate=1700000000)
+    bucket.put(NOTE_B, 'Old\nremoved', deleted=True, modificationDate=1700000100)
+    bucket.put(NOTE_C, 'Plan\nsecond', tags=['work'], modificationDate=1700000200)
+    return bucket
+
+
+def test_tar_archive_layout(tmp_path, run_backup, notes):
+    archive = tmp_path / 'notes.tar.gz'
+
+    run_backup(archive)
+
+    with tarfile.open(archive) as tar:
+        members = {m.name: m for m in tar.getmembers()}
+        assert set(members) == {'work', '_trash', 'work/Plan.md', 'work/Plan_1.md', '_trash/Old.md'}
+        assert members['work'].isdir()
+        assert members['_trash/Old.md'].mtime == 1700000100
+        assert b'removed' in tar.extractfile('_trash/Old.md').read()
+    assert not os.path.exists(str(archive) + '.part')
+
+
+def test_zip_archive_clamps_dates_before_1980(tmp_path, run_backup, bucket, west_of_utc):
+    bucket.put(NOTE_A, 'Epoch\nnote', modificationDate=ZIP_EPOCH_UTC)
+    bucket.put(NOTE_B, 'Older\nnote', modificationDate=0)
+    bucket.put(NOTE_C, 'Recent\nnote', modificationDate=1700000000)
+    archive = tmp_path / 'notes.zip'
+
+    run_backup(archive)
+
+    with zipfile.ZipFile(archive) as zf:
+        dates = {info.filename: info.date_time for info in zf.infolist()}
+    assert dates == {
+        'Epoch.md': (1980, 1, 1, 0, 0, 0),
+        'Older.md': (1980, 1, 1, 0, 0, 0),
+        'Recent.md': time.localtime(1700000000)[:6],
+    }
+
+
+def backup_files(backup_dir):
+    """バックアップ内のファイル（状態ディレクトリを除く） -> 内容"""
+    out = {}
+    for root, dirs, files in os.walk(backup_dir):
+        dirs[:] = [d for d in dirs if d != '.simplenote']
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, encoding='utf-8') as f:
+                out[os.path.relpath(path, backup_dir)] = f.read()
+    return out
+
+
+def test_resume_interrupted_backup(tmp_path, run_backup, bucket, monkeypatch):
+    for i in range(8):
+        bucket.put('%032x' % i, ('Plan' if i in (1, 7) else f'Note {i}') + f'\nbody {i}',
+                   tags=['work'] if i % 3 == 0 else [], modificationDate=1700000000 + i)
+    clean_dir = tmp_path / 'clean'
+    run_backup(clean_dir)
+
+    # 3ページ目の取得で失敗させる（1・2ページ目は書き込み済み）
+    index = bucket.index
+
+    def failing_index(*args, **kwargs):
+        if bucket.count('index') == 2:
+            bucket.calls.append(('index', 'failed'))
+            raise RuntimeError('connection lost')
+        return index(*args, **kwargs)
+
+    backup_dir = tmp_path / 'bk'
+    bucket.calls.clear()
+    monkeypatch.setattr(bucket, 'index', failing_index)
+    with pytest.raises(RuntimeError):
+        run_backup(backup_dir)
+    assert len(backup_files(backup_dir)) == 6
+    assert os.path.exists(backup_dir / '.simplenote' / 'backup-progress.jsonl')
+
+    bucket.calls.clear()
+    monkeypatch.setattr(bucket, 'index', index)
+    run_backup(backup_dir)
+
+    # 書き込み済みのページは取り直さない
+    assert [args for name, args in bucket.calls] == [(True, '6', None)]
+    assert backup_files(backup_dir) == backup_files(clean_dir)
+    assert not os.path.exists(backup_dir / '.simplenote' / 'backup-progress.jsonl')
@@ -0,0 +1,33 @@
+"""Tests for simplenote_delta."""
+import pytest
+
+from conftest import apply_delta
+from simplenote_delta import content_delta
+
+
+@pytest.mark.parametrize('base, text', [
+    ('', 'new note\nbody'),
+    ('old note\nbody', ''),
+    ('Title\nline 1\nline 2\n', 'Title\nline 1\nline 2\nline 3\n'),
+    ('Title\nline 1\nline 2\n', 'Title changed\nline 1\nline 2 edited\n'),
+    ('aaaa', 'aaaaaa'),
+    ('abcabc', 'abc'),
+    ('買い物\n牛乳\n卵', '買い物\n牛乳\nパン\n卵'),
+    ('100% done', '50% done & more +tags #x'),
+    ('no trailing newline', 'no trailing newline\nnow'),
+])
+def test_delta_round_trip(base, text):
+    assert apply_delta(base, content_delta(base, text)) == text
+
+
+def test_small_edit_of_large_text_gives_small_delta():
+    base = ''.join(f'line {i}\n' for i in range(10000))
+    text = base.replace('line 5000\n', 'line 5000 edited\n').replace('line 9000\n', '')
+    delta = content_delta(base, text)
+    assert apply_delta(base, delta) == text
+    assert len(delta) < 100
+
+
+def test_text_outside_bmp_has_no_delta():
+    assert content_delta('note', 'note 🎉') is None
+    assert content_delta('🎉 note', '🎉 note!') is None
@@ -0,0 +1,202 @@
+"""Tests for simplenote-import.py (push)."""
+import os
+
+import pytest
+
+from conftest import FakeApi, load_script, write_note
+
+push = load_script('simplenote-import.py')
+
+NOTE_X = 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'
+
+
+def contents(bucket):
+    return sorted(n['d']['content'] for n in bucket.notes.values())
+
+
+def test_no_changes_makes_no_requests(tmp_path, api, bucket):
+    import_dir = str(tmp_path / 'notes')
+    bucket.put(NOTE_X, 'Plan\nsteps')
+    write_note(os.path.join(import_dir, 'Plan.md'), 'Plan\nsteps', NOTE_X)
+    push.do_sync(import_dir, api=api, full=True)
+
+    bucket.calls.clear()
+    push.do_sync(import_dir, api=api)
+    assert bucket.calls == []
+
+
+def test_dirty_set_pushes_only_changed_notes(tmp_path, api, bucket):
+    import_dir = str(tmp_path / 'notes')
+    other = 'bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb'
+    bucket.put(NOTE_X, 'Plan\nsteps')
+    bucket.put(other, 'Other\nbody')
+    write_note(os.path.join(import_dir, 'Plan.md'), 'Plan\nsteps', NOTE_X)
+    write_note(os.path.join(import_dir, 'Other.md'), 'Other\nbody', other)
+    push.do_sync(import_dir, api=api, full=True)
+
+    bucket.calls.clear()
+    write_note(os.path.join(import_dir, 'Plan.md'), 'Plan\nsteps\nmore', NOTE_X)
+    push.do_sync(import_dir, api=api)
+
+    assert bucket.count('index') == 0
+    assert [args for name, args in bucket.calls if name == 'get'] == [(NOTE_X,)]
+    assert [args for name, args in bucket.calls if name in ('bulk_post', 'post_changes')] == [([NOTE_X],)]
+    assert bucket.content(NOTE_X) == 'Plan\nsteps\nmore'
+
+
+
+def test_dirty_set_matches_new_file_against_changed_remote_notes(tmp_path, api, bucket):
+    import_dir = str(tmp_path / 'notes')
+    other = 'bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb'
+    bucket.put(NOTE_X, 'Plan\nsteps')
+    write_note(os.path.join(import_dir, 'Plan.md'), 'Plan\nsteps', NOTE_X)
+    push.do_sync(import_dir, api=api, full=True)
+    cursor = str(bucket.cv)
+
+    # 別の端末で作られたノートと同じ内容のファイルが増えた
+    bucket.put(other, 'Idea\nnew')
+    write_note(os.path.join(import_dir, 'Idea.md'), 'Idea\nnew')
+    bucket.calls.clear()
+    push.do_sync(import_dir, api=api)
+
+    # 全件ではなく前回以降の変更だけを取得し、既存のノートと照合して重複を作らない
+    assert [args for name, args in bucket.calls if name == 'index'] == [(True, None, cursor)]
+    assert bucket.count('bulk_post') == bucket.count('post_changes') == 0
+    assert contents(bucket) == ['Idea\nnew', 'Plan\nsteps']
+
+
+def test_sync_closes_body_store(tmp_path, api, bucket, body_stores):
+    stores = body_stores(push)
+    import_dir = str(tmp_path / 'notes')
+    bucket.put(NOTE_X, 'Plan\nsteps')
+    write_note(os.path.join(import_dir, 'Plan.md'), 'Plan\nsteps', NOTE_X)
+    push.do_sync(import_dir, api=api, full=True)
+    write_note(os.path.join(import_dir, 'Plan.md'), 'Plan\nsteps\nmore', NOTE_X)
+    push.do_sync(import_dir, api=api)
+
+    assert len(stores) == 2
+    assert all(store.closed for store in stores)
+
+
+def test_content_update_is_sent_as_delta(tmp_path, api, bucket):
+    import_dir = str(tmp_path / 'notes')
+    body = 'Log\n' + '\n'.join(f'line {i}' for i in range(5000))
+    bucket.put(NOTE_X, body)
+    write_note(os.path.join(import_dir, 'Log.md'), body, NOTE_X)
+    push.do_sync(import_dir, api=api, full=True)
+
+    sent = []
+    post_changes = bucket.post_changes
+    bucket.post_changes = lambda changes: sent.extend(changes) or post_changes(changes)
+    edited = body.replace('line 2500\n', 'line 2500!\n')
+    write_note(os.path.join(import_dir, 'Log.md'), edited, NOTE_X)
+    push.do_sync(import_dir, api=api)
+
+    assert bucket.content(NOTE_X) == edited
+    assert bucket.count('bulk_post') == 0
+    [change] = sent
+    assert change['sv'] == 1
+    assert change['v']['content']['o'] == 'd'
+    assert len(change['v']['content']['v']) < 100
+
+
+def test_new_file_does_not_take_note_of_unchanged_file_without_id(tmp_path, api, bucket):
+    # TODO.md has no ID comment; it owns NOTE_X only through the push state
+    import_dir = str(tmp_path / 'notes')
+    bucket.put(NOTE_X, 'TODO\nbuy milk')
+    write_note(os.path.join(import_dir, 'TODO.md'), 'TODO\nbuy milk')
+    push.do_sync(import_dir, api=api, full=True)
+
+    write_note(os.path.join(import_dir, 'TODO_1.md'), 'TODO\nwrite report')
+    push.do_sync(import_dir, api=api)
+
+    assert bucket.content(NOTE_X) == 'TODO\nbuy milk'
+    assert contents(bucket) == ['TODO\nbuy milk', 'TODO\nwrite report']
+
+    # 以後の同期でも変更なし
+    bucket.calls.clear()
+    push.do_sync(import_dir, api=api)
+    assert bucket.calls == []
+
+
+class ScriptedWatcher:
+    """ChangeWatcher stand-in: each wait_batch() runs the next step and returns its paths."""
+
+    backend = 'scripted'
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def wait_batch(self, timeout=None):
+        if not self.steps:
+            raise KeyboardInterrupt
+        return set(self.steps.pop(0)())
+
+
+@pytest.fixture
+def run_watch(monkeypatch, bucket):
+    """watch() を FakeBucket と手順付きの監視で実行する"""
+    def run(import_dir, steps):
+        monkeypatch.setattr(push, 'TOKEN', 'token')
+        monkeypatch.setattr(push, 'SimperiumApi', lambda *args, **kwargs: FakeApi(bucket))
+        monkeypatch.setattr(push, 'ChangeWatcher', lambda *args, **kwargs: ScriptedWatcher(steps))
+        monkeypatch.setattr(push, 'backoff_delay', lambda attempt: 0)
+        monkeypatch.setattr(push.signal, 'signal', lambda *args: None)
+        assert push.watch(import_dir)
+    return run
+
+
+def test_watch_pushes_changed_files(tmp_path, bucket, run_watch, body_stores):
+    stores = body_stores(push)
+    import_dir = str(tmp_path / 'notes')
+    path = os.path.join(import_dir, 'Plan.md')
+    bucket.put(NOTE_X, 'Plan\nsteps')
+    write_note(path, 'Plan\nsteps', NOTE_X)
+
+    def edit():
+        write_note(path, 'Plan\nsteps\nmore', NOTE_X)
+        return [path]
+
+    run_watch(import_dir, [edit])
+    assert bucket.content(NOTE_X) == 'Plan\nsteps\nmore'
+    # 起動時の同期と変更バッチで1つずつ、どちらも閉じている
+    assert len(stores) == 2
+    assert all(store.closed for store in stores)
+
+
+def test_watch_new_file_does_not_take_note_of_unchanged_file_without_id(tmp_path, api, bucket, run_watch):
+    import_dir = str(tmp_path / 'notes')
+    bucket.put(NOTE_X, 'TODO\nbuy milk')
+    write_note(os.path.join(import_dir, 'TODO.md'), 'TODO\nbuy milk')
+    push.do_sync(import_dir, api=api, full=True)
+
+    def create():
+        path = os.path.join(import_dir, 'TODO_1.md')
+        write_note(path, 'TODO\nwrite report')
+        return [path]
+
+    run_watch(import_dir, [create])
+    assert bucket.content(NOTE_X) == 'TODO\nbuy milk'
+    assert contents(bucket) == ['TODO\nbuy milk', 'TODO\nwrite report']
+
+
+def test_watch_recovers_from_failed_batch(tmp_path, bucket, run_watch):
+    import_dir = str(tmp_path / 'notes')
+    path = os.path.join(import_dir, 'Plan.md')
+    bucket.put(NOTE_X, 'Plan\nsteps')
+    write_note(path, 'Plan\nsteps', NOTE_X)
+
+    def edit_while_offline():
+        write_note(path, 'Plan\nsteps\nmore', NOTE_X)
+        bucket.errors['index'] = [RuntimeError('connection lost')]
+        return [path]
+
+    # 失敗したバッチの変更は、次の追いつき同期で送られる
+    run_watch(import_dir, [edit_while_offline, lambda: []])
+    assert bucket.content(NOTE_X) == 'Plan\nsteps\nmore'
@@ -0,0 +1,159 @@
+"""Tests for simplenote-pull.py."""
+import os
+import threading
+
+import pytest
+
+from conftest import FakeApi, load_script
+
+pull = load_script('simplenote-pull.py')
+
+NOTE_A = 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'
+NOTE_B = 'bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb'
+NOTE_C = 'cccccccccccccccccccccccccccccccc'
+
+
+@pytest.fixture
+def remote(monkeypatch, bucket):
+    """pull が FakeBucket に接続するようにする"""
+    monkeypatch.setattr(pull, 'TOKEN', 'token')
+    monkeypatch.setattr(pull, 'SimperiumApi', lambda *args, **kwargs: FakeApi(bucket))
+    return bucket
+
+
+def tree(backup_dir):
+    """バックアップ内の .md ファイル -> 先頭行（IDコメントの次の行）"""
+    out = {}
+    for root, _, files in os.walk(backup_dir):
+        for name in files:
+            if name.endswith('.md'):
+                path = os.path.join(root, name)
+                with open(path, encoding='utf-8') as f:
+                    out[os.path.relpath(path, backup_dir)] = f.read().split('\n')[1]
+    return out
+
+
+def test_pull_closes_body_store(tmp_path, remote, body_stores):
+    stores = body_stores(pull)
+    backup_dir = str(tmp_path / 'bk')
+    remote.put(NOTE_A, 'Plan\nsteps', tags=['work'])
+    remote.put(NOTE_B, 'Inbox\nitem')
+
+    pull.do_pull(backup_dir)
+
+    assert tree(backup_dir) == {'work/Plan.md': 'Plan', 'Inbox.md': 'Inbox'}
+    assert len(stores) == 1
+    assert stores[0].closed
+
+
+def test_pull_writes_pages_while_fetching(tmp_path, remote, monkeypatch):
+    backup_dir = str(tmp_path / 'bk')
+    for i in range(7):
+        remote.put('%032x' % i, f'Note {i}\nbody', tags=['work'] if i % 2 else [])
+
+    created = threading.Event()
+    create_note_file = pull.create_note_file
+
+    def tracked_create(*args, **kwargs):
+        created.set()
+        return create_note_file(*args, **kwargs)
+
+    monkeypatch.setattr(pull, 'create_note_file', tracked_create)
+    written_before_page = []
+    index = remote.index
+
+    def slow_index(*args, **kwargs):
+        if remote.count('index'):
+            # 2ページ目以降: 前のページの書き込みが始まるのを待つ
+            written_before_page.append(created.wait(5))
+        return index(*args, **kwargs)
+
+    monkeypatch.setattr(remote, 'index', slow_index)
+
+    result = pull.do_pull(backup_dir)
+
+    assert result['created'] == 7
+    assert written_before_page and all(written_before_page)
+    assert len(tree(backup_dir)) == 7
+
+
+def test_pull_reuses_name_freed_on_later_page(tmp_path, remote):
+    backup_dir = str(tmp_path / 'bk')
+    remote.put(NOTE_A, 'TODO\nsame')
+    remote.put(NOTE_B, 'TODO\nother', tags=['work'])
+    pull.do_pull(backup_dir)
+    assert tree(backup_dir) == {'TODO.md': 'TODO', 'work/TODO.md': 'TODO'}
+
+    # 新しい順に返るので、タグ変更は1ページ目、work/TODO.md の削除は2ページ目に届く
+    remote.put(NOTE_B, 'TODO\nother', tags=['work'], deleted=True)
+    remote.put('%032x' % 1, 'Filler 1\nbody')
+    remote.put('%032x' % 2, 'Filler 2\nbody')
+    remote.put(NOTE_A, 'TODO\nsame', tags=['work'])
+
+    result = pull.do_pull(backup_dir)
+
+    assert (result['trashed'], result['moved'], result['created']) == (1, 1, 2)
+    assert set(tree(backup_dir)) == {'work/TODO.md', '_trash/TODO.md', 'Filler 1.md', 'Filler 2.md'}
+    with open(os.path.join(backup_dir, 'work', 'TODO.md'), encoding='utf-8') as f:
+        assert NOTE_A in f.read()
+
+
+
+@pytest.fixture
+def run_watch(monkeypatch, remote):
+    """watch() を実行する。changes フィードは手順ごとに1回届き、手順が尽きたら停止する"""
+    def run(backup_dir, steps):
+        steps = list(steps)
+
+        def wait_for_changes(api, cv, timeout):
+            if not steps:
+                raise KeyboardInterrupt
+            steps.pop(0)()
+            return remote.changes(cv)
+
+        monkeypatch.setattr(pull, 'wait_for_changes', wait_for_changes)
+        monkeypatch.setattr(pull, 'backoff_delay', lambda attempt: 0)
+        monkeypatch.setattr(pull.signal, 'signal', lambda *args: None)
+        assert pull.watch(backup_dir)
+    return run
+
+
+def test_watch_applies_change_feed(tmp_path, remote, run_watch, body_stores):
+    stores = body_stores(pull)
+    backup_dir = str(tmp_path / 'bk')
+    remote.put(NOTE_A, 'Plan\nsteps', tags=['work'])
+    remote.put(NOTE_B, 'Inbox\nitem')
+
+    def edit():
+        remote.put(NOTE_A, 'Plan\nsteps\nmore', tags=['work'])
+        remote.put(NOTE_B, 'Inbox\nitem', deleted=True)
+        remote.put(NOTE_C, 'Idea\nnew', tags=['home'])
+
+    run_watch(backup_dir, [edit])
+
+    assert tree(backup_dir) == {'work/Plan.md': 'Plan', '_trash/Inbox.md': 'Inbox', 'home/Idea.md': 'Idea'}
+    with open(os.path.join(backup_dir, 'work', 'Plan.md'), encoding='utf-8') as f:
+        assert 'more' in f.read()
+    # 変更バッチは変わったノートだけを個別に取得する
+    assert remote.count('get') == 3
+    # 起動時の追いつきと変更バッチで1つずつ、どちらも閉じている
+    assert len(stores) == 2
+    assert all(store.closed for store in stores)
+
+
+def test_watch_catches_up_after_error(tmp_path, remote, run_watch):
+    backup_dir = str(tmp_path / 'bk')
+    remote.put(NOTE_A, 'Plan\nsteps')
+
+    def failing_edit():
+        remote.put(NOTE_A, 'Plan\nsteps\nmore')
+        remote.errors['get'] = [RuntimeError('connection reset')]
+
+    run_watch(backup_dir, [failing_edit, lambda: None])
+
+    with open(os.path.join(backup_dir, 'Plan.md'), encoding='utf-8') as f:
+        assert 'more' in f.read()
+    # 失敗した個別取得の後、差分取得（index since=cv）で追いついた
+    assert remote.count('get') == 1
+    assert remote.calls[-1] == ('changes', (str(remote.cv),))
+    assert [args[2] for name, args in remote.calls if name == 'index'][-1] is not None
@@ -0,0 +1,213 @@
+"""Tests for simplenote_remote."""
+import sqlite3
+import urllib.error
+
+import pytest
+
+import simplenote_remote
+from conftest import http_error
+from simplenote_remote import fetch_remote_snapshot, bulk_post_deltas, NoteBodies
+
+NOTE_A = 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'
+NOTE_B = 'bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb'
+
+BODY = 'Title\n' + '\n'.join(f'line {i}' for i in range(200))
+
+
+def snapshot_by_id(api, backup_dir):
+    notes, _ = fetch_remote_snapshot(api, backup_dir)
+    return {note.id: note for note in notes}
+
+
+def test_deltas_fall_back_to_full_content_for_stale_base(tmp_path, api, bucket):
+    bucket.put(NOTE_A, BODY)
+    bucket.put(NOTE_B, BODY)
+    bases = snapshot_by_id(api, str(tmp_path))
+    bucket.put(NOTE_B, BODY + '\nremote edit')  # 基準バージョンが古くなる
+
+    edited = BODY.replace('line 100', 'line 100 edited')
+    responses = bulk_post_deltas(api, {NOTE_A: {'content': edited}, NOTE_B: {'content': edited}}, bases)
+
+    assert sorted(r['id'] for r in responses if 'error' not in r) == [NOTE_A, NOTE_B]
+    assert bucket.content(NOTE_A) == edited
+    assert bucket.content(NOTE_B) == edited
+    assert [args for name, args in bucket.calls if name == 'bulk_post'] == [([NOTE_B],)]
+
+
+def test_deltas_fall_back_when_request_is_rejected(tmp_path, api, bucket):
+    bucket.put(NOTE_A, BODY)
+    bases = snapshot_by_id(api, str(tmp_path))
+    bucket.errors['post_changes'] = [http_error(400)]
+
+    edited = BODY + '\nmore'
+    bulk_post_deltas(api, {NOTE_A: {'content': edited, 'tags': ['work']}}, bases)
+
+    assert bucket.content(NOTE_A) == edited
+    assert bucket.notes[NOTE_A]['d']['tags'] == ['work']
+    assert bucket.count('bulk_post') == 1
+
+
+def test_notes_without_base_are_sent_in_full(tmp_path, api, bucket):
+    bucket.put(NOTE_A, BODY)
+    bucket.put(NOTE_B, BODY)
+    bases = snapshot_by_id(api, str(tmp_path))
+
+    bulk_post_deltas(api, {NOTE_A: {'content': BODY + '!'}, NOTE_B: {'tags': ['x']}},
+                     {NOTE_A: bases[NOTE_A]})
+
+    assert [args for name, args in bucket.calls if name == 'post_changes'] == [([NOTE_A],)]
+    assert [args for name, args in bucket.calls if name == 'bulk_post'] == [([NOTE_B],)]
+    assert bucket.content(NOTE_A) == BODY + '!'
+
+
+def test_note_bodies_closes_on_exit(tmp_path):
+    with NoteBodies(str(tmp_path)) as bodies:
+        bodies.put([(NOTE_A, 'body')])
+        assert bodies.get(NOTE_A) == 'body'
+    with pytest.raises(sqlite3.ProgrammingError):
+        bodies.get(NOTE_A)
+
+    with NoteBodies(str(tmp_path)) as bodies:
+        assert bodies.existed
+        assert bodies.get(NOTE_A) == 'body'
+
+
+def fetch_contents(api, backup_dir):
+    """fetch_remote_snapshot() -> ({id: 本文}, changed)"""
+    with NoteBodies(backup_dir) as bodies:
+        notes, changed = fetch_remote_snapshot(api, backup_dir, bodies=bodies)
+        return {note.id: note.content for note in notes}, changed
+
+
+def test_incremental_fetch_requests_only_changes(tmp_path, api, bucket):
+    backup_dir = str(tmp_path)
+    bucket.put(NOTE_A, 'A\nfirst')
+    bucket.put(NOTE_B, 'B\nfirst')
+    assert fetch_contents(api, backup_dir) == ({NOTE_A: 'A\nfirst', NOTE_B: 'B\nfirst'}, None)
+    cursor = str(bucket.cv)
+
+    bucket.put(NOTE_B, 'B\nedited')
+    bucket.calls.clear()
+
+    assert fetch_contents(api, backup_dir) == ({NOTE_A: 'A\nfirst', NOTE_B: 'B\nedited'}, 1)
+    assert [name for name, _ in bucket.calls] == ['index']
+    assert bucket.calls[0][1][2] == cursor
+
+
+def test_unchanged_snapshot_is_not_rewritten(tmp_path, api, bucket, monkeypatch):
+    backup_dir = str(tmp_path)
+    bucket.put(NOTE_A, 'A\nfirst')
+    fetch_contents(api, backup_dir)
+    saved = []
+    monkeypatch.setattr(simplenote_remote, '_save_snapshot', lambda *args: saved.append(args))
+
+    assert fetch_contents(api, backup_dir) == ({NOTE_A: 'A\nfirst'}, 0)
+    assert saved == []
+
+
+def test_expired_cursor_reconciles_by_version(tmp_path, api, bucket):
+    backup_dir = str(tmp_path)
+    bucket.put(NOTE_A, 'A\nfirst')
+    bucket.put(NOTE_B, 'B\nfirst')
+    fetch_contents(api, backup_dir)
+
+    bucket.put(NOTE_A, 'A\nedited')
+    bucket.min_cv = bucket.cv  # 保存済みのカーソルは期限切れ（404）
+    bucket.calls.clear()
+
+    assert fetch_contents(api, backup_dir) == ({NOTE_A: 'A\nedited', NOTE_B: 'B\nfirst'}, 1)
+    # データなしのインデックスでバージョンを照合し、変わったノートだけ取得
+    assert [args[0] for name, args in bucket.calls if name == 'index'] == [True, False]
+    assert [args for name, args in bucket.calls if name == 'get'] == [(NOTE_A,)]
+
+    # 照合後のカーソルで次回は差分取得に戻る
+    bucket.calls.clear()
+    assert fetch_contents(api, backup_dir)[1] == 0
+    assert bucket.count('index') == 1
+
+
+def test_expired_cursor_falls_back_to_full_fetch(tmp_path, api, bucket, monkeypatch):
+    backup_dir = str(tmp_path)
+    bucket.put(NOTE_A, 'A\nfirst')
+    bucket.put(NOTE_B, 'B\nfirst')
+    fetch_contents(api, backup_dir)
+
+    bucket.put(NOTE_A, 'A\nedited')
+    bucket.put(NOTE_B, 'B\nedited')
+    bucket.min_cv = bucket.cv
+    monkeypatch.setattr(simplenote_remote, 'MAX_TARGETED_FETCHES', 1)
+    bucket.calls.clear()
+
+    assert fetch_contents(api, backup_dir) == ({NOTE_A: 'A\nedited', NOTE_B: 'B\nedited'}, None)
+    assert [args[0] for name, args in bucket.calls if name == 'index'] == [True, False, True]
+    assert bucket.count('get') == 0
+
+
+def test_non_http_error_is_not_hidden_by_fallback(tmp_path, api, bucket):
+    backup_dir = str(tmp_path)
+    bucket.put(NOTE_A, 'A\nfirst')
+    fetch_contents(api, backup_dir)
+    bucket.errors['index'] = [RuntimeError('parse error')]
+    bucket.calls.clear()
+
+    with pytest.raises(RuntimeError):
+        fetch_contents(api, backup_dir)
+    assert bucket.count('index') == 1
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(simplenote_remote, 'backoff_delay', lambda attempt: 0)
+
+
+def bulk_data(*note_ids):
+    return {note_id: {'content': f'{note_id[0]}\nbody'} for note_id in note_ids}
+
+
+def test_bulk_post_splits_batch_that_keeps_failing(api, bucket, no_backoff):
+    note_ids = ['%032x' % i for i in range(4)]
+    bucket.errors['bulk_post'] = [http_error(503)] * simplenote_remote.RETRY_ATTEMPTS
+
+    responses = api.note.bulk_post(bulk_data(*note_ids))
+
+    assert sorted(r['id'] for r in responses if 'error' not in r) == note_ids
+    assert sorted(bucket.notes) == note_ids
+    sizes = [len(args[0]) for name, args in bucket.calls if name == 'bulk_post']
+    assert sizes == [4] * simplenote_remote.RETRY_ATTEMPTS + [2, 2]
+
+
+def test_bulk_post_reports_single_failing_note(api, bucket, no_backoff):
+    bucket.errors['bulk_post'] = [http_error(503)] * simplenote_remote.RETRY_ATTEMPTS
+
+    responses = api.note.bulk_post(bulk_data(NOTE_A))
+
+    assert [r['id'] for r in responses] == [NOTE_A]
+    assert 'error' in responses[0]
+    assert bucket.notes == {}
+
+
+def test_bulk_post_does_not_split_rejected_batch(api, bucket, no_backoff):
+    bucket.errors['bulk_post'] = [http_error(400)]
+
+    with pytest.raises(urllib.error.HTTPError):
+        api.note.bulk_post(bulk_data(NOTE_A, NOTE_B))
+    assert bucket.count('bulk_post') == 1
+
+
+def test_bulk_post_resends_notes_with_transient_errors(api, bucket, monkeypatch, no_backoff):
+    post = bucket.bulk_post
+    flaky = [NOTE_B]
+
+    def bulk_post(data, wait=True):
+        # 1回目だけ NOTE_B を 503 にする（他のノートは保存される）
+        response = post({k: v for k, v in data.items() if k not in flaky}, wait)
+        response += [{'id': note_id, 'error': 503} for note_id in data if note_id in flaky]
+        flaky.clear()
+        return response
+
+    monkeypatch.setattr(bucket, 'bulk_post', bulk_post)
+
+    responses = api.note.bulk_post(bulk_data(NOTE_A, NOTE_B))
+
+    assert sorted(r['id'] for r in responses if 'error' not in r) == [NOTE_A, NOTE_B]
+    assert [args for name, args in bucket.calls if name == 'bulk_post'] == [([NOTE_A],), ([NOTE_B],)]